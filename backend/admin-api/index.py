@@ -4,22 +4,295 @@ Args: event с httpMethod, queryStringParameters (endpoint, action), context с
 Returns: HTTP response с данными или ошибкой
 '''
 
+import base64
+import csv
+import gzip
+import hashlib
+import hmac
+import io
 import json
 import os
-from typing import Dict, Any
+import re
+import select
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+import urllib.error
 import urllib.request
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
+# Реплика для тяжёлых чтений (дашборд, списки, выгрузки, аналитика); без неё всё идёт в основную БД
+REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '30'))
+REPLICA_CHECK_TTL = float(os.environ.get('REPLICA_CHECK_TTL', '5'))
+# Сколько реплика может не получать ничего от основной БД (даже keepalive), прежде чем считается отключённой;
+# должно быть больше wal_sender_timeout / 2, с которым основная шлёт keepalive в простое
+REPLICA_RECEIVER_TIMEOUT_SECONDS = float(os.environ.get('REPLICA_RECEIVER_TIMEOUT_SECONDS', '60'))
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get('REPLICA_CONNECT_TIMEOUT', '2'))
 ADMIN_SECRET_KEY = os.environ.get('ADMIN_SECRET_KEY', '')
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', '15'))
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', '1024'))
+# 'single' — весь дашборд одним SQL-запросом, 'legacy' — отдельные запросы по виджетам
+DASHBOARD_MODE = os.environ.get('DASHBOARD_MODE', 'single')
+LIST_DEFAULT_LIMIT = 50
+LIST_MAX_LIMIT = 200
+SEARCH_MAX_LIMIT = 50
+SEARCH_TRIGRAM_MIN_LENGTH = 3
+SLA_WINDOWS = {'1h': 1, '24h': 24, '7d': 24 * 7, '30d': 24 * 30, '90d': 24 * 90}
+BULK_MAX_ROWS = int(os.environ.get('BULK_MAX_ROWS', '20000'))
+BULK_PAGE_SIZE = 1000
+BULK_TRANSACTION_TYPES = ('admin_adjustment', 'refund')
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '2000'))
+EXPORT_MAX_ROWS = int(os.environ.get('EXPORT_MAX_ROWS', '50000'))
+EVENTS_CHANNEL = 'dashboard_events'
+EVENTS_WAIT_SECONDS = float(os.environ.get('EVENTS_WAIT_SECONDS', '25'))
+EVENTS_COALESCE_SECONDS = 0.5
+# EventSource не умеет передавать заголовки: поток событий открывается по короткоживущему токену в query
+EVENTS_TOKEN_TTL_SECONDS = int(os.environ.get('EVENTS_TOKEN_TTL_SECONDS', '600'))
+BROADCAST_RATE_PER_SECOND = float(os.environ.get('BROADCAST_RATE_PER_SECOND', '25'))
+BROADCAST_WORKERS = int(os.environ.get('BROADCAST_WORKERS', '8'))
+BROADCAST_BATCH_SIZE = int(os.environ.get('BROADCAST_BATCH_SIZE', '100'))
+BROADCAST_RUN_SECONDS = float(os.environ.get('BROADCAST_RUN_SECONDS', '240'))
+BROADCAST_LEASE_SECONDS = int(os.environ.get('BROADCAST_LEASE_SECONDS', '60'))
+BROADCAST_MAX_RETRIES = 3
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() in ('1', 'true', 'yes')
+
+def parse_strict_bool(value: Any) -> bool:
+    """Флаг из JSON-тела: true/false или строки 'true'/'false'/'1'/'0', остальное — ValueError."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('true', '1'):
+        return True
+    if isinstance(value, str) and value.lower() in ('false', '0'):
+        return False
+    raise ValueError(f"Expected boolean, got: {value!r}")
+
+BIGINT_MAX = 9223372036854775807
+INTEGER_MAX = 2147483647
+
+def parse_strict_int(value: Any) -> int:
+    """Целое из JSON или CSV: int (не bool) или строка вида -?цифры; 12.9, true и '1e3' — ValueError."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and re.fullmatch(r'-?[0-9]+', value.strip()):
+        return int(value.strip())
+    raise ValueError(f"Expected integer, got: {value!r}")
+
+def parse_bigint_id(value: str) -> Optional[int]:
+    """Неотрицательный id, который помещается в BIGINT; для всего остального — None."""
+    if not (value.isascii() and value.isdigit()) or len(value) > 19:
+        return None
+    number = int(value)
+    return number if number <= BIGINT_MAX else None
+
+def _timestamp(value: str) -> str:
+    """Дата или дата-время ISO 8601; проверяется здесь, чтобы ошибка была 400, а не падением ::timestamp в SQL."""
+    datetime.fromisoformat(value.strip())
+    return value.strip()
+
+def _one_of(*allowed: str):
+    def convert(value: str) -> str:
+        if value not in allowed:
+            raise ValueError(f"Unexpected value: {value}")
+        return value
+    return convert
+
+# Списки для админки: выборка, ключ сортировки (created_at, id) и разрешённые фильтры
+LIST_ENDPOINTS: Dict[str, Dict[str, Any]] = {
+    'users': {
+        'select': """
+            SELECT u.user_id, u.username, u.first_name, u.balance, u.created_at, u.last_activity, u.is_blocked
+            FROM t_p62125649_ai_video_bot.users u
+        """,
+        'created_column': 'u.created_at',
+        'id_column': 'u.user_id',
+        'id_key': 'user_id',
+        'filters': {
+            'is_blocked': ('u.is_blocked = %s', _parse_bool),
+            'date_from': ('u.created_at >= %s::timestamp', _timestamp),
+            'date_to': ('u.created_at < %s::timestamp', _timestamp)
+        }
+    },
+    'orders': {
+        'select': """
+            SELECT o.order_id, o.user_id, u.username, o.order_type, o.status, o.cost, o.duration, o.quality,
+                   o.created_at, o.completed_at, o.error_message
+            FROM t_p62125649_ai_video_bot.orders o
+            LEFT JOIN t_p62125649_ai_video_bot.users u ON o.user_id = u.user_id
+        """,
+        'created_column': 'o.created_at',
+        'id_column': 'o.order_id',
+        'id_key': 'order_id',
+        'filters': {
+            'status': ('o.status = %s', _one_of('pending', 'processing', 'completed', 'failed', 'cancelled')),
+            'order_type': ('o.order_type = %s', _one_of('preview', 'image-to-video', 'text-to-video', 'storyboard')),
+            'user_id': ('o.user_id = %s', int),
+            'date_from': ('o.created_at >= %s::timestamp', _timestamp),
+            'date_to': ('o.created_at < %s::timestamp', _timestamp)
+        }
+    },
+    'transactions': {
+        'select': """
+            SELECT t.transaction_id, t.user_id, t.amount, t.type, t.description, t.order_id,
+                   t.external_payment_id, t.payment_method, t.created_at
+            FROM t_p62125649_ai_video_bot.transactions t
+        """,
+        'created_column': 't.created_at',
+        'id_column': 't.transaction_id',
+        'id_key': 'transaction_id',
+        'filters': {
+            'type': ('t.type = %s', _one_of('welcome_bonus', 'purchase', 'preview', 'video', 'refund', 'admin_adjustment')),
+            'user_id': ('t.user_id = %s', int),
+            'date_from': ('t.created_at >= %s::timestamp', _timestamp),
+            'date_to': ('t.created_at < %s::timestamp', _timestamp)
+        }
+    }
+}
+
+# Кэш дашборда живёт между вызовами в тёплом инстансе функции
+_dashboard_cache: Dict[str, Any] = {'body': None, 'gzip_body': None, 'etag': None, 'expires_at': 0.0}
+_dashboard_lock = threading.Lock()
+
+# Выгрузки для бухгалтерии: строки идут по возрастанию id, поэтому after_id — курсор для докачки
+EXPORT_TABLES: Dict[str, Dict[str, Any]] = {
+    'orders': {
+        'id_column': 'order_id',
+        'columns': ['order_id', 'user_id', 'order_type', 'status', 'prompt', 'duration', 'quality', 'cost',
+                    'task_id', 'external_job_id', 'created_at', 'completed_at', 'error_message']
+    },
+    'transactions': {
+        'id_column': 'transaction_id',
+        'columns': ['transaction_id', 'user_id', 'amount', 'type', 'description', 'order_id',
+                    'external_payment_id', 'payment_method', 'created_at']
+    },
+    'payment_logs': {
+        'id_column': 'log_id',
+        'columns': ['log_id', 'user_id', 'payment_method', 'payment_status', 'amount', 'currency',
+                    'external_payment_id', 'error_message', 'created_at'],
+        'optional_columns': ['telegram_update'],
+        # В telegram_update лежат только выбранные поля, полный update сжат в отдельной колонке
+        'compressed_columns': {'telegram_update': 'telegram_update_zlib'}
+    }
+}
 
 def get_db_connection():
     return psycopg2.connect(DATABASE_URL)
 
-def check_admin_auth(headers: Dict) -> bool:
+# Результат последней проверки реплики живёт в тёплом инстансе, чтобы не мерить отставание на каждый запрос
+_replica_state = {'healthy': False, 'checked_at': float('-inf'), 'lag': None}
+
+def replica_lag_seconds(conn) -> float:
+    """
+    Отставание реплики. Если всё полученное WAL применено и приёмник WAL на связи, реплика актуальна даже
+    при простое основной БД. Без приёмника (или без сообщений от основной дольше REPLICA_RECEIVER_TIMEOUT_SECONDS)
+    «всё применено» ничего не значит — отставание считается бесконечным, и чтения уходят в основную БД.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT pg_is_in_recovery() AS in_recovery,
+                   pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() AS caught_up,
+                   EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) AS replay_age,
+                   r.pid, r.status,
+                   EXTRACT(EPOCH FROM now() - r.last_msg_receipt_time) AS receipt_age
+            FROM (SELECT 1) AS one
+            LEFT JOIN pg_stat_wal_receiver r ON TRUE
+        """)
+        in_recovery, caught_up, replay_age, pid, status, receipt_age = cur.fetchone()
+    
+    if not in_recovery:
+        return 0.0
+    if pid is not None and status is None:
+        # Без pg_read_all_stats видна только строка с pid, состояние приёмника скрыто
+        print("[ERROR] Replica WAL receiver status is hidden, grant pg_read_all_stats to the replica user")
+        return float('inf')
+    if status != 'streaming' or receipt_age is None or float(receipt_age) > REPLICA_RECEIVER_TIMEOUT_SECONDS:
+        print(f"[INFO] Replica WAL receiver is not streaming (status={status}, last message {receipt_age}s ago)")
+        return float('inf')
+    if caught_up:
+        return 0.0
+    return float(replay_age or 0)
+
+def get_read_connection():
+    """
+    Соединение для чтения аналитики: реплика, если она доступна и отстаёт не больше REPLICA_MAX_LAG_SECONDS,
+    иначе основная БД. Изменения данных через это соединение не делаются.
+    """
+    if not REPLICA_DATABASE_URL:
+        return get_db_connection()
+    
+    state = _replica_state
+    fresh = time.monotonic() - state['checked_at'] < REPLICA_CHECK_TTL
+    if fresh and not state['healthy']:
+        return get_db_connection()
+    
+    try:
+        conn = psycopg2.connect(REPLICA_DATABASE_URL, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+    except psycopg2.Error as e:
+        print(f"[ERROR] Replica unavailable, using primary: {str(e)}")
+        _replica_state.update({'healthy': False, 'checked_at': time.monotonic(), 'lag': None})
+        return get_db_connection()
+    
+    if fresh:
+        return conn
+    
+    try:
+        lag = replica_lag_seconds(conn)
+        conn.rollback()
+    except psycopg2.Error as e:
+        print(f"[ERROR] Replica lag check failed, using primary: {str(e)}")
+        conn.close()
+        _replica_state.update({'healthy': False, 'checked_at': time.monotonic(), 'lag': None})
+        return get_db_connection()
+    
+    healthy = lag <= REPLICA_MAX_LAG_SECONDS
+    _replica_state.update({'healthy': healthy, 'checked_at': time.monotonic(), 'lag': lag})
+    if not healthy:
+        print(f"[INFO] Replica lag {lag:.1f}s exceeds {REPLICA_MAX_LAG_SECONDS}s, using primary")
+        conn.close()
+        return get_db_connection()
+    
+    return conn
+
+def get_header(headers: Dict, name: str) -> str:
+    for key, value in (headers or {}).items():
+        if key.lower() == name.lower():
+            return value or ''
+    return ''
+
+def sign_scoped_token(payload: str) -> str:
+    return hmac.new(ADMIN_SECRET_KEY.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def issue_events_token() -> Dict[str, Any]:
+    """Токен только для endpoint=events: 'events.<expires_at>.<hmac>', выдаётся по X-Admin-Key."""
+    expires_at = int(time.time()) + EVENTS_TOKEN_TTL_SECONDS
+    payload = f'events.{expires_at}'
+    return {'token': f'{payload}.{sign_scoped_token(payload)}', 'expires_at': expires_at}
+
+def verify_events_token(token: str) -> bool:
+    scope, _, rest = token.partition('.')
+    expires_at, _, signature = rest.partition('.')
+    if scope != 'events' or not expires_at.isdigit() or not ADMIN_SECRET_KEY:
+        return False
+    if int(expires_at) < time.time():
+        return False
+    return hmac.compare_digest(signature, sign_scoped_token(f'{scope}.{expires_at}'))
+
+def check_admin_auth(headers: Dict, params: Optional[Dict] = None) -> bool:
     auth_token = headers.get('X-Admin-Key', headers.get('x-admin-key', ''))
+    if auth_token:
+        return auth_token == ADMIN_SECRET_KEY
+    # Секретный ключ в URL не принимается: он оседает в истории браузера и логах прокси
+    if params and params.get('endpoint') == 'events':
+        return verify_events_token(params.get('token', ''))
     return auth_token == ADMIN_SECRET_KEY
 
 def get_dashboard_stats(conn) -> Dict[str, Any]:
@@ -124,6 +397,527 @@ def get_daily_revenue(conn, days: int = 7):
         """, (days,))
         return [dict(r) for r in cur.fetchall()]
 
+def search_users(conn, query: str, limit: int = 20) -> Dict[str, Any]:
+    """
+    Поиск по user_id, username и first_name вместе с балансом и статистикой заказов.
+    Запросы от SEARCH_TRIGRAM_MIN_LENGTH символов ищут подстроку через триграммный индекс,
+    более короткие — только префикс через text_pattern_ops.
+    """
+    term = query.strip().lstrip('@').lower()
+    if not term:
+        return {'items': []}
+    
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    pattern = f'%{escaped}%' if len(term) >= SEARCH_TRIGRAM_MIN_LENGTH else f'{escaped}%'
+    # Длинные числа и числа вне BIGINT ищутся только как текст
+    user_id = parse_bigint_id(term)
+    limit = min(max(limit, 1), SEARCH_MAX_LIMIT)
+    
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            WITH matched AS (
+                SELECT user_id, username, first_name, balance, is_blocked, created_at, last_activity
+                FROM t_p62125649_ai_video_bot.users
+                WHERE user_id = %(user_id)s
+                   OR lower(username) LIKE %(pattern)s
+                   OR lower(first_name) LIKE %(pattern)s
+                ORDER BY (user_id = %(user_id)s) DESC NULLS LAST,
+                         (lower(username) = %(term)s) DESC NULLS LAST,
+                         (lower(username) LIKE %(prefix)s) DESC NULLS LAST,
+                         last_activity DESC NULLS LAST
+                LIMIT %(limit)s
+            )
+            SELECT m.*, o.orders_count, o.completed_orders, o.failed_orders, o.last_order_at
+            FROM matched m
+            LEFT JOIN LATERAL (
+                SELECT COUNT(*) AS orders_count,
+                       COUNT(*) FILTER (WHERE status = 'completed') AS completed_orders,
+                       COUNT(*) FILTER (WHERE status = 'failed') AS failed_orders,
+                       MAX(created_at) AS last_order_at
+                FROM t_p62125649_ai_video_bot.orders
+                WHERE user_id = m.user_id
+            ) o ON TRUE
+        """, {
+            'user_id': user_id,
+            'pattern': pattern,
+            'term': term,
+            'prefix': f'{escaped}%',
+            'limit': limit
+        })
+        return {'items': [dict(r) for r in cur.fetchall()]}
+
+def get_sla_stats(conn, window: str) -> Dict[str, Any]:
+    """
+    Время генерации (completed_at - created_at) по типу, длительности и качеству заказа:
+    p50/p90/p99 считаются ordered-set агрегатом за один проход по диапазону idx_orders_created_at,
+    там же доли ошибок и таймаутов. Возвращённые кредиты — сумма проводок refund по order_id: возврат
+    идёт позже заказа, поэтому проводки берутся с того же начала окна по idx_transactions_type_created_at_transaction_id.
+    """
+    if window not in SLA_WINDOWS:
+        return {'error': f"Unknown window, expected one of: {', '.join(SLA_WINDOWS)}"}
+    
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT
+                order_type, duration, quality,
+                GROUPING(order_type, duration, quality) = 7 AS is_total,
+                COUNT(*) AS total_count,
+                COUNT(*) FILTER (WHERE status = 'completed') AS completed_count,
+                COUNT(*) FILTER (WHERE status = 'failed') AS failed_count,
+                COUNT(*) FILTER (WHERE status = 'failed'
+                                   AND (error_message = 'Таймаут' OR error_message LIKE 'Timeout%%')) AS timeout_count,
+                COUNT(*) FILTER (WHERE status = 'processing') AS processing_count,
+                COALESCE(SUM(r.refunded), 0) AS refunded_credits,
+                percentile_cont(ARRAY[0.5, 0.9, 0.99]) WITHIN GROUP (
+                    ORDER BY EXTRACT(EPOCH FROM completed_at - o.created_at)
+                ) FILTER (WHERE status = 'completed' AND completed_at IS NOT NULL) AS latency
+            FROM t_p62125649_ai_video_bot.orders o
+            LEFT JOIN (
+                SELECT order_id, SUM(amount) AS refunded
+                FROM t_p62125649_ai_video_bot.transactions
+                WHERE type = 'refund' AND order_id IS NOT NULL
+                  AND created_at >= NOW() - %(hours)s * INTERVAL '1 hour'
+                GROUP BY order_id
+            ) r ON r.order_id = o.order_id
+            WHERE o.created_at >= NOW() - %(hours)s * INTERVAL '1 hour'
+            GROUP BY GROUPING SETS ((order_type, duration, quality), ())
+            ORDER BY is_total, order_type, duration, quality
+        """, {'hours': SLA_WINDOWS[window]})
+        rows = cur.fetchall()
+    
+    groups = []
+    total = None
+    for row in rows:
+        item = dict(row)
+        latency = item.pop('latency') or [None, None, None]
+        item['p50_seconds'], item['p90_seconds'], item['p99_seconds'] = latency
+        finished = item['completed_count'] + item['failed_count']
+        item['failure_rate'] = round(item['failed_count'] / finished, 4) if finished else None
+        item['timeout_rate'] = round(item['timeout_count'] / finished, 4) if finished else None
+        
+        if item.pop('is_total'):
+            total = item
+        else:
+            groups.append(item)
+    
+    return {'window': window, 'groups': groups, 'total': total}
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    created_at, row_id = json.loads(raw)
+    return created_at, int(row_id)
+
+def list_rows(conn, name: str, params: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Постраничный список с keyset-пагинацией по (created_at, id) от новых к старым.
+    Курсор следующей страницы — позиция последней строки, поэтому стоимость запроса
+    не зависит от номера страницы (в отличие от OFFSET).
+    """
+    config = LIST_ENDPOINTS[name]
+    conditions = []
+    values = []
+    
+    try:
+        for param, (condition, convert) in config['filters'].items():
+            if params.get(param) not in (None, ''):
+                conditions.append(condition)
+                values.append(convert(params[param]))
+        
+        limit = min(max(int(params.get('limit', LIST_DEFAULT_LIMIT)), 1), LIST_MAX_LIMIT)
+        
+        if params.get('cursor'):
+            cursor_created_at, cursor_id = decode_cursor(params['cursor'])
+            conditions.append(f"({config['created_column']}, {config['id_column']}) < (%s::timestamp, %s)")
+            values.extend([cursor_created_at, cursor_id])
+    except (ValueError, TypeError):
+        return {'error': 'Invalid filter or cursor'}
+    
+    query = config['select']
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += f" ORDER BY {config['created_column']} DESC, {config['id_column']} DESC LIMIT %s"
+    values.append(limit + 1)
+    
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, values)
+        rows = [dict(r) for r in cur.fetchall()]
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last['created_at'], last[config['id_key']])
+    
+    return {'items': rows, 'next_cursor': next_cursor}
+
+def export_columns(table: str, include_update: bool) -> List[str]:
+    config = EXPORT_TABLES[table]
+    columns = list(config['columns'])
+    if include_update:
+        columns.extend(config.get('optional_columns', []))
+    return columns
+
+def iter_export_rows(conn, table: str, columns: List[str], date_from: Optional[str], date_to: Optional[str],
+                     after_id: int, max_rows: Optional[int] = None) -> Iterator[tuple]:
+    """
+    Читать строки серверным (именованным) курсором пачками по EXPORT_BATCH_SIZE,
+    чтобы в памяти не было больше одной пачки независимо от размера таблицы.
+    """
+    id_column = EXPORT_TABLES[table]['id_column']
+    conditions = [f'{id_column} > %s']
+    values: List[Any] = [after_id]
+    
+    if date_from:
+        conditions.append('created_at >= %s::timestamp')
+        values.append(date_from)
+    if date_to:
+        conditions.append('created_at < %s::timestamp')
+        values.append(date_to)
+    
+    compressed = EXPORT_TABLES[table].get('compressed_columns', {})
+    packed = [(columns.index(column), blob_column) for column, blob_column in compressed.items() if column in columns]
+    select_columns = columns + [blob_column for _, blob_column in packed]
+    
+    query = f"""
+        SELECT {', '.join(select_columns)}
+        FROM t_p62125649_ai_video_bot.{table}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {id_column}
+    """
+    if max_rows is not None:
+        query += ' LIMIT %s'
+        values.append(max_rows)
+    
+    with conn.cursor(name=f'export_{table}') as cur:
+        cur.itersize = EXPORT_BATCH_SIZE
+        cur.execute(query, values)
+        for row in cur:
+            if packed:
+                row = unpack_export_row(row, len(columns), packed)
+            yield row
+
+def unpack_export_row(row: tuple, width: int, packed: List[tuple]) -> tuple:
+    values = list(row[:width])
+    for offset, (index, _) in enumerate(packed):
+        blob = row[width + offset]
+        if blob is not None:
+            values[index] = json.loads(zlib.decompress(bytes(blob)).decode('utf-8'))
+    return tuple(values)
+
+def _export_value(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+def encode_csv(columns: List[str], rows: Iterator[tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([_export_value(v) for v in row])
+        yield buffer.getvalue()
+
+def encode_ndjson(columns: List[str], rows: Iterator[tuple]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False) + '\n'
+
+def export_response(params: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Выгрузка через HTTP отдаёт не больше EXPORT_MAX_ROWS строк за запрос.
+    Если строки ещё есть, X-Next-After-Id содержит курсор для следующего запроса.
+    """
+    table = params.get('table', '')
+    export_format = params.get('format', 'csv')
+    
+    if table not in EXPORT_TABLES or export_format not in ('csv', 'ndjson'):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Unknown table or format'})
+        }
+    
+    after_id = parse_bigint_id(params.get('after_id') or '0')
+    if after_id is None:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'after_id must be a non-negative integer'})
+        }
+    
+    try:
+        date_from = _timestamp(params['date_from']) if params.get('date_from') else None
+        date_to = _timestamp(params['date_to']) if params.get('date_to') else None
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'date_from and date_to must be ISO 8601 dates'})
+        }
+    
+    columns = export_columns(table, _parse_bool(params.get('include_update', 'false')))
+    id_index = columns.index(EXPORT_TABLES[table]['id_column'])
+    last_id = {'value': after_id, 'count': 0}
+    
+    def tracked(rows: Iterator[tuple]) -> Iterator[tuple]:
+        for row in rows:
+            last_id['value'] = row[id_index]
+            last_id['count'] += 1
+            yield row
+    
+    conn = get_read_connection()
+    try:
+        rows = tracked(iter_export_rows(conn, table, columns, date_from, date_to,
+                                        last_id['value'], EXPORT_MAX_ROWS))
+        encode = encode_csv if export_format == 'csv' else encode_ndjson
+        body = ''.join(encode(columns, rows))
+    finally:
+        conn.close()
+    
+    response_headers = {
+        'Content-Type': 'text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson',
+        'Content-Disposition': f'attachment; filename="{table}.{export_format}"',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'X-Next-After-Id'
+    }
+    if last_id['count'] >= EXPORT_MAX_ROWS:
+        response_headers['X-Next-After-Id'] = str(last_id['value'])
+    
+    return {
+        'statusCode': 200,
+        'headers': response_headers,
+        'isBase64Encoded': False,
+        'body': body
+    }
+
+def events_response() -> Dict[str, Any]:
+    """
+    Server-sent events с изменениями для дашборда (LISTEN dashboard_events, см. триггеры V0009).
+    Функция не может держать соединение бесконечно, поэтому ответ закрывается после первой
+    пачки событий или через EVENTS_WAIT_SECONDS, а EventSource сам переподключается через retry.
+    Пока событий нет, запросов к БД не выполняется.
+    """
+    conn = get_db_connection()
+    conn.autocommit = True
+    events = []
+    
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN {EVENTS_CHANNEL}')
+        
+        deadline = time.monotonic() + EVENTS_WAIT_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if select.select([conn], [], [], remaining)[0]:
+                conn.poll()
+                while conn.notifies:
+                    events.append(conn.notifies.pop(0).payload)
+                if events:
+                    deadline = min(deadline, time.monotonic() + EVENTS_COALESCE_SECONDS)
+    finally:
+        conn.close()
+    
+    chunks = ['retry: 1000\n\n']
+    for payload in events:
+        event_type = json.loads(payload).get('type', 'message')
+        chunks.append(f'event: {event_type}\ndata: {payload}\n\n')
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'isBase64Encoded': False,
+        'body': ''.join(chunks)
+    }
+
+def build_dashboard(conn) -> Dict[str, Any]:
+    return {
+        'stats': get_dashboard_stats(conn),
+        'recent_users': get_recent_users(conn, 10),
+        'recent_orders': get_recent_orders(conn, 20),
+        'order_stats': get_order_stats(conn),
+        'daily_revenue': get_daily_revenue(conn, 7),
+        'model_stats': get_model_stats(conn)
+    }
+
+DASHBOARD_JSON_QUERY = """
+    WITH offsets AS (
+        SELECT
+            COALESCE(MAX(metric_value) FILTER (WHERE metric_name = 'total_revenue_offset'), 0) AS revenue_offset,
+            COALESCE(MAX(metric_value) FILTER (WHERE metric_name = 'total_orders_offset'), 0) AS orders_offset,
+            COALESCE(MAX(metric_value) FILTER (WHERE metric_name = 'errors_count_offset'), 0) AS errors_offset
+        FROM t_p62125649_ai_video_bot.stats_cache
+    ),
+    user_counts AS (
+        SELECT COUNT(*) AS total_users,
+               COUNT(*) FILTER (WHERE last_activity > NOW() - INTERVAL '24 hours') AS active_users_24h
+        FROM t_p62125649_ai_video_bot.users
+    ),
+    order_counts AS (
+        SELECT COUNT(*) AS total_orders,
+               COUNT(*) FILTER (WHERE status = 'processing') AS processing_orders
+        FROM t_p62125649_ai_video_bot.orders
+    ),
+    ledger AS (
+        SELECT COALESCE(SUM(amount) FILTER (WHERE type = 'purchase'), 0) AS revenue,
+               COALESCE(SUM(-amount) FILTER (WHERE type IN ('preview', 'video')), 0) AS credits_spent
+        FROM t_p62125649_ai_video_bot.transactions
+    ),
+    error_counts AS (
+        SELECT COUNT(*) AS total_errors FROM t_p62125649_ai_video_bot.error_logs
+    ),
+    recent_users AS (
+        SELECT user_id, username, first_name, balance, created_at, last_activity, is_blocked
+        FROM t_p62125649_ai_video_bot.users
+        ORDER BY created_at DESC
+        LIMIT 10
+    ),
+    recent_orders AS (
+        SELECT o.order_id, o.user_id, u.username, o.order_type, o.status, o.cost, o.created_at, o.completed_at
+        FROM t_p62125649_ai_video_bot.orders o
+        LEFT JOIN t_p62125649_ai_video_bot.users u ON o.user_id = u.user_id
+        ORDER BY o.created_at DESC
+        LIMIT 20
+    ),
+    order_stats AS (
+        SELECT order_type, status, COUNT(*) AS count
+        FROM t_p62125649_ai_video_bot.orders
+        GROUP BY order_type, status
+    ),
+    daily_revenue AS (
+        SELECT DATE(created_at) AS date, SUM(amount) AS revenue, COUNT(*) AS transaction_count
+        FROM t_p62125649_ai_video_bot.transactions
+        WHERE type = 'purchase' AND created_at > NOW() - INTERVAL '7 days'
+        GROUP BY DATE(created_at)
+    ),
+    model_stats AS (
+        SELECT order_type,
+               COUNT(*) AS total_count,
+               COUNT(*) FILTER (WHERE status = 'completed') AS completed_count,
+               COUNT(*) FILTER (WHERE status = 'failed') AS failed_count,
+               SUM(cost) AS total_revenue
+        FROM t_p62125649_ai_video_bot.orders
+        GROUP BY order_type
+    )
+    SELECT json_build_object(
+        'stats', (
+            SELECT json_build_object(
+                'total_users', uc.total_users,
+                'active_users_24h', uc.active_users_24h,
+                'total_orders', GREATEST(0, oc.total_orders - off.orders_offset)::bigint,
+                'processing_orders', oc.processing_orders,
+                'total_revenue', GREATEST(0, l.revenue - off.revenue_offset)::bigint,
+                'credits_spent', l.credits_spent::bigint,
+                'total_errors', GREATEST(0, ec.total_errors - off.errors_offset)::bigint
+            )
+            FROM user_counts uc, order_counts oc, ledger l, error_counts ec, offsets off
+        ),
+        'recent_users', COALESCE((SELECT json_agg(r ORDER BY r.created_at DESC) FROM recent_users r), '[]'::json),
+        'recent_orders', COALESCE((SELECT json_agg(r ORDER BY r.created_at DESC) FROM recent_orders r), '[]'::json),
+        'order_stats', COALESCE((SELECT json_agg(r ORDER BY r.order_type, r.status) FROM order_stats r), '[]'::json),
+        'daily_revenue', COALESCE((SELECT json_agg(r ORDER BY r.date DESC) FROM daily_revenue r), '[]'::json),
+        'model_stats', COALESCE((SELECT json_agg(r ORDER BY r.total_count DESC) FROM model_stats r), '[]'::json)
+    )::text
+"""
+
+def build_dashboard_json(conn) -> str:
+    """Весь дашборд одним запросом: JSON собирается в Postgres и возвращается готовым текстом."""
+    with conn.cursor() as cur:
+        cur.execute(DASHBOARD_JSON_QUERY)
+        return cur.fetchone()[0]
+
+def render_dashboard(conn, mode: str) -> str:
+    if mode == 'single':
+        return build_dashboard_json(conn)
+    return json.dumps(build_dashboard(conn), default=str)
+
+def get_cached_dashboard() -> Dict[str, Any]:
+    """
+    Вернуть закэшированный дашборд, пересчитав его не чаще раза в DASHBOARD_CACHE_TTL секунд.
+    Пересчёт идёт под блокировкой: параллельные запросы ждут один пересчёт вместо своих запросов в БД.
+    """
+    global _dashboard_cache
+    cached = _dashboard_cache
+    if cached['body'] is not None and cached['expires_at'] > time.monotonic():
+        return cached
+    
+    with _dashboard_lock:
+        cached = _dashboard_cache
+        if cached['body'] is not None and cached['expires_at'] > time.monotonic():
+            return cached
+        
+        conn = get_read_connection()
+        try:
+            body = render_dashboard(conn, DASHBOARD_MODE)
+        finally:
+            conn.close()
+        
+        raw = body.encode('utf-8')
+        refreshed = {
+            'body': body,
+            'gzip_body': base64.b64encode(gzip.compress(raw)).decode('ascii') if len(raw) >= GZIP_MIN_BYTES else None,
+            'etag': '"' + hashlib.sha1(raw).hexdigest() + '"',
+            'expires_at': time.monotonic() + DASHBOARD_CACHE_TTL
+        }
+        _dashboard_cache = refreshed
+        return refreshed
+
+def invalidate_dashboard_cache():
+    global _dashboard_cache
+    with _dashboard_lock:
+        _dashboard_cache = {'body': None, 'gzip_body': None, 'etag': None, 'expires_at': 0.0}
+
+def dashboard_response(headers: Dict) -> Dict[str, Any]:
+    cached = get_cached_dashboard()
+    response_headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag',
+        'Cache-Control': 'private, no-cache',
+        'ETag': cached['etag'],
+        'Vary': 'Accept-Encoding'
+    }
+    
+    if_none_match = get_header(headers, 'If-None-Match')
+    if if_none_match and cached['etag'] in [tag.strip() for tag in if_none_match.split(',')]:
+        return {
+            'statusCode': 304,
+            'headers': response_headers,
+            'isBase64Encoded': False,
+            'body': ''
+        }
+    
+    if cached['gzip_body'] and 'gzip' in get_header(headers, 'Accept-Encoding'):
+        response_headers['Content-Encoding'] = 'gzip'
+        return {
+            'statusCode': 200,
+            'headers': response_headers,
+            'isBase64Encoded': True,
+            'body': cached['gzip_body']
+        }
+    
+    return {
+        'statusCode': 200,
+        'headers': response_headers,
+        'isBase64Encoded': False,
+        'body': cached['body']
+    }
+
 def update_user_balance(conn, user_id: int, amount: int, admin_username: str, reason: str) -> Dict[str, Any]:
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
         cur.execute("SELECT balance FROM t_p62125649_ai_video_bot.users WHERE user_id = %s", (user_id,))
@@ -155,6 +949,360 @@ def update_user_balance(conn, user_id: int, amount: int, admin_username: str, re
         
         return {'success': True, 'old_balance': old_balance, 'new_balance': new_balance}
 
+def parse_bulk_items(body_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Строки операции из списка items или из CSV-текста (user_id,amount,reason[,type])."""
+    if body_data.get('csv'):
+        raw_items = []
+        rows = [row for row in csv.reader(io.StringIO(body_data['csv'])) if row and row[0].strip()]
+        if rows and not rows[0][0].strip().isdigit():
+            rows = rows[1:]
+        for row in rows:
+            raw_items.append({
+                'user_id': row[0],
+                'amount': row[1] if len(row) > 1 else None,
+                'reason': row[2] if len(row) > 2 else None,
+                'type': row[3] if len(row) > 3 else None
+            })
+    else:
+        raw_items = body_data.get('items') or []
+    
+    default_reason = body_data.get('reason', 'Bulk adjustment')
+    items = []
+    for index, raw in enumerate(raw_items):
+        if not isinstance(raw, dict):
+            items.append({'row': index, 'user_id': None, 'amount': None, 'status': 'invalid'})
+            continue
+        
+        item = {'row': index, 'user_id': raw.get('user_id'), 'amount': raw.get('amount')}
+        try:
+            # Деньги: дробные, логические и не помещающиеся в колонки значения не округляются, а отклоняются
+            user_id = parse_bigint_id(str(parse_strict_int(raw['user_id'])))
+            amount = parse_strict_int(raw['amount'])
+            if user_id is None or abs(amount) > INTEGER_MAX:
+                raise ValueError
+            item['user_id'], item['amount'] = user_id, amount
+            item['reason'] = str(raw.get('reason') or default_reason).strip()
+            item['type'] = str(raw.get('type') or 'admin_adjustment').strip()
+            if item['type'] not in BULK_TRANSACTION_TYPES or item['amount'] == 0:
+                raise ValueError
+        except (KeyError, TypeError, ValueError):
+            item['status'] = 'invalid'
+        items.append(item)
+    return items
+
+def bulk_update_balance(conn, items: List[Dict[str, Any]], admin_username: str, dry_run: bool) -> Dict[str, Any]:
+    """
+    Массовое начисление/списание в одной транзакции.
+    Пользователи блокируются одним SELECT ... FOR UPDATE, остатки считаются по порядку строк,
+    а баланс, transactions и admin_actions пишутся пакетными запросами.
+    dry_run возвращает те же результаты по строкам, но откатывает транзакцию.
+    """
+    if len(items) > BULK_MAX_ROWS:
+        return {'success': False, 'error': f'Too many rows (max {BULK_MAX_ROWS})'}
+    
+    valid_items = [item for item in items if 'status' not in item]
+    user_ids = sorted({item['user_id'] for item in valid_items})
+    
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT user_id, balance FROM t_p62125649_ai_video_bot.users
+            WHERE user_id = ANY(%s)
+            ORDER BY user_id
+            FOR UPDATE
+        """, (user_ids,))
+        balances = {user_id: balance for user_id, balance in cur.fetchall()}
+        
+        applied = []
+        for item in valid_items:
+            if item['user_id'] not in balances:
+                item['status'] = 'user_not_found'
+                continue
+            
+            old_balance = balances[item['user_id']]
+            new_balance = old_balance + item['amount']
+            if new_balance < 0:
+                item['status'] = 'insufficient_balance'
+                item['balance'] = old_balance
+                continue
+            
+            balances[item['user_id']] = new_balance
+            item['status'] = 'applied'
+            item['old_balance'] = old_balance
+            item['new_balance'] = new_balance
+            applied.append(item)
+        
+        if applied and not dry_run:
+            final_balances = {item['user_id']: item['new_balance'] for item in applied}
+            execute_values(cur, """
+                UPDATE t_p62125649_ai_video_bot.users AS u
+                SET balance = v.balance
+                FROM (VALUES %s) AS v(user_id, balance)
+                WHERE u.user_id = v.user_id
+            """, list(final_balances.items()), page_size=BULK_PAGE_SIZE)
+            
+            execute_values(cur, """
+                INSERT INTO t_p62125649_ai_video_bot.transactions (user_id, amount, type, description)
+                VALUES %s
+            """, [(item['user_id'], item['amount'], item['type'], item['reason']) for item in applied], page_size=BULK_PAGE_SIZE)
+            
+            execute_values(cur, """
+                INSERT INTO t_p62125649_ai_video_bot.admin_actions (admin_username, action_type, target_user_id, details)
+                VALUES %s
+            """, [(admin_username, 'balance_change', item['user_id'], json.dumps({
+                'old_balance': item['old_balance'],
+                'new_balance': item['new_balance'],
+                'amount': item['amount'],
+                'reason': item['reason'],
+                'type': item['type'],
+                'bulk': True
+            })) for item in applied], page_size=BULK_PAGE_SIZE)
+    
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    
+    return {
+        'success': True,
+        'dry_run': dry_run,
+        'applied': len(applied),
+        'failed': len(items) - len(applied),
+        'results': items
+    }
+
+class RateLimiter:
+    """Общий для всех воркеров бюджет: не больше rate отправок в секунду, с паузой по 429."""
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+    
+    def pause(self, seconds: float):
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+def send_broadcast_message(user_id: int, text: str, limiter: RateLimiter) -> str:
+    """Отправить сообщение рассылки. Возвращает 'delivered', 'blocked' или 'failed'."""
+    url = f'{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/sendMessage'
+    data = json.dumps({'chat_id': user_id, 'text': text, 'parse_mode': 'HTML'}).encode('utf-8')
+    
+    for attempt in range(BROADCAST_MAX_RETRIES):
+        limiter.acquire()
+        req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=10) as response:
+                response.read()
+            return 'delivered'
+        except urllib.error.HTTPError as e:
+            if e.code == 403:
+                return 'blocked'
+            if e.code == 429:
+                try:
+                    retry_after = json.loads(e.read().decode('utf-8')).get('parameters', {}).get('retry_after', 1)
+                except ValueError:
+                    retry_after = 1
+                limiter.pause(float(retry_after))
+                continue
+            print(f"[ERROR] Broadcast to {user_id} failed: {e.code}")
+            return 'failed'
+        except Exception as e:
+            print(f"[ERROR] Broadcast to {user_id} failed: {str(e)}")
+            return 'failed'
+    
+    return 'failed'
+
+def broadcast_audience_filter(segment: Dict[str, Any]):
+    conditions = ['is_blocked = FALSE', 'bot_blocked_at IS NULL']
+    values: List[Any] = []
+    
+    if segment.get('active_days'):
+        conditions.append("last_activity > NOW() - %s * INTERVAL '1 day'")
+        values.append(int(segment['active_days']))
+    if segment.get('min_balance') is not None:
+        conditions.append('balance >= %s')
+        values.append(int(segment['min_balance']))
+    if segment.get('has_orders') is not None:
+        exists = 'EXISTS' if segment['has_orders'] else 'NOT EXISTS'
+        conditions.append(f'{exists} (SELECT 1 FROM t_p62125649_ai_video_bot.orders o WHERE o.user_id = users.user_id)')
+    
+    return ' AND '.join(conditions), values
+
+def create_broadcast(conn, text: str, segment: Dict[str, Any], admin_username: str) -> Dict[str, Any]:
+    if not text.strip():
+        return {'success': False, 'error': 'Empty text'}
+    
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO t_p62125649_ai_video_bot.broadcasts (text, segment, created_by)
+            VALUES (%s, %s, %s)
+            RETURNING broadcast_id
+        """, (text, json.dumps(segment), admin_username))
+        broadcast_id = cur.fetchone()[0]
+        
+        cur.execute("""
+            INSERT INTO t_p62125649_ai_video_bot.admin_actions (admin_username, action_type, details)
+            VALUES (%s, 'broadcast_create', %s)
+        """, (admin_username, json.dumps({'broadcast_id': broadcast_id, 'segment': segment})))
+        conn.commit()
+    
+    return {'success': True, 'broadcast_id': broadcast_id}
+
+def run_broadcast(conn, broadcast_id: int) -> Dict[str, Any]:
+    """
+    Разослать очередную порцию рассылки за BROADCAST_RUN_SECONDS.
+    Пользователи идут по возрастанию user_id пачками; после каждой пачки счётчики
+    и чекпоинт last_user_id коммитятся, поэтому после падения повторный запуск
+    продолжит с последней сохранённой пачки. Аренда (lease_until) не даёт двум
+    запускам рассылать одно и то же параллельно.
+    """
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            UPDATE t_p62125649_ai_video_bot.broadcasts
+            SET status = 'running',
+                started_at = COALESCE(started_at, NOW()),
+                lease_until = NOW() + %s * INTERVAL '1 second'
+            WHERE broadcast_id = %s
+              AND status IN ('pending', 'running')
+              AND (lease_until IS NULL OR lease_until < NOW())
+            RETURNING *
+        """, (BROADCAST_LEASE_SECONDS, broadcast_id))
+        broadcast = cur.fetchone()
+        conn.commit()
+    
+    if not broadcast:
+        return {'success': False, 'error': 'Broadcast not found, finished or already running'}
+    
+    audience_filter, audience_values = broadcast_audience_filter(broadcast['segment'] or {})
+    limiter = RateLimiter(BROADCAST_RATE_PER_SECOND)
+    deadline = time.monotonic() + BROADCAST_RUN_SECONDS
+    last_user_id = broadcast['last_user_id']
+    totals = {'delivered': 0, 'blocked': 0, 'failed': 0}
+    status = 'running'
+    
+    with ThreadPoolExecutor(max_workers=BROADCAST_WORKERS) as pool:
+        while time.monotonic() < deadline:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT user_id FROM t_p62125649_ai_video_bot.users
+                    WHERE user_id > %s AND {audience_filter}
+                    ORDER BY user_id
+                    LIMIT %s
+                """, [last_user_id] + audience_values + [BROADCAST_BATCH_SIZE])
+                user_ids = [row[0] for row in cur.fetchall()]
+            
+            if not user_ids:
+                status = 'completed'
+                break
+            
+            results = list(pool.map(lambda uid: send_broadcast_message(uid, broadcast['text'], limiter), user_ids))
+            blocked_ids = [uid for uid, result in zip(user_ids, results) if result == 'blocked']
+            batch = {key: results.count(key) for key in totals}
+            last_user_id = user_ids[-1]
+            
+            with conn.cursor() as cur:
+                if blocked_ids:
+                    cur.execute("""
+                        UPDATE t_p62125649_ai_video_bot.users
+                        SET bot_blocked_at = NOW()
+                        WHERE user_id = ANY(%s)
+                    """, (blocked_ids,))
+                
+                cur.execute("""
+                    UPDATE t_p62125649_ai_video_bot.broadcasts
+                    SET last_user_id = %s,
+                        delivered_count = delivered_count + %s,
+                        blocked_count = blocked_count + %s,
+                        failed_count = failed_count + %s,
+                        lease_until = NOW() + %s * INTERVAL '1 second'
+                    WHERE broadcast_id = %s
+                    RETURNING status
+                """, (last_user_id, batch['delivered'], batch['blocked'], batch['failed'],
+                      BROADCAST_LEASE_SECONDS, broadcast_id))
+                status = cur.fetchone()[0]
+                conn.commit()
+            
+            for key in totals:
+                totals[key] += batch[key]
+            
+            if status == 'cancelled':
+                break
+    
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE t_p62125649_ai_video_bot.broadcasts
+            SET status = %s,
+                lease_until = NULL,
+                finished_at = CASE WHEN %s = 'completed' THEN NOW() ELSE finished_at END
+            WHERE broadcast_id = %s AND status = 'running'
+        """, (status, status, broadcast_id))
+        conn.commit()
+    
+    return {'success': True, 'broadcast_id': broadcast_id, 'status': status, 'last_user_id': last_user_id, **totals}
+
+def cancel_broadcast(conn, broadcast_id: int, admin_username: str) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE t_p62125649_ai_video_bot.broadcasts
+            SET status = 'cancelled', finished_at = NOW()
+            WHERE broadcast_id = %s AND status IN ('pending', 'running')
+        """, (broadcast_id,))
+        cancelled = cur.rowcount > 0
+        
+        if cancelled:
+            cur.execute("""
+                INSERT INTO t_p62125649_ai_video_bot.admin_actions (admin_username, action_type, details)
+                VALUES (%s, 'broadcast_cancel', %s)
+            """, (admin_username, json.dumps({'broadcast_id': broadcast_id})))
+        conn.commit()
+    
+    return {'success': cancelled}
+
+def get_broadcasts(conn, limit: int = 20):
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT broadcast_id, text, segment, status, last_user_id, delivered_count, blocked_count, failed_count,
+                   created_by, created_at, started_at, finished_at
+            FROM t_p62125649_ai_video_bot.broadcasts
+            ORDER BY broadcast_id DESC
+            LIMIT %s
+        """, (limit,))
+        return [dict(b) for b in cur.fetchall()]
+
+def get_ledger_drift(conn, limit: int = 50) -> Dict[str, Any]:
+    """Отчёт сверки балансов с журналом проводок (считает db-maintenance)."""
+    limit = max(1, min(limit, LIST_MAX_LIMIT))
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT 
+                (SELECT COUNT(*) FROM t_p62125649_ai_video_bot.ledger_drift) AS users_with_drift,
+                (SELECT COALESCE(SUM(drift), 0) FROM t_p62125649_ai_video_bot.ledger_drift) AS total_drift,
+                (SELECT metric_value FROM t_p62125649_ai_video_bot.stats_cache 
+                 WHERE metric_name = 'ledger_audit_checkpoint') AS checkpoint,
+                (SELECT updated_at FROM t_p62125649_ai_video_bot.stats_cache 
+                 WHERE metric_name = 'ledger_audit_checkpoint') AS checkpoint_updated_at
+        """)
+        summary = dict(cur.fetchone())
+        
+        cur.execute("""
+            SELECT d.user_id, u.username, d.balance, d.expected_balance, d.drift, d.detected_at, d.checked_at
+            FROM t_p62125649_ai_video_bot.ledger_drift d
+            JOIN t_p62125649_ai_video_bot.users u ON u.user_id = d.user_id
+            ORDER BY abs(d.drift) DESC
+            LIMIT %s
+        """, (limit,))
+        summary['users'] = [dict(row) for row in cur.fetchall()]
+    
+    return summary
+
 def reset_stats(conn, admin_username: str) -> Dict[str, Any]:
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
         cur.execute("SELECT COALESCE(SUM(amount), 0) FROM t_p62125649_ai_video_bot.transactions WHERE type = 'purchase'")
@@ -193,7 +1341,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Key',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Key, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'isBase64Encoded': False,
@@ -201,8 +1349,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     headers = event.get('headers', {})
+    params = event.get('queryStringParameters') or {}
     
-    if not check_admin_auth(headers):
+    if not check_admin_auth(headers, params):
         return {
             'statusCode': 401,
             'headers': {'Content-Type': 'application/json'},
@@ -211,27 +1360,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        conn = get_db_connection()
-        params = event.get('queryStringParameters', {})
         endpoint = params.get('endpoint', 'dashboard')
         
+        if method == 'GET' and endpoint == 'dashboard':
+            return dashboard_response(headers)
+        
+        if method == 'GET' and endpoint == 'events':
+            return events_response()
+        
+        if method == 'GET' and endpoint == 'events_token':
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*',
+                            'Cache-Control': 'no-store'},
+                'isBase64Encoded': False,
+                'body': json.dumps(issue_events_token())
+            }
+        
+        if method == 'GET' and endpoint == 'export':
+            return export_response(params)
+        
+        # Рассылки читаются с основной БД: их статус меняется тут же и должен быть виден сразу
+        if method == 'GET' and (endpoint in LIST_ENDPOINTS or endpoint in ('search_users', 'sla', 'ledger_drift')):
+            conn = get_read_connection()
+        else:
+            conn = get_db_connection()
+        
         if method == 'GET':
-            if endpoint == 'dashboard':
-                stats = get_dashboard_stats(conn)
-                recent_users = get_recent_users(conn, 10)
-                recent_orders = get_recent_orders(conn, 20)
-                order_stats = get_order_stats(conn)
-                daily_revenue = get_daily_revenue(conn, 7)
-                model_stats = get_model_stats(conn)
-                
-                data = {
-                    'stats': stats,
-                    'recent_users': recent_users,
-                    'recent_orders': recent_orders,
-                    'order_stats': order_stats,
-                    'daily_revenue': daily_revenue,
-                    'model_stats': model_stats
-                }
+            if endpoint in LIST_ENDPOINTS:
+                data = list_rows(conn, endpoint, params)
+            elif endpoint == 'search_users':
+                data = search_users(conn, params.get('q', ''), int(params.get('limit', 20)))
+            elif endpoint == 'sla':
+                data = get_sla_stats(conn, params.get('window', '24h'))
+            elif endpoint == 'broadcasts':
+                data = get_broadcasts(conn)
+            elif endpoint == 'ledger_drift':
+                data = get_ledger_drift(conn, int(params.get('limit', 50)))
             else:
                 data = {'error': 'Unknown endpoint'}
         
@@ -246,15 +1411,41 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 reason = body_data.get('reason', 'Manual adjustment')
                 
                 result = update_user_balance(conn, user_id, amount, admin_username, reason)
+                invalidate_dashboard_cache()
                 data = result
+            elif action == 'bulk_update_balance':
+                try:
+                    dry_run = parse_strict_bool(body_data.get('dry_run', False))
+                except ValueError:
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'dry_run must be a boolean'})
+                    }
+                admin_username = body_data.get('admin_username', 'admin')
+                items = parse_bulk_items(body_data)
+                data = bulk_update_balance(conn, items, admin_username, dry_run)
+                if not data.get('dry_run'):
+                    invalidate_dashboard_cache()
             elif action == 'reset_stats':
                 admin_username = body_data.get('admin_username', 'admin')
                 result = reset_stats(conn, admin_username)
+                invalidate_dashboard_cache()
                 data = result
+            elif action == 'create_broadcast':
+                admin_username = body_data.get('admin_username', 'admin')
+                data = create_broadcast(conn, body_data.get('text', ''), body_data.get('segment') or {}, admin_username)
+            elif action == 'run_broadcast':
+                data = run_broadcast(conn, int(body_data.get('broadcast_id')))
+            elif action == 'cancel_broadcast':
+                admin_username = body_data.get('admin_username', 'admin')
+                data = cancel_broadcast(conn, int(body_data.get('broadcast_id')), admin_username)
             elif action == 'set_webhook':
                 webhook_url = body_data.get('webhook_url', 'https://functions.poehali.dev/bb7d0a58-b8cf-4320-9a8e-000f952266d9')
                 
-                url = f'https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/setWebhook'
+                url = f'{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/setWebhook'
                 webhook_data = {
                     'url': webhook_url,
                     'allowed_updates': ['message', 'callback_query']
@@ -290,4 +1481,139 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {'Content-Type': 'application/json'},
             'isBase64Encoded': False,
             'body': json.dumps({'error': str(e)})
-        }
\ No newline at end of file
+        }
+
+def export_cli(args):
+    '''
+    Выгрузка без ограничения по числу строк прямо в stdout:
+    python index.py export orders --format csv --date-from 2024-01-01 --date-to 2024-02-01 > orders.csv
+    После обрыва продолжить можно с --after-id из последней строки stderr.
+    '''
+    import sys
+    
+    columns = export_columns(args.table, args.include_update)
+    id_index = columns.index(EXPORT_TABLES[args.table]['id_column'])
+    encode = encode_csv if args.format == 'csv' else encode_ndjson
+    exported = 0
+    
+    def tracked(rows: Iterator[tuple]) -> Iterator[tuple]:
+        nonlocal exported
+        for row in rows:
+            yield row
+            exported += 1
+            if exported % EXPORT_BATCH_SIZE == 0:
+                print(f"[EXPORT] {exported} rows, resume with --after-id {row[id_index]}", file=sys.stderr)
+    
+    conn = get_read_connection()
+    try:
+        rows = tracked(iter_export_rows(conn, args.table, columns, args.date_from, args.date_to, args.after_id))
+        for chunk in encode(columns, rows):
+            sys.stdout.write(chunk)
+    finally:
+        conn.close()
+    
+    print(f"[EXPORT] done, {exported} rows", file=sys.stderr)
+
+def bench_dashboard_cli(args):
+    '''
+    Сравнить режимы сборки дашборда на одной и той же БД:
+    python index.py bench-dashboard --runs 20
+    '''
+    conn = get_db_connection()
+    try:
+        for mode in ('legacy', 'single'):
+            render_dashboard(conn, mode)
+            timings = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                body = render_dashboard(conn, mode)
+                timings.append((time.perf_counter() - started) * 1000)
+                conn.rollback()
+            timings.sort()
+            print(f"[BENCH] {mode}: median {timings[len(timings) // 2]:.1f} ms, "
+                  f"min {timings[0]:.1f} ms, max {timings[-1]:.1f} ms, {len(body)} bytes")
+    finally:
+        conn.close()
+
+def bench_lists_cli(args):
+    '''
+    Сравнить первую и глубокую страницу списков админки:
+    python index.py bench-lists --page 10000 --limit 50 --runs 20
+    Курсор глубокой страницы берётся один раз через OFFSET (в замер не входит), для сравнения
+    замеряется и сам OFFSET-запрос той же страницы.
+    '''
+    if args.page < 2:
+        raise SystemExit('--page must be at least 2')
+    
+    conn = get_read_connection()
+    
+    def measure(run) -> List[float]:
+        run()
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+            conn.rollback()
+        return sorted(timings)
+    
+    try:
+        for name, config in LIST_ENDPOINTS.items():
+            params = {'limit': str(args.limit)}
+            first = measure(lambda: list_rows(conn, name, params))
+            
+            offset_query = (f"{config['select']} ORDER BY {config['created_column']} DESC, {config['id_column']} DESC "
+                            f"LIMIT %s OFFSET %s")
+            offset = (args.page - 1) * args.limit
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(offset_query, (1, offset - 1))
+                anchor = cur.fetchone()
+            conn.rollback()
+            
+            if not anchor:
+                print(f"[BENCH] {name}: page 1 median {first[len(first) // 2]:.1f} ms, "
+                      f"fewer than {offset} rows, deep page skipped")
+                continue
+            
+            deep_params = dict(params, cursor=encode_cursor(anchor['created_at'], anchor[config['id_key']]))
+            deep = measure(lambda: list_rows(conn, name, deep_params))
+            
+            def run_offset():
+                with conn.cursor() as cur:
+                    cur.execute(offset_query, (args.limit, offset))
+                    cur.fetchall()
+            offset_timings = measure(run_offset)
+            
+            print(f"[BENCH] {name}: page 1 median {first[len(first) // 2]:.1f} ms, "
+                  f"page {args.page} keyset median {deep[len(deep) // 2]:.1f} ms, "
+                  f"page {args.page} OFFSET median {offset_timings[len(offset_timings) // 2]:.1f} ms")
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='admin-api maintenance commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    export_parser = commands.add_parser('export', help='Streaming export of admin tables')
+    export_parser.add_argument('table', choices=sorted(EXPORT_TABLES))
+    export_parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    export_parser.add_argument('--date-from')
+    export_parser.add_argument('--date-to')
+    export_parser.add_argument('--after-id', type=int, default=0)
+    export_parser.add_argument('--include-update', action='store_true')
+    export_parser.set_defaults(func=export_cli)
+    
+    bench_parser = commands.add_parser('bench-dashboard', help='Compare legacy and single-query dashboard')
+    bench_parser.add_argument('--runs', type=int, default=20)
+    bench_parser.set_defaults(func=bench_dashboard_cli)
+    
+    lists_parser = commands.add_parser('bench-lists', help='Compare first and deep keyset pages of admin lists')
+    lists_parser.add_argument('--page', type=int, default=10000)
+    lists_parser.add_argument('--limit', type=int, default=LIST_DEFAULT_LIMIT)
+    lists_parser.add_argument('--runs', type=int, default=20)
+    lists_parser.set_defaults(func=bench_lists_cli)
+    
+    cli_args = parser.parse_args()
+    cli_args.func(cli_args)
@@ -0,0 +1,163 @@
+'''
+Business: Внесение сбоев во внешние вызовы функций (Telegram, kie.ai, ЮКасса) - задержки, таймауты, 429/5xx и битые ответы
+Args: словарь сбоев по целям {"kie": {...}, "telegram": {...}}, цели определяются по базовым URL из окружения
+Returns: подмена urllib.request.urlopen на время install()/uninstall() и счётчики внесённых сбоев
+
+Описание сбоев для одной цели:
+    {
+        "latency": {"distribution": "lognormal", "median_ms": 800, "p99_ms": 8000},
+        "timeout_rate": 0.05,
+        "status_rates": {"429": 0.1, "502": 0.02},
+        "malformed_rate": 0.01
+    }
+Распределения задержки: fixed (ms), uniform (min_ms, max_ms), lognormal (median_ms, p99_ms).
+'''
+
+import io
+import json
+import math
+import os
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from email.message import Message
+from typing import Dict, Any, Optional
+
+# Сколько «висит» соединение при внесённом таймауте, если вызывающий код не передал timeout
+FAULT_HANG_SECONDS = float(os.environ.get('FAULT_HANG_SECONDS', '30'))
+LOGNORMAL_P99_Z = 2.326
+
+_original_urlopen = urllib.request.urlopen
+_lock = threading.Lock()
+_state: Dict[str, Any] = {'faults': {}, 'rng': random.Random(), 'stats': {}}
+
+def fault_targets() -> Dict[str, str]:
+    return {
+        'telegram': os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/'),
+        'kie': os.environ.get('KIE_API_URL', 'https://api.kie.ai').rstrip('/'),
+        'yookassa': os.environ.get('YOOKASSA_API_URL', 'https://api.yookassa.ru/v3').rstrip('/')
+    }
+
+def match_target(url: str) -> Optional[str]:
+    for name, base in fault_targets().items():
+        if url.startswith(base):
+            return name
+    return None
+
+def sample_latency_ms(spec: Optional[Dict[str, Any]], rng: random.Random) -> float:
+    if not spec:
+        return 0.0
+
+    distribution = spec.get('distribution', 'fixed')
+    if distribution == 'fixed':
+        return float(spec.get('ms', 0))
+    if distribution == 'uniform':
+        return rng.uniform(float(spec.get('min_ms', 0)), float(spec.get('max_ms', 0)))
+    if distribution == 'lognormal':
+        median = float(spec['median_ms'])
+        sigma = math.log(float(spec['p99_ms']) / median) / LOGNORMAL_P99_Z
+        return rng.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+def count(target: str, kind: str):
+    with _lock:
+        target_stats = _state['stats'].setdefault(target, {})
+        target_stats[kind] = target_stats.get(kind, 0) + 1
+
+class MalformedResponse:
+    """Ответ 200 с оборванным телом, как при обрыве соединения посреди JSON."""
+
+    def __init__(self, url: str, body: bytes):
+        self.url = url
+        self.status = 200
+        self.headers = Message()
+        self.headers['Content-Type'] = 'application/json'
+        self._body = io.BytesIO(body[:max(1, len(body) // 2)])
+
+    def read(self, *args) -> bytes:
+        return self._body.read(*args)
+
+    def getcode(self) -> int:
+        return self.status
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+def error_body(target: str, status: int) -> bytes:
+    if target == 'telegram':
+        payload = {'ok': False, 'error_code': status, 'description': f'Injected fault {status}'}
+        if status == 429:
+            payload['parameters'] = {'retry_after': 1}
+    else:
+        payload = {'code': status, 'msg': f'Injected fault {status}'}
+    return json.dumps(payload).encode('utf-8')
+
+def faulty_urlopen(url, data=None, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, *args, **kwargs):
+    full_url = url.full_url if isinstance(url, urllib.request.Request) else str(url)
+    target = match_target(full_url)
+    spec = _state['faults'].get(target) if target else None
+    if not spec:
+        return _original_urlopen(url, data, timeout, *args, **kwargs)
+
+    with _lock:
+        rng = _state['rng']
+        latency = sample_latency_ms(spec.get('latency'), rng) / 1000
+        roll = rng.random()
+    has_timeout = isinstance(timeout, (int, float))
+
+    timeout_rate = float(spec.get('timeout_rate', 0))
+    if roll < timeout_rate or (has_timeout and latency > timeout):
+        count(target, 'timeout')
+        time.sleep(timeout if has_timeout else FAULT_HANG_SECONDS)
+        raise urllib.error.URLError(socket.timeout('timed out (injected)'))
+    roll -= timeout_rate
+
+    if latency:
+        count(target, 'delayed')
+        time.sleep(latency)
+
+    for status, rate in (spec.get('status_rates') or {}).items():
+        rate = float(rate)
+        if roll < rate:
+            count(target, f'status_{status}')
+            headers = Message()
+            headers['Content-Type'] = 'application/json'
+            raise urllib.error.HTTPError(full_url, int(status), 'Injected fault', headers,
+                                         io.BytesIO(error_body(target, int(status))))
+        roll -= rate
+
+    response = _original_urlopen(url, data, timeout, *args, **kwargs)
+
+    if roll < float(spec.get('malformed_rate', 0)):
+        count(target, 'malformed')
+        with response:
+            body = response.read()
+        return MalformedResponse(full_url, body)
+
+    count(target, 'passed')
+    return response
+
+def install(faults: Dict[str, Dict[str, Any]], seed: Optional[int] = None):
+    with _lock:
+        _state['faults'] = faults or {}
+        _state['rng'] = random.Random(seed)
+        _state['stats'] = {}
+    urllib.request.urlopen = faulty_urlopen
+
+def uninstall():
+    urllib.request.urlopen = _original_urlopen
+    with _lock:
+        _state['faults'] = {}
+
+def stats() -> Dict[str, Dict[str, int]]:
+    with _lock:
+        return {target: dict(counters) for target, counters in _state['stats'].items()}
@@ -0,0 +1,237 @@
+'''
+Business: Прогон сценариев сбоев внешних API через telegram-webhook и video-status-checker с отчётом по возвратам, зависшим заказам, повторным отправкам и пропускной способности
+Args: файл сценариев (fault_scenarios.json), число пользователей и параллельность, DATABASE_URL тестовой БД в окружении
+Returns: строка метрик по каждому сценарию в stdout (или JSON с --json)
+
+Пример:
+    DATABASE_URL=postgresql://localhost/bot_dev python backend/fault_scenarios.py --users 20 --concurrency 8
+
+Telegram и kie.ai заменяются локальной заглушкой, поэтому сценарии не трогают реальные API.
+Пользователи сценария создаются в указанной БД с отдельным диапазоном user_id на каждый запуск.
+'''
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+import fault_injection  # noqa: E402
+import local_runtime  # noqa: E402
+
+DEFAULT_SCENARIOS_FILE = os.path.join(BACKEND_DIR, 'fault_scenarios.json')
+SCENARIO_USER_STRIDE = 100000
+
+class StandIn:
+    """Заглушка Bot API и API генерации: запоминает отправки и «генерирует» результат за generation_seconds."""
+
+    def __init__(self, generation_seconds: float):
+        self.generation_seconds = generation_seconds
+        self.lock = threading.Lock()
+        self.tasks: Dict[str, float] = {}
+        self.sends: List[Dict[str, Any]] = []
+        self.message_id = 0
+
+    def reset(self):
+        with self.lock:
+            self.sends = []
+
+    def telegram(self, method: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        with self.lock:
+            self.message_id += 1
+            self.sends.append({'method': method, 'chat_id': payload.get('chat_id'),
+                               'media': payload.get('video') or payload.get('photo')})
+            return {'ok': True, 'result': {'message_id': self.message_id, 'file_path': 'photos/file.jpg'}}
+
+    def create_task(self) -> Dict[str, Any]:
+        task_id = uuid.uuid4().hex
+        with self.lock:
+            self.tasks[task_id] = time.monotonic() + self.generation_seconds
+        return {'code': 200, 'data': {'taskId': task_id}}
+
+    def task_status(self, task_id: str, base_url: str) -> Dict[str, Any]:
+        with self.lock:
+            ready_at = self.tasks.get(task_id)
+        if ready_at is None:
+            return {'code': 200, 'data': {'status': 'failed', 'error': 'Unknown task'}}
+        if time.monotonic() < ready_at:
+            return {'code': 200, 'data': {'status': 'processing'}}
+        media_url = f'{base_url}/media/{task_id}.mp4'
+        return {'code': 200, 'data': {'status': 'success', 'url': media_url, 'video_url': media_url}}
+
+    def duplicate_sends(self) -> int:
+        with self.lock:
+            media = [s['media'] for s in self.sends if s['method'] in ('sendVideo', 'sendPhoto') and s['media']]
+        return len(media) - len(set(media))
+
+    def serve(self, host: str = '127.0.0.1') -> str:
+        stand_in = self
+
+        class StandInHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, payload: Dict[str, Any]):
+                raw = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def dispatch(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                parts = self.path.strip('/').split('/')
+                base_url = f'http://{self.headers.get("Host")}'
+
+                if parts[0] == 'telegram':
+                    return self.reply(stand_in.telegram(parts[-1], payload))
+                if self.path.startswith('/kie/api/v1/jobs/task/'):
+                    return self.reply(stand_in.task_status(parts[-1], base_url))
+                if self.path.startswith('/kie/api/v1/jobs/getJobStatus'):
+                    status = stand_in.task_status(payload.get('job_id', ''), base_url)['data']
+                    done = status['status'] == 'success'
+                    return self.reply({'status': 'completed' if done else status['status'],
+                                       'result_url': status.get('video_url')})
+                if parts[0] == 'kie':
+                    return self.reply(stand_in.create_task())
+                self.reply({'ok': True})
+
+            do_GET = dispatch
+            do_POST = dispatch
+
+        server = ThreadingHTTPServer((host, 0), StandInHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f'http://{host}:{server.server_address[1]}'
+
+def message_update(user_id: int, text: str) -> Dict[str, Any]:
+    sender = {'id': user_id, 'is_bot': False, 'first_name': 'Load', 'username': f'load{user_id}'}
+    return {'update_id': int(time.time() * 1000) % 2 ** 31,
+            'message': {'message_id': 1, 'from': sender, 'chat': {'id': user_id, 'type': 'private'},
+                        'date': int(time.time()), 'text': text}}
+
+def callback_update(user_id: int, data: str) -> Dict[str, Any]:
+    sender = {'id': user_id, 'is_bot': False, 'first_name': 'Load', 'username': f'load{user_id}'}
+    return {'update_id': int(time.time() * 1000) % 2 ** 31,
+            'callback_query': {'id': uuid.uuid4().hex, 'from': sender, 'data': data,
+                               'message': {'message_id': 1, 'chat': {'id': user_id, 'type': 'private'}}}}
+
+def text_to_video_flow(user_id: int) -> List[Dict[str, Any]]:
+    return [
+        message_update(user_id, '/start'),
+        callback_update(user_id, 'create_textvideo'),
+        message_update(user_id, f'Нагрузочный тест {user_id}'),
+        callback_update(user_id, 'duration_5'),
+        callback_update(user_id, 'quality_standard')
+    ]
+
+def run_user(pool: local_runtime.FunctionPool, user_id: int) -> int:
+    failures = 0
+    for update in text_to_video_flow(user_id):
+        response = pool.invoke({'httpMethod': 'POST', 'headers': {}, 'queryStringParameters': {},
+                                'body': json.dumps(update)})
+        if not response or response.get('statusCode', 200) >= 500:
+            failures += 1
+    return failures
+
+def collect_order_stats(database_url: str, first_user: int, last_user: int) -> Dict[str, int]:
+    import psycopg2
+
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT
+                    COUNT(*) FILTER (WHERE status = 'completed'),
+                    COUNT(*) FILTER (WHERE status = 'failed'),
+                    COUNT(*) FILTER (WHERE status = 'processing'),
+                    (SELECT COUNT(*) FROM t_p62125649_ai_video_bot.transactions
+                     WHERE type = 'refund' AND user_id BETWEEN %s AND %s)
+                FROM t_p62125649_ai_video_bot.orders
+                WHERE user_id BETWEEN %s AND %s
+            """, (first_user, last_user, first_user, last_user))
+            completed, failed, stuck, refunds = cur.fetchone()
+    finally:
+        conn.close()
+    return {'completed': completed, 'failed': failed, 'stuck': stuck, 'refunds': refunds}
+
+def run_scenario(scenario: Dict[str, Any], index: int, args, stand_in: StandIn,
+                 webhook: local_runtime.FunctionPool, checker: local_runtime.FunctionPool) -> Dict[str, Any]:
+    first_user = args.user_id_base + index * SCENARIO_USER_STRIDE
+    user_ids = [first_user + i for i in range(args.users)]
+
+    stand_in.reset()
+    fault_injection.install(scenario.get('faults') or {}, seed=args.seed)
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            handler_failures = sum(executor.map(lambda uid: run_user(webhook, uid), user_ids))
+        for _ in range(args.checker_runs):
+            checker.invoke({'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': {}, 'body': ''})
+    finally:
+        elapsed = time.monotonic() - started
+        fault_injection.uninstall()
+
+    result = {'scenario': scenario['name'], 'users': args.users, 'seconds': round(elapsed, 1),
+              'handler_failures': handler_failures}
+    result.update(collect_order_stats(os.environ['DATABASE_URL'], user_ids[0], user_ids[-1]))
+    result['duplicate_sends'] = stand_in.duplicate_sends()
+    result['orders_per_minute'] = round(result['completed'] / elapsed * 60, 1) if elapsed else 0.0
+    result['faults'] = fault_injection.stats()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Fault-injection scenarios for the generation flow')
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS_FILE)
+    parser.add_argument('--only', nargs='*', help='Запустить только эти сценарии')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--generation-seconds', type=float, default=4.0)
+    parser.add_argument('--checker-runs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--user-id-base', type=int, default=9_000_000_000 + int(time.time()) % 10_000 * 1_000_000)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        raise SystemExit('DATABASE_URL must point to a test database')
+
+    with open(args.scenarios, encoding='utf-8') as f:
+        scenarios = json.load(f)['scenarios']
+    if args.only:
+        scenarios = [s for s in scenarios if s['name'] in args.only]
+
+    stand_in = StandIn(args.generation_seconds)
+    base_url = stand_in.serve()
+    os.environ['TELEGRAM_API_URL'] = f'{base_url}/telegram'
+    os.environ['KIE_API_URL'] = f'{base_url}/kie'
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'test-token')
+
+    webhook = local_runtime.FunctionPool('telegram-webhook', args.concurrency)
+    checker = local_runtime.FunctionPool('video-status-checker', 1)
+
+    results = []
+    for index, scenario in enumerate(scenarios):
+        result = run_scenario(scenario, index, args, stand_in, webhook, checker)
+        results.append(result)
+        if not args.json:
+            print(f"[SCENARIO] {result['scenario']}: completed={result['completed']} failed={result['failed']} "
+                  f"stuck={result['stuck']} refunds={result['refunds']} duplicate_sends={result['duplicate_sends']} "
+                  f"handler_failures={result['handler_failures']} orders/min={result['orders_per_minute']} "
+                  f"faults={json.dumps(result['faults'])}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
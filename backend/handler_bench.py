@@ -0,0 +1,112 @@
+'''
+Business: Сравнение задержки telegram-webhook в режимах HANDLER_MODE=sync и async на одном и том же сценарии создания видео
+Args: число пользователей и параллельность, задержки заглушек Telegram и kie.ai, DATABASE_URL тестовой БД в окружении
+Returns: p50/p95 и число неудачных вызовов по каждому шагу сценария для обоих режимов и разница в stdout (или JSON с --json)
+
+Пример:
+    DATABASE_URL=postgresql://localhost/bot_dev python backend/handler_bench.py --users 20 --telegram-ms 80 --kie-ms 300
+
+Telegram и kie.ai заменяются заглушкой из fault_scenarios.py, сетевая задержка вносится через fault_injection.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+import fault_injection  # noqa: E402
+import fault_scenarios  # noqa: E402
+import local_runtime  # noqa: E402
+
+MODES = ('sync', 'async')
+STEPS = ('start', 'create_textvideo', 'prompt', 'duration', 'quality')
+
+def run_user(pool: local_runtime.FunctionPool, user_id: int) -> Dict[str, Optional[float]]:
+    """Время каждого шага; None — вызов не удался (очередь пула переполнена, 5xx или исключение)."""
+    timings = {}
+    for step, update in zip(STEPS, fault_scenarios.text_to_video_flow(user_id)):
+        started = time.perf_counter()
+        try:
+            response = pool.invoke({'httpMethod': 'POST', 'headers': {}, 'queryStringParameters': {},
+                                    'body': json.dumps(update)})
+        except Exception as e:
+            print(f"[ERROR] {step} failed for user {user_id}: {str(e)}")
+            response = None
+        elapsed = (time.perf_counter() - started) * 1000
+        failed = response is None or response.get('statusCode', 200) >= 500
+        timings[step] = None if failed else elapsed
+    return timings
+
+def percentiles(samples: List[Optional[float]]) -> Dict[str, Any]:
+    # Неудачные вызовы обычно быстрые и сдвинули бы перцентили вниз, поэтому считаются отдельно
+    failures = sum(1 for sample in samples if sample is None)
+    samples = sorted(sample for sample in samples if sample is not None)
+    if not samples:
+        return {'p50_ms': None, 'p95_ms': None, 'failures': failures}
+    return {
+        'p50_ms': round(samples[len(samples) // 2], 1),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1),
+        'failures': failures
+    }
+
+def run_mode(mode: str, first_user: int, args) -> Dict[str, Dict[str, Any]]:
+    # Функция читает HANDLER_MODE при импорте, поэтому для каждого режима загружаются свои инстансы
+    os.environ['HANDLER_MODE'] = mode
+    pool = local_runtime.FunctionPool('telegram-webhook', args.concurrency)
+    user_ids = [first_user + i for i in range(args.users)]
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        runs = list(executor.map(lambda uid: run_user(pool, uid), user_ids))
+
+    return {step: percentiles([run[step] for run in runs]) for step in STEPS}
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency of the sync and async telegram-webhook handlers')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--telegram-ms', type=float, default=80.0, help='Задержка каждого вызова Bot API')
+    parser.add_argument('--kie-ms', type=float, default=300.0, help='Задержка каждого вызова API генерации')
+    parser.add_argument('--generation-seconds', type=float, default=1.0)
+    parser.add_argument('--user-id-base', type=int, default=8_000_000_000 + int(time.time()) % 10_000 * 1_000_000)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        raise SystemExit('DATABASE_URL must point to a test database')
+
+    stand_in = fault_scenarios.StandIn(args.generation_seconds)
+    base_url = stand_in.serve()
+    os.environ['TELEGRAM_API_URL'] = f'{base_url}/telegram'
+    os.environ['KIE_API_URL'] = f'{base_url}/kie'
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'test-token')
+
+    fault_injection.install({
+        'telegram': {'latency': {'distribution': 'fixed', 'ms': args.telegram_ms}},
+        'kie': {'latency': {'distribution': 'fixed', 'ms': args.kie_ms}}
+    })
+    try:
+        results = {mode: run_mode(mode, args.user_id_base + index * fault_scenarios.SCENARIO_USER_STRIDE, args)
+                   for index, mode in enumerate(MODES)}
+    finally:
+        fault_injection.uninstall()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for step in STEPS:
+        sync, async_ = results['sync'][step], results['async'][step]
+        delta = (round(sync['p50_ms'] - async_['p50_ms'], 1)
+                 if sync['p50_ms'] is not None and async_['p50_ms'] is not None else None)
+        print(f"[BENCH] {step}: sync p50={sync['p50_ms']}ms p95={sync['p95_ms']}ms failed={sync['failures']} | "
+              f"async p50={async_['p50_ms']}ms p95={async_['p95_ms']}ms failed={async_['failures']} | "
+              f"p50 delta={delta}ms")
+
+if __name__ == '__main__':
+    main()
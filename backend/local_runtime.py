@@ -0,0 +1,276 @@
+'''
+Business: Локальный запуск всех облачных функций бэкенда за одним HTTP-сервером с cron по таймеру - для нагрузочных тестов и профилирования
+Args: имена функций берутся из папок backend/*/index.py, настройки - из аргументов командной строки и переменных окружения
+Returns: HTTP-сервер, маршрутизирующий /<функция>/... в handler(event, context) нужной функции
+
+Пример:
+    DATABASE_URL=postgresql://localhost/bot python backend/local_runtime.py \\
+        --telegram-api-url http://localhost:9000 --kie-api-url http://localhost:9001 \\
+        --yookassa-api-url http://localhost:9002/v3 \\
+        --concurrency telegram-webhook=8 --cron video-status-checker=60
+'''
+
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import ModuleType, SimpleNamespace
+from typing import Dict, Any, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONCURRENCY = int(os.environ.get('LOCAL_CONCURRENCY', '4'))
+DEFAULT_CRON = {'video-status-checker': 60.0}
+QUEUE_TIMEOUT_SECONDS = float(os.environ.get('LOCAL_QUEUE_TIMEOUT', '30'))
+LATENCY_SAMPLES = 1000
+
+def discover_functions() -> List[str]:
+    return sorted(
+        name for name in os.listdir(BACKEND_DIR)
+        if os.path.isfile(os.path.join(BACKEND_DIR, name, 'index.py'))
+    )
+
+def load_function(name: str, copy_index: int) -> ModuleType:
+    # Каждая копия — отдельный модуль со своими глобальными переменными, как отдельный тёплый инстанс
+    path = os.path.join(BACKEND_DIR, name, 'index.py')
+    module_name = f"fn_{name.replace('-', '_')}_{copy_index}"
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class FunctionPool:
+    """
+    Пул инстансов одной функции: concurrency копий модуля, каждая обслуживает один вызов за раз.
+    Вызов ждёт свободный инстанс не дольше QUEUE_TIMEOUT_SECONDS, как очередь перед облачной функцией.
+    """
+
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.instances: queue.Queue = queue.Queue()
+        for index in range(concurrency):
+            self.instances.put(load_function(name, index))
+
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.latencies: List[float] = []
+
+    def invoke(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            instance = self.instances.get(timeout=QUEUE_TIMEOUT_SECONDS)
+        except queue.Empty:
+            with self.lock:
+                self.rejected += 1
+            return None
+
+        context = SimpleNamespace(request_id=str(uuid.uuid4()), function_name=self.name)
+        with self.lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        failed = False
+        try:
+            response = instance.handler(event, context)
+            failed = response.get('statusCode', 200) >= 500
+            return response
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.instances.put(instance)
+            with self.lock:
+                self.in_flight -= 1
+                self.calls += 1
+                self.errors += int(failed)
+                self.latencies.append(elapsed)
+                del self.latencies[:-LATENCY_SAMPLES]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            samples = sorted(self.latencies)
+            result = {
+                'concurrency': self.concurrency,
+                'in_flight': self.in_flight,
+                'calls': self.calls,
+                'errors': self.errors,
+                'rejected': self.rejected
+            }
+        if samples:
+            result.update({
+                'p50_ms': round(samples[len(samples) // 2], 2),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+                'max_ms': round(samples[-1], 2)
+            })
+        return result
+
+def build_event(method: str, raw_path: str, headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+    parts = urlsplit(raw_path)
+    event = {
+        'httpMethod': method,
+        'headers': headers,
+        'queryStringParameters': dict(parse_qsl(parts.query)),
+        'requestContext': {'requestId': str(uuid.uuid4()), 'identity': {'sourceIp': '127.0.0.1'}},
+        'isBase64Encoded': False,
+        'body': ''
+    }
+    if body:
+        try:
+            event['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            event['body'] = base64.b64encode(body).decode('ascii')
+            event['isBase64Encoded'] = True
+    return event
+
+def make_request_handler(pools: Dict[str, FunctionPool]):
+    class RuntimeRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status: int, payload: Dict[str, Any]):
+            raw = json.dumps(payload, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def dispatch(self):
+            segments = urlsplit(self.path).path.strip('/').split('/')
+            name = segments[0] if segments else ''
+
+            if name == '__metrics':
+                metrics = {n: pool.metrics() for n, pool in pools.items()}
+                if 'fault_injection' in sys.modules:
+                    metrics['__faults'] = sys.modules['fault_injection'].stats()
+                return self.send_json(200, metrics)
+
+            pool = pools.get(name)
+            if not pool:
+                return self.send_json(404, {'error': f'Unknown function: {name}'})
+
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            event = build_event(self.command, self.path, dict(self.headers.items()), body)
+
+            try:
+                response = pool.invoke(event)
+            except Exception as e:
+                print(f"[ERROR] {name} crashed: {str(e)}")
+                return self.send_json(502, {'error': str(e)})
+
+            if response is None:
+                return self.send_json(503, {'error': 'No free instance'})
+
+            response_body = response.get('body') or ''
+            if response.get('isBase64Encoded'):
+                raw = base64.b64decode(response_body)
+            else:
+                raw = response_body.encode('utf-8') if isinstance(response_body, str) else response_body
+
+            self.send_response(response.get('statusCode', 200))
+            for key, value in (response.get('headers') or {}).items():
+                if key.lower() != 'content-length':
+                    self.send_header(key, str(value))
+            self.send_header('Content-Length', str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        do_GET = dispatch
+        do_POST = dispatch
+        do_PUT = dispatch
+        do_DELETE = dispatch
+        do_OPTIONS = dispatch
+
+    return RuntimeRequestHandler
+
+def run_cron(pool: FunctionPool, interval: float, stop: threading.Event):
+    # Следующий запуск отсчитывается от начала предыдущего, как у облачного таймера
+    next_run = time.monotonic()
+    while not stop.wait(max(0.0, next_run - time.monotonic())):
+        next_run += interval
+        try:
+            # Облачный таймер передаёт общий секрет заголовком, без него функции обслуживания отвечают 401
+            headers = {'X-Cron-Secret': os.environ['CRON_SECRET']} if os.environ.get('CRON_SECRET') else {}
+            response = pool.invoke(build_event('GET', '/', headers, b''))
+            status = response.get('statusCode') if response else 'skipped'
+            print(f"[CRON] {pool.name}: {status}")
+        except Exception as e:
+            print(f"[ERROR] Cron {pool.name} failed: {str(e)}")
+
+def parse_pairs(values: List[str], cast) -> Dict[str, Any]:
+    pairs = {}
+    for value in values:
+        name, _, setting = value.partition('=')
+        if not setting:
+            raise SystemExit(f"Expected NAME=VALUE, got: {value}")
+        pairs[name] = cast(setting)
+    return pairs
+
+def main():
+    parser = argparse.ArgumentParser(description='Local runtime for all backend functions')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--functions', nargs='*', help='Загрузить только эти функции (по умолчанию все)')
+    parser.add_argument('--concurrency', action='append', default=[], metavar='NAME=N',
+                        help=f'Число инстансов функции (по умолчанию {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--cron', action='append', default=[], metavar='NAME=SECONDS',
+                        help='Вызывать функцию GET-запросом каждые SECONDS секунд, 0 — отключить')
+    parser.add_argument('--telegram-api-url', help='Заглушка Bot API вместо https://api.telegram.org')
+    parser.add_argument('--kie-api-url', help='Заглушка API генерации вместо https://api.kie.ai')
+    parser.add_argument('--yookassa-api-url', help='Заглушка API ЮКассы вместо https://api.yookassa.ru/v3')
+    parser.add_argument('--faults', help='Файл сценариев сбоев (см. fault_scenarios.json)')
+    parser.add_argument('--scenario', help='Имя сценария из --faults, сбои которого внести во внешние вызовы')
+    args = parser.parse_args()
+
+    # Функции читают настройки из окружения при импорте, поэтому их надо выставить до загрузки
+    for env_name, value in (('TELEGRAM_API_URL', args.telegram_api_url), ('KIE_API_URL', args.kie_api_url),
+                            ('YOOKASSA_API_URL', args.yookassa_api_url)):
+        if value:
+            os.environ[env_name] = value
+
+    names = args.functions or discover_functions()
+    concurrency = parse_pairs(args.concurrency, int)
+    cron = dict(DEFAULT_CRON)
+    cron.update(parse_pairs(args.cron, float))
+
+    pools = {name: FunctionPool(name, concurrency.get(name, DEFAULT_CONCURRENCY)) for name in names}
+
+    if args.faults:
+        import fault_injection
+
+        with open(args.faults, encoding='utf-8') as f:
+            scenarios = {s['name']: s for s in json.load(f)['scenarios']}
+        fault_injection.install(scenarios[args.scenario]['faults'])
+        print(f"[INFO] Fault scenario '{args.scenario}' installed")
+
+    stop = threading.Event()
+    for name, interval in cron.items():
+        if name in pools and interval > 0:
+            threading.Thread(target=run_cron, args=(pools[name], interval, stop), daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_request_handler(pools))
+    server.daemon_threads = True
+    print(f"[INFO] Serving {', '.join(names)} on http://{args.host}:{args.port}/<function>/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+if __name__ == '__main__':
+    sys.exit(main())
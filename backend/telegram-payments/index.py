@@ -1,72 +1,352 @@
 '''
-Business: Обработка платежей через Telegram (карты и звёзды), начисление кредитов, логирование транзакций
-Args: event с httpMethod, body (Telegram update), context с request_id
+Business: Обработка платежей через Telegram (карты и звёзды), начисление кредитов, логирование транзакций, сжатие старых Telegram update в логах по расписанию
+Args: event с httpMethod (POST — Telegram update, GET для cron), body (Telegram update), context с request_id
 Returns: HTTP response с подтверждением или ошибкой
 '''
 
+import hmac
 import json
 import os
-from typing import Dict, Any, Optional
+import threading
+import time
+import zlib
+from typing import Dict, Any, List, Optional
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
 TELEGRAM_PAYMENT_PROVIDER_TOKEN = os.environ.get('TELEGRAM_PAYMENT_PROVIDER_TOKEN', '')
 TELEGRAM_STARS_ENABLED = os.environ.get('TELEGRAM_STARS_ENABLED', 'false').lower() == 'true'
 TELEGRAM_STARS_RATE = float(os.environ.get('TELEGRAM_STARS_RATE', '1'))
+# 'webhook' — ответ на pre_checkout_query прямо в теле ответа на webhook, 'api' — отдельный вызов Bot API
+PRE_CHECKOUT_ANSWER_MODE = os.environ.get('PRE_CHECKOUT_ANSWER_MODE', 'webhook')
+# Логи pre_checkout пишутся пачкой в фоне; при недоступной БД в памяти держится не больше PENDING_LOGS_MAX строк
+PENDING_LOGS_MAX = int(os.environ.get('PENDING_LOGS_MAX', '1000'))
+# GET по расписанию (с заголовком X-Cron-Secret) переводит старые строки логов в компактный формат
+CRON_SECRET = os.environ.get('CRON_SECRET', '')
+COMPACT_TABLES = ['payment_logs', 'error_logs']
+COMPACT_BATCH_SIZE = int(os.environ.get('COMPACT_BATCH_SIZE', '500'))
+COMPACT_MAX_BATCHES = int(os.environ.get('COMPACT_MAX_BATCHES', '20'))
+
+_pending_logs: List[tuple] = []
+_pending_lock = threading.Lock()
+_flush_thread: Optional[threading.Thread] = None
 
 def get_db_connection():
     return psycopg2.connect(DATABASE_URL)
 
-def log_payment(conn, user_id: int, payment_method: str, status: str, amount: float, 
-                currency: str, external_id: Optional[str], telegram_update: Dict, 
-                error_message: Optional[str] = None):
+def compact_update(update: Dict) -> Dict[str, Any]:
+    """Поля update, по которым реально ищут в логах; полный update хранится сжатым отдельно."""
+    compact = {'update_id': update.get('update_id')}
+    
+    if 'pre_checkout_query' in update:
+        query = update['pre_checkout_query']
+        compact.update({
+            'kind': 'pre_checkout_query',
+            'query_id': query.get('id'),
+            'user_id': query.get('from', {}).get('id'),
+            'currency': query.get('currency'),
+            'total_amount': query.get('total_amount'),
+            'invoice_payload': query.get('invoice_payload')
+        })
+    elif 'message' in update:
+        message = update['message']
+        compact.update({
+            'kind': 'message',
+            'user_id': message.get('from', {}).get('id'),
+            'chat_id': message.get('chat', {}).get('id')
+        })
+        payment = message.get('successful_payment')
+        if payment:
+            compact.update({
+                'kind': 'successful_payment',
+                'currency': payment.get('currency'),
+                'total_amount': payment.get('total_amount'),
+                'invoice_payload': payment.get('invoice_payload'),
+                'telegram_payment_charge_id': payment.get('telegram_payment_charge_id'),
+                'provider_payment_charge_id': payment.get('provider_payment_charge_id')
+            })
+    
+    return {key: value for key, value in compact.items() if value is not None}
+
+def compress_update(update: Any) -> bytes:
+    raw = json.dumps(update, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return zlib.compress(raw, 6)
+
+def compact_logs(conn, table: str) -> Dict[str, int]:
+    """
+    Перевести старые строки в компактный формат пачками по COMPACT_BATCH_SIZE.
+    Каждая пачка — отдельная короткая транзакция; за один запуск не больше COMPACT_MAX_BATCHES пачек,
+    остаток доделает следующий запуск по расписанию. Строки, где telegram_update не объект, не компактизируются
+    и считаются в skipped: их значение остаётся как есть, а в telegram_update_zlib пишется оно же сжатым,
+    чтобы строка ушла из очереди idx_*_uncompacted и не перечитывалась каждым запуском.
+    """
+    compacted = 0
+    skipped = 0
+    last_id = 0
+    
     with conn.cursor() as cur:
-        cur.execute("""
+        for _ in range(COMPACT_MAX_BATCHES):
+            cur.execute(f"""
+                SELECT log_id, created_at, telegram_update
+                FROM t_p62125649_ai_video_bot.{table}
+                WHERE telegram_update_zlib IS NULL AND telegram_update IS NOT NULL AND log_id > %s
+                ORDER BY log_id
+                LIMIT %s
+            """, (last_id, COMPACT_BATCH_SIZE))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            
+            batch = [
+                (log_id, created_at,
+                 json.dumps(compact_update(update) if isinstance(update, dict) else update),
+                 psycopg2.Binary(compress_update(update)))
+                for log_id, created_at, update in rows
+            ]
+            batch_skipped = sum(1 for row in rows if not isinstance(row[2], dict))
+            # created_at в условии позволяет отсечь лишние секции
+            execute_values(cur, f"""
+                UPDATE t_p62125649_ai_video_bot.{table} AS t
+                SET telegram_update = v.compact::jsonb, telegram_update_zlib = v.packed
+                FROM (VALUES %s) AS v(log_id, created_at, compact, packed)
+                WHERE t.log_id = v.log_id AND t.created_at = v.created_at
+            """, batch)
+            conn.commit()
+            compacted += len(rows) - batch_skipped
+            skipped += batch_skipped
+            
+            if len(rows) < COMPACT_BATCH_SIZE:
+                break
+    
+    if compacted or skipped:
+        print(f"[INFO] Compacted {compacted} rows in {table}, skipped {skipped} non-object payloads")
+    return {'compacted': compacted, 'skipped': skipped}
+
+def payment_log_row(user_id: int, payment_method: str, status: str, amount: float, currency: str,
+                    external_id: Optional[str], telegram_update: Dict,
+                    error_message: Optional[str] = None) -> tuple:
+    return (user_id, payment_method, status, amount, currency, external_id,
+            json.dumps(compact_update(telegram_update)), psycopg2.Binary(compress_update(telegram_update)),
+            error_message)
+
+def write_payment_logs(conn, rows: List[tuple]):
+    # Неизвестный пользователь не должен ронять всю пачку на внешнем ключе
+    with conn.cursor() as cur:
+        execute_values(cur, """
             INSERT INTO t_p62125649_ai_video_bot.payment_logs 
             (user_id, payment_method, payment_status, amount, currency, 
-             external_payment_id, telegram_update, error_message)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (user_id, payment_method, status, amount, currency, external_id, 
-              json.dumps(telegram_update), error_message))
+             external_payment_id, telegram_update, telegram_update_zlib, error_message)
+            SELECT u.user_id, v.payment_method, v.payment_status, v.amount, v.currency,
+                   v.external_payment_id, v.telegram_update::jsonb, v.telegram_update_zlib, v.error_message
+            FROM (VALUES %s) AS v(user_id, payment_method, payment_status, amount, currency,
+                                  external_payment_id, telegram_update, telegram_update_zlib, error_message)
+            LEFT JOIN t_p62125649_ai_video_bot.users u ON u.user_id = v.user_id
+        """, rows)
         conn.commit()
 
+def flush_payment_logs(conn=None) -> int:
+    """Записать накопленные логи одной вставкой; при ошибке строки возвращаются в очередь."""
+    with _pending_lock:
+        rows = _pending_logs[:]
+        _pending_logs.clear()
+    if not rows:
+        return 0
+    
+    own_conn = conn is None
+    try:
+        if own_conn:
+            conn = get_db_connection()
+        write_payment_logs(conn, rows)
+        return len(rows)
+    except Exception as e:
+        print(f"[ERROR] Failed to flush {len(rows)} payment logs: {str(e)}")
+        if conn is not None and not own_conn:
+            conn.rollback()
+        with _pending_lock:
+            _pending_logs[:0] = rows
+            del _pending_logs[:-PENDING_LOGS_MAX]
+        return 0
+    finally:
+        if own_conn and conn is not None:
+            conn.close()
+
+def queue_payment_log(row: tuple):
+    """
+    Поставить лог в очередь и запустить фоновую запись, не дожидаясь БД.
+    Если инстанс заморозят до записи, очередь допишет следующий вызов.
+    """
+    global _flush_thread
+    with _pending_lock:
+        _pending_logs.append(row)
+        del _pending_logs[:-PENDING_LOGS_MAX]
+        if _flush_thread is None or not _flush_thread.is_alive():
+            _flush_thread = threading.Thread(target=flush_payment_logs, daemon=True)
+            _flush_thread.start()
+
+def answer_pre_checkout(update: Dict, started: float) -> Dict[str, Any]:
+    pre_checkout = update['pre_checkout_query']
+    query_id = pre_checkout['id']
+    user_id = pre_checkout['from']['id']
+    currency = pre_checkout['currency']
+    total_amount = pre_checkout['total_amount']
+    answer = {'pre_checkout_query_id': query_id, 'ok': True}
+    
+    if PRE_CHECKOUT_ANSWER_MODE == 'api':
+        import requests
+        requests.post(f'{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/answerPreCheckoutQuery', json=answer)
+        body = {'status': 'ok'}
+    else:
+        # Telegram выполнит метод из тела ответа на webhook, отдельный запрос к Bot API не нужен
+        body = {'method': 'answerPreCheckoutQuery', **answer}
+    
+    queue_payment_log(payment_log_row(user_id,
+                                      'telegram_stars' if currency == 'XTR' else 'telegram_card',
+                                      'pre_checkout', total_amount / 100 if currency != 'XTR' else total_amount,
+                                      currency, query_id, update))
+    
+    print(f"[METRIC] pre_checkout_ms={(time.perf_counter() - started) * 1000:.2f} mode={PRE_CHECKOUT_ANSWER_MODE}")
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'isBase64Encoded': False,
+        'body': json.dumps(body)
+    }
+
 def process_successful_payment(conn, user_id: int, amount: float, currency: str, 
-                               payment_method: str, external_payment_id: str) -> Dict[str, Any]:
+                               payment_method: str, external_payment_id: str,
+                               telegram_update: Dict) -> Dict[str, Any]:
+    """
+    Зачисление, проводка и лог платежа одним запросом и одной фиксацией.
+    Повторная доставка того же платежа упирается в payment_credits и ничего не начисляет.
+    """
+    if currency == 'XTR':
+        credits = int(amount * TELEGRAM_STARS_RATE)
+    else:
+        credits = int(amount)
+    
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        if currency == 'XTR':
-            credits = int(amount * TELEGRAM_STARS_RATE)
-        else:
-            credits = int(amount)
-        
         cur.execute("""
-            UPDATE t_p62125649_ai_video_bot.users 
-            SET balance = balance + %s 
-            WHERE user_id = %s
-            RETURNING balance
-        """, (credits, user_id))
-        
-        result = cur.fetchone()
-        if not result:
-            return {'success': False, 'error': 'User not found'}
-        
-        new_balance = result['balance']
-        
-        cur.execute("""
-            INSERT INTO t_p62125649_ai_video_bot.transactions 
-            (user_id, amount, type, description, external_payment_id, payment_method)
-            VALUES (%s, %s, 'purchase', %s, %s, %s)
-        """, (user_id, credits, f'Telegram payment ({currency})', external_payment_id, payment_method))
-        
+            WITH claim AS (
+                INSERT INTO t_p62125649_ai_video_bot.payment_credits 
+                (external_payment_id, user_id, payment_method, credits, currency)
+                SELECT %(external_id)s, user_id, %(method)s, %(credits)s, %(currency)s
+                FROM t_p62125649_ai_video_bot.users
+                WHERE user_id = %(user_id)s
+                ON CONFLICT (external_payment_id) DO NOTHING
+                RETURNING user_id, credits
+            ),
+            credited AS (
+                UPDATE t_p62125649_ai_video_bot.users u
+                SET balance = u.balance + claim.credits
+                FROM claim
+                WHERE u.user_id = claim.user_id
+                RETURNING u.balance
+            ),
+            ledger AS (
+                INSERT INTO t_p62125649_ai_video_bot.transactions 
+                (user_id, amount, type, description, external_payment_id, payment_method)
+                SELECT user_id, credits, 'purchase', %(description)s, %(external_id)s, %(method)s
+                FROM claim
+            ),
+            existing AS (
+                SELECT credits, currency
+                FROM t_p62125649_ai_video_bot.payment_credits
+                WHERE external_payment_id = %(external_id)s
+            ),
+            known_user AS (
+                SELECT user_id, balance
+                FROM t_p62125649_ai_video_bot.users
+                WHERE user_id = %(user_id)s
+            ),
+            logged AS (
+                INSERT INTO t_p62125649_ai_video_bot.payment_logs 
+                (user_id, payment_method, payment_status, amount, currency, 
+                 external_payment_id, telegram_update, telegram_update_zlib, error_message)
+                SELECT (SELECT user_id FROM known_user), %(method)s,
+                       CASE
+                           WHEN EXISTS (SELECT 1 FROM claim) THEN 'success'
+                           WHEN EXISTS (SELECT 1 FROM known_user) THEN 'duplicate'
+                           ELSE 'failed'
+                       END,
+                       %(amount)s, %(currency)s, %(external_id)s, %(compact)s, %(packed)s,
+                       CASE WHEN EXISTS (SELECT 1 FROM known_user) THEN NULL ELSE 'User not found' END
+            )
+            SELECT 
+                (SELECT balance FROM credited) AS new_balance,
+                (SELECT credits FROM claim) AS credits_added,
+                (SELECT credits FROM existing) AS existing_credits,
+                (SELECT currency FROM existing) AS existing_currency,
+                (SELECT balance FROM known_user) AS current_balance
+        """, {
+            'external_id': external_payment_id,
+            'method': payment_method,
+            'credits': credits,
+            'currency': currency,
+            'user_id': user_id,
+            'amount': amount,
+            'description': f'Telegram payment ({currency})',
+            'compact': json.dumps(compact_update(telegram_update)),
+            'packed': psycopg2.Binary(compress_update(telegram_update))
+        })
+        row = cur.fetchone()
         conn.commit()
-        
+    
+    if row['credits_added'] is not None:
         return {
             'success': True, 
-            'credits_added': credits, 
-            'new_balance': new_balance,
+            'credits_added': row['credits_added'], 
+            'new_balance': row['new_balance'],
             'currency': currency
         }
+    
+    # Пользователь есть, а зачисления нет — платёж уже зачислен (возможно, параллельной доставкой,
+    # чью строку снимок запроса ещё не видит)
+    if row['current_balance'] is not None:
+        print(f"[INFO] Duplicate payment {external_payment_id} ignored")
+        return {
+            'success': True,
+            'duplicate': True,
+            'credits_added': row['existing_credits'] if row['existing_credits'] is not None else credits,
+            'new_balance': row['current_balance'],
+            'currency': row['existing_currency'] or currency
+        }
+    
+    return {'success': False, 'error': 'User not found'}
+
+def run_compaction(event: Dict[str, Any]) -> Dict[str, Any]:
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    if not CRON_SECRET or not hmac.compare_digest(headers.get('x-cron-secret') or '', CRON_SECRET):
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Unauthorized'})
+        }
+    
+    try:
+        conn = get_db_connection()
+        try:
+            result = {table: compact_logs(conn, table) for table in COMPACT_TABLES}
+        finally:
+            conn.close()
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'logs_compacted': result})
+        }
+    except Exception as e:
+        print(f"[ERROR] Log compaction failed: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': str(e)})
+        }
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method = event.get('httpMethod', 'POST')
@@ -76,47 +356,31 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Telegram-Bot-Api-Secret-Token',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Telegram-Bot-Api-Secret-Token, X-Cron-Secret',
                 'Access-Control-Max-Age': '86400'
             },
             'isBase64Encoded': False,
             'body': ''
         }
     
+    if method == 'GET':
+        return run_compaction(event)
+    
+    started = time.perf_counter()
+    
     try:
         body_str = event.get('body', '{}')
         update = json.loads(body_str)
         
-        conn = get_db_connection()
-        
+        # Быстрый путь: на pre_checkout_query отвечаем до любой работы с БД
         if 'pre_checkout_query' in update:
-            pre_checkout = update['pre_checkout_query']
-            query_id = pre_checkout['id']
-            user_id = pre_checkout['from']['id']
-            currency = pre_checkout['currency']
-            total_amount = pre_checkout['total_amount']
-            
-            log_payment(conn, user_id, 
-                       'telegram_stars' if currency == 'XTR' else 'telegram_card',
-                       'pre_checkout', total_amount / 100 if currency != 'XTR' else total_amount,
-                       currency, query_id, update)
-            
-            import requests
-            requests.post(
-                f'https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/answerPreCheckoutQuery',
-                json={'pre_checkout_query_id': query_id, 'ok': True}
-            )
-            
-            conn.close()
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'status': 'ok'})
-            }
+            return answer_pre_checkout(update, started)
         
-        elif 'message' in update and 'successful_payment' in update['message']:
+        conn = get_db_connection()
+        flush_payment_logs(conn)
+        
+        if 'message' in update and 'successful_payment' in update['message']:
             message = update['message']
             payment = message['successful_payment']
             user_id = message['from']['id']
@@ -127,24 +391,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             amount = total_amount / 100 if currency != 'XTR' else total_amount
             payment_method = 'telegram_stars' if currency == 'XTR' else 'telegram_card'
             
-            log_payment(conn, user_id, payment_method, 'success', amount, currency, 
-                       telegram_payment_charge_id, update)
-            
             result = process_successful_payment(conn, user_id, amount, currency, 
-                                               payment_method, telegram_payment_charge_id)
+                                               payment_method, telegram_payment_charge_id, update)
             
-            if result['success']:
+            if result['success'] and not result.get('duplicate'):
                 import requests
                 requests.post(
-                    f'https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage',
+                    f'{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/sendMessage',
                     json={
                         'chat_id': user_id,
                         'text': f"✅ Платёж успешно обработан!\n\n💳 Начислено кредитов: {result['credits_added']}\n💰 Ваш баланс: {result['new_balance']}"
                     }
                 )
-            else:
-                log_payment(conn, user_id, payment_method, 'failed', amount, currency,
-                           telegram_payment_charge_id, update, result.get('error'))
             
             conn.close()
             return {
@@ -166,12 +424,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     except Exception as e:
         try:
             if 'conn' in locals():
+                failed_update = update if 'update' in locals() else {}
                 with conn.cursor() as cur:
                     cur.execute("""
                         INSERT INTO t_p62125649_ai_video_bot.error_logs 
-                        (error_type, error_message, telegram_update)
-                        VALUES (%s, %s, %s)
-                    """, ('payment_processing_error', str(e), json.dumps(update if 'update' in locals() else {})))
+                        (error_type, error_message, telegram_update, telegram_update_zlib)
+                        VALUES (%s, %s, %s, %s)
+                    """, ('payment_processing_error', str(e), json.dumps(compact_update(failed_update)),
+                          psycopg2.Binary(compress_update(failed_update))))
                     conn.commit()
                 conn.close()
         except:
@@ -183,3 +443,68 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False,
             'body': json.dumps({'error': str(e)})
         }
+
+def sample_payment_update(update_id: int) -> Dict[str, Any]:
+    user = {'id': 100000 + update_id, 'is_bot': False, 'first_name': 'Test', 'username': f'user{update_id}',
+            'language_code': 'ru', 'is_premium': False}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'from': user,
+            'chat': {'id': user['id'], 'first_name': 'Test', 'username': user['username'], 'type': 'private'},
+            'date': 1700000000 + update_id,
+            'successful_payment': {
+                'currency': 'XTR',
+                'total_amount': 100,
+                'invoice_payload': json.dumps({'user_id': user['id'], 'amount': 100}),
+                'telegram_payment_charge_id': f'stxAbCdEf{update_id:012d}',
+                'provider_payment_charge_id': f'provider_{update_id:012d}'
+            }
+        }
+    }
+
+def bench_payloads_cli(args):
+    '''
+    Сравнить полный JSONB и компактный формат на временных таблицах:
+    python index.py bench-payloads --rows 20000
+    '''
+    updates = [sample_payment_update(i) for i in range(args.rows)]
+    variants = {
+        'full_jsonb': ('telegram_update JSONB',
+                       [(json.dumps(u),) for u in updates]),
+        'compact_zlib': ('telegram_update JSONB, telegram_update_zlib BYTEA',
+                         [(json.dumps(compact_update(u)), psycopg2.Binary(compress_update(u))) for u in updates])
+    }
+    
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            for name, (columns, rows) in variants.items():
+                cur.execute(f"CREATE TEMP TABLE bench_{name} (log_id SERIAL PRIMARY KEY, {columns}) ON COMMIT DROP")
+                column_names = ', '.join(c.split()[0] for c in columns.split(', '))
+                started = time.perf_counter()
+                for row in rows:
+                    placeholders = ', '.join(['%s'] * len(row))
+                    cur.execute(f"INSERT INTO bench_{name} ({column_names}) VALUES ({placeholders})", row)
+                elapsed = time.perf_counter() - started
+                cur.execute(f"SELECT pg_total_relation_size('bench_{name}')")
+                size = cur.fetchone()[0]
+                print(f"{name}: {size / 1024:.0f} KB total, {size / args.rows:.0f} B/row, "
+                      f"{args.rows / elapsed:.0f} inserts/s")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='telegram-payments commands')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    bench_parser = subparsers.add_parser('bench-payloads')
+    bench_parser.add_argument('--rows', type=int, default=10000)
+    
+    cli_args = parser.parse_args()
+    if cli_args.command == 'bench-payloads':
+        bench_payloads_cli(cli_args)
@@ -4,21 +4,32 @@ Args: event с httpMethod, body (JSON от Telegram), context с request_id
 Returns: HTTP response 200 OK для подтверждения получения update
 '''
 
+import asyncio
+import functools
+import hashlib
 import json
 import os
+import threading
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, Literal
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 from psycopg2.extras import RealDictCursor
 import urllib.request
 import urllib.error
 
 BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+KIE_API_URL = os.environ.get('KIE_API_URL', 'https://api.kie.ai').rstrip('/')
 DATABASE_URL = os.environ.get('DATABASE_URL')
 GEN_API_KEY = os.environ.get('GEN_API_KEY', '57dabe651c81b31ea5ee1bb021817051')
-GEN_SORA_API_URL = os.environ.get('GEN_SORA_API_URL', 'https://api.kie.ai/api/v1/jobs/createTask')
-GEN_IMAGE_API_URL = os.environ.get('GEN_IMAGE_API_URL', 'https://api.kie.ai/api/v1/gpt4o-image/generate')
+GEN_SORA_API_URL = os.environ.get('GEN_SORA_API_URL', f'{KIE_API_URL}/api/v1/jobs/createTask')
+GEN_IMAGE_API_URL = os.environ.get('GEN_IMAGE_API_URL', f'{KIE_API_URL}/api/v1/gpt4o-image/generate')
 GEN_MODEL_TEXT2VIDEO = os.environ.get('GEN_MODEL_TEXT2VIDEO', 'sora-2-pro-text-to-video')
 GEN_MODEL_IMAGE2VIDEO = os.environ.get('GEN_MODEL_IMAGE2VIDEO', 'sora-2-pro-image-to-video')
 GEN_MODEL_STORYBOARD = os.environ.get('GEN_MODEL_STORYBOARD', 'sora-2-pro-storyboard')
@@ -26,6 +37,91 @@ GEN_MODEL_IMAGE = os.environ.get('GEN_MODEL_IMAGE', '4o-image-api')
 GEN_CALLBACK_URL = os.environ.get('GEN_CALLBACK_URL', 'https://functions.poehali.dev/1655da17-3061-4871-9fbb-026dcf946587')
 TELEGRAM_PAYMENT_PROVIDER_TOKEN = os.environ.get('TELEGRAM_PAYMENT_PROVIDER_TOKEN', '')
 TELEGRAM_STARS_ENABLED = os.environ.get('TELEGRAM_STARS_ENABLED', 'true').lower() == 'true'
+# last_activity пишется не чаще раза в LAST_ACTIVITY_GRANULARITY_SECONDS на пользователя:
+# окно active_users_24h смещается не больше чем на эту величину
+LAST_ACTIVITY_GRANULARITY_SECONDS = int(os.environ.get('LAST_ACTIVITY_GRANULARITY_SECONDS', '60'))
+# Кэш профилей в тёплом инстансе; сбрасывается по NOTIFY user_profile, TTL — страховка. 0 — выключен
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USER_PROFILE_CHANNEL = 'user_profile'
+# Соединения переиспользуются тёплым инстансом, горячие запросы готовятся (PREPARE) один раз на соединение.
+# За pgbouncer в режиме transaction именованные prepared statements не работают — тогда PREPARED_STATEMENTS=false
+DB_POOL_MAX_CONNECTIONS = int(os.environ.get('DB_POOL_MAX_CONNECTIONS', '4'))
+PREPARED_STATEMENTS_ENABLED = os.environ.get('PREPARED_STATEMENTS', 'true').lower() == 'true'
+# sync — обработка update по шагам, async — независимые вызовы одного update выполняются параллельно
+HANDLER_MODE = os.environ.get('HANDLER_MODE', 'sync')
+ASYNC_IO_WORKERS = int(os.environ.get('ASYNC_IO_WORKERS', '8'))
+# Сброс нагрузки: при перегрузке новые генерации не принимаются, меню и баланс отвечают как обычно
+SHED_ENABLED = os.environ.get('SHED_ENABLED', 'true').lower() == 'true'
+# Инстанс обслуживает один вызов за раз, поэтому нагрузку видно только по общему состоянию в БД:
+# заказы в работе у провайдера и соединения роли приложения в pg_stat_activity
+SHED_MAX_INFLIGHT_GENERATIONS = int(os.environ.get('SHED_MAX_INFLIGHT_GENERATIONS', '30'))
+SHED_MAX_PROCESSING_ORDERS = int(os.environ.get('SHED_MAX_PROCESSING_ORDERS', '50'))
+SHED_PROCESSING_WINDOW_MINUTES = int(os.environ.get('SHED_PROCESSING_WINDOW_MINUTES', '15'))
+SHED_MAX_DB_CONNECTIONS = int(os.environ.get('SHED_MAX_DB_CONNECTIONS', '80'))
+SHED_LATENCY_MS = float(os.environ.get('SHED_LATENCY_MS', '5000'))
+SHED_LATENCY_ALPHA = float(os.environ.get('SHED_LATENCY_ALPHA', '0.2'))
+SHED_CHECK_TTL_SECONDS = float(os.environ.get('SHED_CHECK_TTL_SECONDS', '10'))
+SHED_RETRY_MINUTES = int(os.environ.get('SHED_RETRY_MINUTES', '5'))
+GENERATION_CALLBACKS = ('create_preview', 'create_textvideo', 'create_imagevideo', 'create_storyboard')
+# Приём фото для image-to-video: самый маленький размер, которого хватает модели, и своя ссылка без токена бота.
+# PHOTO_STAGING_DIR — локальная папка, PHOTO_STAGING_UPLOAD_URL — объектное хранилище (HTTP PUT);
+# PHOTO_PUBLIC_BASE_URL — откуда kie.ai забирает файл. Без них, как раньше, передаётся ссылка getFile
+PHOTO_MIN_LONG_SIDE = int(os.environ.get('PHOTO_MIN_LONG_SIDE', '1280'))
+PHOTO_STAGING_DIR = os.environ.get('PHOTO_STAGING_DIR', '')
+PHOTO_STAGING_UPLOAD_URL = os.environ.get('PHOTO_STAGING_UPLOAD_URL', '').rstrip('/')
+PHOTO_STAGING_AUTH_HEADER = os.environ.get('PHOTO_STAGING_AUTH_HEADER', '')
+PHOTO_PUBLIC_BASE_URL = os.environ.get('PHOTO_PUBLIC_BASE_URL', '').rstrip('/')
+# Telegram гарантирует, что ссылка getFile живёт не меньше часа
+TELEGRAM_FILE_CACHE_TTL_SECONDS = float(os.environ.get('TELEGRAM_FILE_CACHE_TTL_SECONDS', '3000'))
+TELEGRAM_FILE_CACHE_SIZE = int(os.environ.get('TELEGRAM_FILE_CACHE_SIZE', '1000'))
+
+# Горячие запросы пути обработки update: имя -> текст с параметрами $1, $2...
+STATEMENTS = {
+    'user_by_id': "SELECT * FROM t_p62125649_ai_video_bot.users WHERE user_id = $1",
+    'user_balance': "SELECT balance FROM t_p62125649_ai_video_bot.users WHERE user_id = $1",
+    'touch_last_activity': """
+        UPDATE t_p62125649_ai_video_bot.users 
+        SET last_activity = CURRENT_TIMESTAMP, bot_blocked_at = NULL
+        WHERE user_id = $1
+          AND (last_activity IS NULL
+               OR last_activity < CURRENT_TIMESTAMP - make_interval(secs => $2)
+               OR bot_blocked_at IS NOT NULL)
+    """,
+    'user_state': "SELECT state, temp_data FROM t_p62125649_ai_video_bot.user_states WHERE user_id = $1",
+    'user_state_temp': """
+        SELECT temp_prompt, temp_duration FROM t_p62125649_ai_video_bot.user_states WHERE user_id = $1
+    """,
+    'clear_user_state': "DELETE FROM t_p62125649_ai_video_bot.user_states WHERE user_id = $1",
+    'rate_limit_get': """
+        SELECT action_count, window_start FROM t_p62125649_ai_video_bot.rate_limits 
+        WHERE user_id = $1 AND action_type = $2
+    """,
+    'rate_limit_insert': """
+        INSERT INTO t_p62125649_ai_video_bot.rate_limits (user_id, action_type, action_count, window_start)
+        VALUES ($1, $2, 1, $3)
+    """,
+    'rate_limit_reset': """
+        UPDATE t_p62125649_ai_video_bot.rate_limits SET action_count = 1, window_start = $3
+        WHERE user_id = $1 AND action_type = $2
+    """,
+    'rate_limit_increment': """
+        UPDATE t_p62125649_ai_video_bot.rate_limits SET action_count = action_count + 1
+        WHERE user_id = $1 AND action_type = $2
+    """,
+    'debit_balance': "UPDATE t_p62125649_ai_video_bot.users SET balance = balance - $2 WHERE user_id = $1",
+    'video_order_insert': """
+        INSERT INTO t_p62125649_ai_video_bot.orders 
+        (user_id, order_type, prompt, duration, quality, status, cost, task_id)
+        VALUES ($1, 'text-to-video', $2, $3, $4, 'processing', $5, $6)
+        RETURNING order_id
+    """,
+    'order_ledger_insert': """
+        INSERT INTO t_p62125649_ai_video_bot.transactions 
+        (user_id, amount, type, description, order_id)
+        VALUES ($1, $2, 'video', $3, $4)
+    """
+}
 
 PREVIEW_COST = 30
 VIDEO_COSTS = {
@@ -34,12 +130,303 @@ VIDEO_COSTS = {
     15: {'standard': 600, 'high': 800}
 }
 
+class PreparedConnection(psycopg2.extensions.connection):
+    """Соединение, помнящее, какие запросы из STATEMENTS на нём уже подготовлены."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+_load_lock = threading.Lock()
+_load = {
+    'latency_ewma_ms': None,
+    'inflight_generations': 0,
+    'processing_orders': 0,
+    'db_connections': 0,
+    'checked_at': 0.0,
+    'admitted': 0,
+    'shed_by_reason': {},
+    'shed_by_kind': {}
+}
+
 def get_db_connection():
-    return psycopg2.connect(DATABASE_URL)
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = psycopg2.pool.ThreadedConnectionPool(
+                    1, DB_POOL_MAX_CONNECTIONS, DATABASE_URL, connection_factory=PreparedConnection
+                )
+    conn = _db_pool.getconn()
+    # Время ожидания генерации в этом update — не входит в задержку обработчика для сброса нагрузки
+    conn.generation_ms = 0.0
+    return conn
+
+def release_db_connection(conn, broken: bool = False):
+    """Вернуть соединение в пул; после ошибки оно закрывается, чтобы не отдать следующему вызову битую сессию."""
+    if conn.closed:
+        broken = True
+    elif not broken:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    _db_pool.putconn(conn, close=broken)
+
+_io_executor = ThreadPoolExecutor(max_workers=ASYNC_IO_WORKERS, thread_name_prefix='webhook-io')
+
+async def run_io(func, *args, **kwargs):
+    """
+    Выполнить блокирующий вызов (psycopg2, urllib) в пуле потоков, не останавливая цикл событий.
+    Вызовы к БД одного update идут по одному соединению и не должны выполняться одновременно друг с другом.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(func, *args, **kwargs))
+
+def sql_text(name: str) -> str:
+    """Текст запроса с плейсхолдерами psycopg2 для выполнения без PREPARE."""
+    sql = STATEMENTS[name]
+    for index in range(9, 0, -1):
+        sql = sql.replace(f'${index}', f'%(p{index})s')
+    return sql
+
+def execute_statement(cur, name: str, params: tuple = ()):
+    """
+    Выполнить запрос из STATEMENTS по имени. На соединении из пула он готовится один раз (PREPARE),
+    дальше Postgres не разбирает и не планирует его заново на каждом вызове.
+    """
+    prepared = getattr(cur.connection, 'prepared', None)
+    if not PREPARED_STATEMENTS_ENABLED or prepared is None:
+        cur.execute(sql_text(name), {f'p{i + 1}': value for i, value in enumerate(params)})
+        return
+    
+    if name not in prepared:
+        cur.execute(f"PREPARE {name} AS {STATEMENTS[name]}")
+        prepared.add(name)
+    
+    if params:
+        cur.execute(f"EXECUTE {name}({', '.join(['%s'] * len(params))})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+_user_cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+_user_cache_lock = threading.Lock()
+_user_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0, 'resets': 0}
+_profile_listener = None
+
+def reset_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+        _user_cache_stats['resets'] += 1
+
+def drain_user_invalidations():
+    """
+    Забрать накопившиеся NOTIFY user_profile и выбросить эти профили из кэша.
+    Соединение-слушатель живёт вместе с инстансом; если оно оборвалось, уведомления могли потеряться,
+    поэтому кэш сбрасывается целиком.
+    """
+    global _profile_listener
+    if USER_CACHE_TTL_SECONDS <= 0:
+        return
+    
+    try:
+        if _profile_listener is None or _profile_listener.closed:
+            _profile_listener = psycopg2.connect(DATABASE_URL)
+            _profile_listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with _profile_listener.cursor() as cur:
+                cur.execute(f"LISTEN {USER_PROFILE_CHANNEL}")
+            reset_user_cache()
+        
+        _profile_listener.poll()
+        notifies = _profile_listener.notifies
+        stale = [int(n.payload) for n in notifies]
+        notifies.clear()
+    except psycopg2.Error as e:
+        print(f"[ERROR] User profile listener failed: {str(e)}")
+        _profile_listener = None
+        reset_user_cache()
+        return
+    
+    if stale:
+        with _user_cache_lock:
+            for user_id in stale:
+                if _user_cache.pop(user_id, None) is not None:
+                    _user_cache_stats['invalidations'] += 1
+
+def user_cache_get(user_id: int) -> Optional[Dict[str, Any]]:
+    if USER_CACHE_TTL_SECONDS <= 0:
+        return None
+    
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry is None or entry['expires_at'] <= time.monotonic():
+            _user_cache_stats['misses'] += 1
+            return None
+        _user_cache.move_to_end(user_id)
+        _user_cache_stats['hits'] += 1
+        # Записи в кэше не меняются на месте: вызывающий получает копию, обновления идут через user_cache_touch
+        return {'user': dict(entry['user']), 'activity_at': entry['activity_at']}
+
+def user_cache_touch(user_id: int):
+    """Отметить записанную активность: last_activity обновлён, bot_blocked_at сброшен. Срок жизни записи не продлевается."""
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry is None:
+            return
+        user = dict(entry['user'])
+        user['bot_blocked_at'] = None
+        _user_cache[user_id] = {
+            'user': user,
+            'expires_at': entry['expires_at'],
+            'activity_at': time.monotonic()
+        }
+
+def user_cache_put(user: Dict[str, Any], activity_written: bool):
+    if USER_CACHE_TTL_SECONDS <= 0:
+        return
+    
+    now = time.monotonic()
+    with _user_cache_lock:
+        _user_cache[user['user_id']] = {
+            'user': user,
+            'expires_at': now + USER_CACHE_TTL_SECONDS,
+            'activity_at': now if activity_written else float('-inf')
+        }
+        _user_cache.move_to_end(user['user_id'])
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+            _user_cache_stats['evictions'] += 1
+
+def user_cache_metrics() -> Dict[str, Any]:
+    with _user_cache_lock:
+        metrics = dict(_user_cache_stats)
+        metrics['size'] = len(_user_cache)
+    lookups = metrics['hits'] + metrics['misses']
+    metrics['hit_rate'] = round(metrics['hits'] / lookups, 4) if lookups else None
+    return metrics
+
+@contextmanager
+def track_generation(conn):
+    """Время ожидания генерации: оно исключается из задержки обработчика, по которой сбрасывается нагрузка."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        conn.generation_ms = getattr(conn, 'generation_ms', 0.0) + (time.monotonic() - started) * 1000
+
+def record_update_latency(elapsed_ms: float):
+    # Среднее живёт в тёплом инстансе и копится по его последовательным вызовам
+    with _load_lock:
+        previous = _load['latency_ewma_ms']
+        if previous is None:
+            _load['latency_ewma_ms'] = elapsed_ms
+        else:
+            _load['latency_ewma_ms'] = previous + SHED_LATENCY_ALPHA * (elapsed_ms - previous)
+
+def shared_load(conn) -> Dict[str, int]:
+    """
+    Нагрузка по всем инстансам: генерации, отправленные провайдеру и ещё не завершённые, все заказы в работе
+    и соединения роли приложения. Запрос к БД не чаще раза в SHED_CHECK_TTL_SECONDS.
+    """
+    with _load_lock:
+        if time.monotonic() - _load['checked_at'] < SHED_CHECK_TTL_SECONDS:
+            return {name: _load[name] for name in ('inflight_generations', 'processing_orders', 'db_connections')}
+    
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT
+                COUNT(*) FILTER (WHERE external_task_id IS NOT NULL OR external_job_id IS NOT NULL) AS inflight_generations,
+                COUNT(*) AS processing_orders,
+                (SELECT COUNT(*) FROM pg_stat_activity
+                 WHERE usename = current_user AND datname = current_database()) AS db_connections
+            FROM t_p62125649_ai_video_bot.orders 
+            WHERE status = 'processing' 
+              AND created_at > CURRENT_TIMESTAMP - make_interval(mins => %s)
+        """, (SHED_PROCESSING_WINDOW_MINUTES,))
+        load = {name: int(value) for name, value in cur.fetchone().items()}
+    
+    with _load_lock:
+        _load.update(load)
+        _load['checked_at'] = time.monotonic()
+    return load
+
+def overload_reason(conn) -> Optional[str]:
+    if not SHED_ENABLED:
+        return None
+    
+    with _load_lock:
+        latency = _load['latency_ewma_ms']
+    if latency is not None and latency >= SHED_LATENCY_MS:
+        return 'latency'
+    
+    load = shared_load(conn)
+    if load['inflight_generations'] >= SHED_MAX_INFLIGHT_GENERATIONS:
+        return 'inflight_generations'
+    if load['processing_orders'] >= SHED_MAX_PROCESSING_ORDERS:
+        return 'processing_orders'
+    if load['db_connections'] >= SHED_MAX_DB_CONNECTIONS:
+        return 'db_connections'
+    return None
+
+def shed_generation(conn, chat_id: int, kind: str) -> bool:
+    """
+    Проверить перегрузку перед приёмом генерации. При перегрузке отвечает «попробуйте позже» и возвращает True;
+    состояние пользователя не трогается, поэтому шаг можно повторить.
+    """
+    reason = overload_reason(conn)
+    with _load_lock:
+        if reason:
+            _load['shed_by_reason'][reason] = _load['shed_by_reason'].get(reason, 0) + 1
+            _load['shed_by_kind'][kind] = _load['shed_by_kind'].get(kind, 0) + 1
+        else:
+            _load['admitted'] += 1
+    
+    if not reason:
+        return False
+    
+    print(f"[INFO] Shedding {kind} for chat {chat_id}: {reason}")
+    send_telegram_message(
+        chat_id,
+        f"⏳ Сейчас слишком много заказов на генерацию. Попробуйте через {SHED_RETRY_MINUTES} мин.",
+        main_menu_keyboard()
+    )
+    return True
+
+def generation_callback_kind(data: str) -> Optional[str]:
+    if data in GENERATION_CALLBACKS:
+        return data
+    if data.startswith('quality_'):
+        return 'text2video'
+    return None
+
+def load_metrics() -> Dict[str, Any]:
+    with _load_lock:
+        latency = _load['latency_ewma_ms']
+        return {
+            'latency_ewma_ms': round(latency, 1) if latency is not None else None,
+            'inflight_generations': _load['inflight_generations'],
+            'processing_orders': _load['processing_orders'],
+            'db_connections': _load['db_connections'],
+            'admitted': _load['admitted'],
+            'shed_by_reason': dict(_load['shed_by_reason']),
+            'shed_by_kind': dict(_load['shed_by_kind']),
+            'thresholds': {
+                'enabled': SHED_ENABLED,
+                'max_inflight_generations': SHED_MAX_INFLIGHT_GENERATIONS,
+                'max_processing_orders': SHED_MAX_PROCESSING_ORDERS,
+                'processing_window_minutes': SHED_PROCESSING_WINDOW_MINUTES,
+                'max_db_connections': SHED_MAX_DB_CONNECTIONS,
+                'latency_ms': SHED_LATENCY_MS,
+                'retry_minutes': SHED_RETRY_MINUTES
+            }
+        }
 
 def send_telegram_photo(chat_id: int, photo_url: str, caption: str = "", reply_markup: Optional[Dict] = None):
     """Отправить фото в Telegram"""
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto'
+    url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendPhoto'
     data = {'chat_id': chat_id, 'photo': photo_url, 'caption': caption, 'parse_mode': 'HTML'}
     if reply_markup:
         data['reply_markup'] = reply_markup
@@ -62,7 +449,7 @@ def send_telegram_photo(chat_id: int, photo_url: str, caption: str = "", reply_m
 
 def send_telegram_video(chat_id: int, video_url: str, caption: str = "", reply_markup: Optional[Dict] = None):
     """Отправить видео в Telegram"""
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendVideo'
+    url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendVideo'
     data = {'chat_id': chat_id, 'video': video_url, 'caption': caption, 'parse_mode': 'HTML'}
     if reply_markup:
         data['reply_markup'] = reply_markup
@@ -85,7 +472,7 @@ def send_telegram_video(chat_id: int, video_url: str, caption: str = "", reply_m
 
 def edit_telegram_message(chat_id: int, message_id: int, text: str, reply_markup: Optional[Dict] = None):
     """Редактировать сообщение"""
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/editMessageText'
+    url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/editMessageText'
     data = {'chat_id': chat_id, 'message_id': message_id, 'text': text, 'parse_mode': 'HTML'}
     if reply_markup:
         data['reply_markup'] = reply_markup
@@ -186,7 +573,7 @@ def wait_for_result(task_id: str, max_attempts: int = 30, delay: float = 2.0) ->
     """
     print(f"[DEBUG] wait_for_result: task_id={task_id}, max_attempts={max_attempts}")
     
-    status_url = f'https://api.kie.ai/api/v1/jobs/task/{task_id}'
+    status_url = f'{KIE_API_URL}/api/v1/jobs/task/{task_id}'
     
     for attempt in range(max_attempts):
         time.sleep(delay)
@@ -232,7 +619,7 @@ def wait_for_result(task_id: str, max_attempts: int = 30, delay: float = 2.0) ->
     return {'status': 'timeout', 'error': 'Timeout waiting for result'}
 
 def send_telegram_message(chat_id: int, text: str, reply_markup: Optional[Dict] = None):
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendMessage'
+    url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendMessage'
     data = {'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML'}
     if reply_markup:
         data['reply_markup'] = reply_markup
@@ -283,48 +670,54 @@ def topup_menu_keyboard():
 
 def check_rate_limit(conn, user_id: int, action_type: str, max_actions: int = 10) -> bool:
     with conn.cursor() as cur:
-        cur.execute("""
-            SELECT action_count, window_start 
-            FROM t_p62125649_ai_video_bot.rate_limits 
-            WHERE user_id = %s AND action_type = %s
-        """, (user_id, action_type))
+        execute_statement(cur, 'rate_limit_get', (user_id, action_type))
         
         result = cur.fetchone()
         now = datetime.now()
         
         if not result:
-            cur.execute("""
-                INSERT INTO t_p62125649_ai_video_bot.rate_limits (user_id, action_type, action_count, window_start)
-                VALUES (%s, %s, 1, %s)
-            """, (user_id, action_type, now))
+            execute_statement(cur, 'rate_limit_insert', (user_id, action_type, now))
             conn.commit()
             return True
         
         action_count, window_start = result
         
         if now - window_start > timedelta(minutes=1):
-            cur.execute("""
-                UPDATE t_p62125649_ai_video_bot.rate_limits 
-                SET action_count = 1, window_start = %s
-                WHERE user_id = %s AND action_type = %s
-            """, (now, user_id, action_type))
+            execute_statement(cur, 'rate_limit_reset', (user_id, action_type, now))
             conn.commit()
             return True
         
         if action_count >= max_actions:
             return False
         
-        cur.execute("""
-            UPDATE t_p62125649_ai_video_bot.rate_limits 
-            SET action_count = action_count + 1
-            WHERE user_id = %s AND action_type = %s
-        """, (user_id, action_type))
+        execute_statement(cur, 'rate_limit_increment', (user_id, action_type))
         conn.commit()
         return True
 
+def touch_last_activity(conn, user_id: int) -> bool:
+    with conn.cursor() as cur:
+        # Без условия каждое нажатие давало новую версию строки users и запись в WAL
+        execute_statement(cur, 'touch_last_activity', (user_id, LAST_ACTIVITY_GRANULARITY_SECONDS))
+        conn.commit()
+        return cur.rowcount > 0
+
 def get_or_create_user(conn, user_id: int, username: str, first_name: str) -> Dict:
+    """
+    Профиль для проверки блокировки и приветствия. Может прийти из кэша, поэтому баланс отсюда
+    нельзя использовать для списаний — они читают и меняют баланс в БД.
+    """
+    cached = user_cache_get(user_id)
+    if cached is not None:
+        user = cached['user']
+        if (time.monotonic() - cached['activity_at'] >= LAST_ACTIVITY_GRANULARITY_SECONDS
+                or user.get('bot_blocked_at') is not None):
+            touch_last_activity(conn, user_id)
+            user_cache_touch(user_id)
+            user['bot_blocked_at'] = None
+        return {'user': user, 'is_new': False}
+    
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("SELECT * FROM t_p62125649_ai_video_bot.users WHERE user_id = %s", (user_id,))
+        execute_statement(cur, 'user_by_id', (user_id,))
         user = cur.fetchone()
         
         if not user:
@@ -341,16 +734,16 @@ def get_or_create_user(conn, user_id: int, username: str, first_name: str) -> Di
             """, (user_id,))
             
             conn.commit()
+            user_cache_put(dict(user), activity_written=True)
             return {'user': dict(user), 'is_new': True}
-        
-        cur.execute("""
-            UPDATE t_p62125649_ai_video_bot.users 
-            SET last_activity = CURRENT_TIMESTAMP
-            WHERE user_id = %s
-        """, (user_id,))
-        conn.commit()
-        
-        return {'user': dict(user), 'is_new': False}
+    
+    touch_last_activity(conn, user_id)
+    profile = dict(user)
+    # bot_blocked_at только что сброшен в БД
+    profile['bot_blocked_at'] = None
+    user_cache_put(profile, activity_written=True)
+    
+    return {'user': dict(profile), 'is_new': False}
 
 def handle_start_command(conn, chat_id: int, user_id: int, username: str, first_name: str):
     user_info = get_or_create_user(conn, user_id, username, first_name)
@@ -369,7 +762,7 @@ def handle_start_command(conn, chat_id: int, user_id: int, username: str, first_
 
 def handle_balance(conn, chat_id: int, user_id: int):
     with conn.cursor() as cur:
-        cur.execute("SELECT balance FROM t_p62125649_ai_video_bot.users WHERE user_id = %s", (user_id,))
+        execute_statement(cur, 'user_balance', (user_id,))
         result = cur.fetchone()
         
         if result:
@@ -408,7 +801,7 @@ def handle_topup_stars(chat_id: int):
     send_telegram_message(chat_id, "⭐ Выберите количество звёзд:", keyboard)
 
 def send_invoice(chat_id: int, title: str, description: str, payload: str, currency: str, prices: list):
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendInvoice'
+    url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendInvoice'
     
     data = {
         'chat_id': chat_id,
@@ -501,7 +894,7 @@ def handle_help(chat_id: int):
 
 def handle_create_preview(conn, chat_id: int, user_id: int):
     with conn.cursor() as cur:
-        cur.execute("SELECT balance FROM t_p62125649_ai_video_bot.users WHERE user_id = %s", (user_id,))
+        execute_statement(cur, 'user_balance', (user_id,))
         result = cur.fetchone()
         
         if not result or result[0] < PREVIEW_COST:
@@ -533,7 +926,7 @@ def handle_create_textvideo(conn, chat_id: int, user_id: int):
 
 def handle_create_imagevideo(conn, chat_id: int, user_id: int):
     with conn.cursor() as cur:
-        cur.execute("SELECT balance FROM t_p62125649_ai_video_bot.users WHERE user_id = %s", (user_id,))
+        execute_statement(cur, 'user_balance', (user_id,))
         result = cur.fetchone()
         
         if not result or result[0] < 300:
@@ -552,7 +945,7 @@ def handle_create_imagevideo(conn, chat_id: int, user_id: int):
 
 def handle_create_storyboard(conn, chat_id: int, user_id: int):
     with conn.cursor() as cur:
-        cur.execute("SELECT balance FROM t_p62125649_ai_video_bot.users WHERE user_id = %s", (user_id,))
+        execute_statement(cur, 'user_balance', (user_id,))
         result = cur.fetchone()
         
         if not result or result[0] < 500:
@@ -581,7 +974,7 @@ def handle_preview_prompt(conn, chat_id: int, user_id: int, prompt: str):
     print(f"[DEBUG] handle_preview_prompt called for user {user_id}, prompt: {prompt}")
     
     with conn.cursor() as cur:
-        cur.execute("SELECT balance FROM t_p62125649_ai_video_bot.users WHERE user_id = %s", (user_id,))
+        execute_statement(cur, 'user_balance', (user_id,))
         result = cur.fetchone()
         
         if not result or result[0] < PREVIEW_COST:
@@ -607,7 +1000,7 @@ def handle_preview_prompt(conn, chat_id: int, user_id: int, prompt: str):
             VALUES (%s, %s, 'preview', 'Списание за превью', %s)
         """, (user_id, -PREVIEW_COST, order_id))
         
-        cur.execute("DELETE FROM t_p62125649_ai_video_bot.user_states WHERE user_id = %s", (user_id,))
+        execute_statement(cur, 'clear_user_state', (user_id,))
         conn.commit()
     
     wait_msg = send_telegram_message(chat_id, "⏳ Генерирую превью... Это займёт несколько секунд.")
@@ -624,7 +1017,8 @@ def handle_preview_prompt(conn, chat_id: int, user_id: int, prompt: str):
             """, (api_task_id, task_id))
             conn.commit()
         
-        result = wait_for_result(api_task_id)
+        with track_generation(conn):
+            result = wait_for_result(api_task_id)
         
         if result['status'] == 'success' and result.get('image_url'):
             image_url = result['image_url']
@@ -660,6 +1054,11 @@ def handle_preview_prompt(conn, chat_id: int, user_id: int, prompt: str):
                 WHERE task_id = %s
             """, (str(e), task_id))
             cur.execute("UPDATE t_p62125649_ai_video_bot.users SET balance = balance + %s WHERE user_id = %s", (PREVIEW_COST, user_id))
+            cur.execute("""
+                INSERT INTO t_p62125649_ai_video_bot.transactions 
+                (user_id, amount, type, description, order_id)
+                VALUES (%s, %s, 'refund', 'Возврат за ошибку генерации', %s)
+            """, (user_id, PREVIEW_COST, order_id))
             conn.commit()
         
         if wait_msg_id:
@@ -707,81 +1106,110 @@ def handle_duration_selection(conn, chat_id: int, user_id: int, duration: int):
     }
     send_telegram_message(chat_id, f"🎨 Выберите качество:", keyboard)
 
-def handle_quality_selection(conn, chat_id: int, user_id: int, quality: str):
+def reserve_video_order(conn, user_id: int, quality: str) -> Dict[str, Any]:
+    """
+    Списать кредиты и создать заказ text-to-video одной транзакцией.
+    Возвращает параметры заказа или {'error': текст для пользователя}.
+    """
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("""
-            SELECT temp_prompt, temp_duration FROM t_p62125649_ai_video_bot.user_states 
-            WHERE user_id = %s
-        """, (user_id,))
+        execute_statement(cur, 'user_state_temp', (user_id,))
         state = cur.fetchone()
         
         if not state:
-            send_telegram_message(chat_id, "❌ Ошибка. Начните заново.", main_menu_keyboard())
-            return
+            return {'error': "❌ Ошибка. Начните заново."}
         
         prompt = state['temp_prompt']
         duration = state['temp_duration']
         cost = VIDEO_COSTS[duration][quality]
         
-        cur.execute("SELECT balance FROM t_p62125649_ai_video_bot.users WHERE user_id = %s", (user_id,))
+        execute_statement(cur, 'user_balance', (user_id,))
         result = cur.fetchone()
         
         if not result or result['balance'] < cost:
-            send_telegram_message(chat_id, "❌ Недостаточно кредитов. Пополните баланс.", main_menu_keyboard())
-            return
+            return {'error': "❌ Недостаточно кредитов. Пополните баланс."}
         
-        cur.execute("UPDATE t_p62125649_ai_video_bot.users SET balance = balance - %s WHERE user_id = %s", (cost, user_id))
+        execute_statement(cur, 'debit_balance', (user_id, cost))
         
         task_id = f'video_{user_id}_{int(datetime.now().timestamp())}'
         
-        cur.execute("""
-            INSERT INTO t_p62125649_ai_video_bot.orders 
-            (user_id, order_type, prompt, duration, quality, status, cost, task_id)
-            VALUES (%s, 'text-to-video', %s, %s, %s, 'processing', %s, %s)
-            RETURNING order_id
-        """, (user_id, prompt, duration, quality, cost, task_id))
+        execute_statement(cur, 'video_order_insert', (user_id, prompt, duration, quality, cost, task_id))
         
         order_id = cur.fetchone()['order_id']
         
+        execute_statement(cur, 'order_ledger_insert', (user_id, -cost, f'Списание за видео {duration}с {quality}', order_id))
+        
+        execute_statement(cur, 'clear_user_state', (user_id,))
+        conn.commit()
+    
+    return {
+        'task_id': task_id,
+        'order_id': order_id,
+        'prompt': prompt,
+        'duration': duration,
+        'quality': quality,
+        'cost': cost
+    }
+
+def set_order_external_task(conn, task_id: str, api_task_id: str):
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE t_p62125649_ai_video_bot.orders 
+            SET external_task_id = %s
+            WHERE task_id = %s
+        """, (api_task_id, task_id))
+        conn.commit()
+
+def complete_video_order(conn, task_id: str, video_url: str):
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE t_p62125649_ai_video_bot.orders 
+            SET status = 'completed', result_url = %s, completed_at = CURRENT_TIMESTAMP
+            WHERE task_id = %s
+        """, (video_url, task_id))
+        conn.commit()
+
+def fail_video_order(conn, user_id: int, order: Dict[str, Any], error: str):
+    """Пометить заказ ошибочным и вернуть кредиты"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE t_p62125649_ai_video_bot.orders 
+            SET status = 'failed', error_message = %s
+            WHERE task_id = %s
+        """, (error, order['task_id']))
+        cur.execute("UPDATE t_p62125649_ai_video_bot.users SET balance = balance + %s WHERE user_id = %s", (order['cost'], user_id))
         cur.execute("""
             INSERT INTO t_p62125649_ai_video_bot.transactions 
             (user_id, amount, type, description, order_id)
-            VALUES (%s, %s, 'video', %s, %s)
-        """, (user_id, -cost, f'Списание за видео {duration}с {quality}', order_id))
-        
-        cur.execute("DELETE FROM t_p62125649_ai_video_bot.user_states WHERE user_id = %s", (user_id,))
+            VALUES (%s, %s, 'refund', 'Возврат за ошибку генерации', %s)
+        """, (user_id, order['cost'], order['order_id']))
         conn.commit()
+
+def handle_quality_selection(conn, chat_id: int, user_id: int, quality: str):
+    order = reserve_video_order(conn, user_id, quality)
+    if 'error' in order:
+        send_telegram_message(chat_id, order['error'], main_menu_keyboard())
+        return
     
+    duration = order['duration']
     wait_msg = send_telegram_message(chat_id, f"⏳ Генерирую видео {duration}с ({quality})... Это займёт 1-2 минуты.")
     wait_msg_id = wait_msg.get('result', {}).get('message_id') if wait_msg else None
     
     try:
         api_task_id = start_generation("text2video", {
-            "prompt": prompt,
+            "prompt": order['prompt'],
             "duration": duration,
             "quality": quality
         })
         
-        with conn.cursor() as cur:
-            cur.execute("""
-                UPDATE t_p62125649_ai_video_bot.orders 
-                SET external_task_id = %s
-                WHERE task_id = %s
-            """, (api_task_id, task_id))
-            conn.commit()
+        set_order_external_task(conn, order['task_id'], api_task_id)
         
-        result = wait_for_result(api_task_id, max_attempts=60, delay=2.0)
+        with track_generation(conn):
+            result = wait_for_result(api_task_id, max_attempts=60, delay=2.0)
         
         if result['status'] == 'success' and result.get('video_url'):
             video_url = result['video_url']
             
-            with conn.cursor() as cur:
-                cur.execute("""
-                    UPDATE t_p62125649_ai_video_bot.orders 
-                    SET status = 'completed', result_url = %s, completed_at = CURRENT_TIMESTAMP
-                    WHERE task_id = %s
-                """, (video_url, task_id))
-                conn.commit()
+            complete_video_order(conn, order['task_id'], video_url)
             
             if wait_msg_id:
                 edit_telegram_message(chat_id, wait_msg_id, "✅ Видео готово!")
@@ -797,36 +1225,172 @@ def handle_quality_selection(conn, chat_id: int, user_id: int, quality: str):
     except Exception as e:
         print(f"[ERROR] Video generation error: {str(e)}")
         
-        with conn.cursor() as cur:
-            cur.execute("""
-                UPDATE t_p62125649_ai_video_bot.orders 
-                SET status = 'failed', error_message = %s
-                WHERE task_id = %s
-            """, (str(e), task_id))
-            cur.execute("UPDATE t_p62125649_ai_video_bot.users SET balance = balance + %s WHERE user_id = %s", (cost, user_id))
-            conn.commit()
+        fail_video_order(conn, user_id, order, str(e))
         
         if wait_msg_id:
             edit_telegram_message(chat_id, wait_msg_id, "❌ Ошибка генерации. Кредиты возвращены.")
         else:
             send_telegram_message(chat_id, "❌ Ошибка генерации. Кредиты возвращены.", main_menu_keyboard())
 
-def get_telegram_file_url(file_id: str) -> str:
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/getFile'
+_file_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# Ссылки на уже выложенные картинки живут столько же, сколько кэш getFile:
+# объект могут удалить правила жизненного цикла хранилища, и тогда его нужно выложить заново
+_staged_images: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_file_cache_lock = threading.Lock()
+_ingest_stats = {'getfile_calls': 0, 'getfile_cached': 0, 'downloads': 0, 'dedup_hits': 0, 'uploads': 0}
+
+def count_ingest(name: str):
+    with _file_cache_lock:
+        _ingest_stats[name] += 1
+
+def pick_photo_size(photo: list, min_long_side: int = PHOTO_MIN_LONG_SIDE) -> Dict[str, Any]:
+    """
+    Выбрать самый маленький размер фото, у которого длинная сторона не меньше min_long_side.
+    Если таких нет — самый большой из присланных.
+    """
+    sizes = sorted(photo, key=lambda size: size.get('width', 0) * size.get('height', 0))
+    for size in sizes:
+        if max(size.get('width', 0), size.get('height', 0)) >= min_long_side:
+            return size
+    return sizes[-1]
+
+def get_telegram_file_path(file_id: str, file_unique_id: Optional[str] = None) -> str:
+    """file_path из getFile; кэшируется по file_unique_id, который не меняется между сообщениями и ботами."""
+    cache_key = file_unique_id or file_id
+    now = time.monotonic()
+    with _file_cache_lock:
+        entry = _file_cache.get(cache_key)
+        if entry and entry['expires_at'] > now:
+            _file_cache.move_to_end(cache_key)
+            _ingest_stats['getfile_cached'] += 1
+            return entry['file_path']
+    
+    url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/getFile'
     data = {'file_id': file_id}
     req = urllib.request.Request(url, data=json.dumps(data).encode('utf-8'), headers={'Content-Type': 'application/json'})
     with urllib.request.urlopen(req) as response:
         result = json.loads(response.read().decode('utf-8'))
-        file_path = result['result']['file_path']
-        return f'https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}'
+    file_path = result['result']['file_path']
+    count_ingest('getfile_calls')
+    
+    with _file_cache_lock:
+        _file_cache[cache_key] = {'file_path': file_path, 'expires_at': now + TELEGRAM_FILE_CACHE_TTL_SECONDS}
+        _file_cache.move_to_end(cache_key)
+        while len(_file_cache) > TELEGRAM_FILE_CACHE_SIZE:
+            _file_cache.popitem(last=False)
+    return file_path
+
+def get_telegram_file_url(file_id: str, file_unique_id: Optional[str] = None) -> str:
+    file_path = get_telegram_file_path(file_id, file_unique_id)
+    return f'{TELEGRAM_API_URL}/file/bot{BOT_TOKEN}/{file_path}'
+
+def remember_staged_image(key: str, public_url: str):
+    with _file_cache_lock:
+        _staged_images[key] = {'url': public_url, 'expires_at': time.monotonic() + TELEGRAM_FILE_CACHE_TTL_SECONDS}
+        _staged_images.move_to_end(key)
+        while len(_staged_images) > TELEGRAM_FILE_CACHE_SIZE:
+            _staged_images.popitem(last=False)
+
+def get_staged_image(key: str) -> Optional[str]:
+    with _file_cache_lock:
+        entry = _staged_images.get(key)
+        if entry is None:
+            return None
+        if entry['expires_at'] <= time.monotonic():
+            del _staged_images[key]
+            return None
+        return entry['url']
+
+def stage_image(content: bytes, extension: str) -> str:
+    """
+    Положить картинку по адресу images/<sha256>.<ext> и вернуть публичную ссылку.
+    Одинаковые картинки попадают в один объект, повторная загрузка пропускается.
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    key = f'images/{digest}{extension}'
+    public_url = f'{PHOTO_PUBLIC_BASE_URL}/{key}'
+    
+    staged = get_staged_image(key)
+    if staged:
+        count_ingest('dedup_hits')
+        return staged
+    
+    if PHOTO_STAGING_DIR:
+        path = os.path.join(PHOTO_STAGING_DIR, key)
+        if os.path.exists(path):
+            count_ingest('dedup_hits')
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            count_ingest('uploads')
+    else:
+        headers = {'Content-Type': 'image/jpeg' if extension in ('.jpg', '.jpeg') else 'application/octet-stream'}
+        if PHOTO_STAGING_AUTH_HEADER:
+            name, _, value = PHOTO_STAGING_AUTH_HEADER.partition(':')
+            headers[name.strip()] = value.strip()
+        
+        object_url = f'{PHOTO_STAGING_UPLOAD_URL}/{key}'
+        try:
+            head = urllib.request.Request(object_url, headers=headers, method='HEAD')
+            with urllib.request.urlopen(head, timeout=10):
+                count_ingest('dedup_hits')
+        except urllib.error.HTTPError as e:
+            if e.code != 404:
+                raise
+            req = urllib.request.Request(object_url, data=content, headers=headers, method='PUT')
+            with urllib.request.urlopen(req, timeout=30):
+                count_ingest('uploads')
+    
+    remember_staged_image(key, public_url)
+    return public_url
+
+def ingest_photo(photo: list) -> str:
+    """
+    Подготовить фото из сообщения для API генерации и вернуть ссылку на него.
+    Если хранилище не настроено, возвращается ссылка getFile (в ней токен бота).
+    """
+    size = pick_photo_size(photo)
+    file_id = size['file_id']
+    file_unique_id = size.get('file_unique_id')
+    print(f"[DEBUG] Picked photo size {size.get('width')}x{size.get('height')} of {len(photo)}")
+    
+    if not PHOTO_PUBLIC_BASE_URL or not (PHOTO_STAGING_DIR or PHOTO_STAGING_UPLOAD_URL):
+        print("[INFO] Photo staging is not configured, passing Telegram file URL")
+        return get_telegram_file_url(file_id, file_unique_id)
+    
+    if file_unique_id:
+        staged = get_staged_image(f'unique/{file_unique_id}')
+        if staged:
+            count_ingest('dedup_hits')
+            return staged
+    
+    file_path = get_telegram_file_path(file_id, file_unique_id)
+    try:
+        with urllib.request.urlopen(f'{TELEGRAM_API_URL}/file/bot{BOT_TOKEN}/{file_path}', timeout=30) as response:
+            content = response.read()
+        count_ingest('downloads')
+        public_url = stage_image(content, os.path.splitext(file_path)[1].lower() or '.jpg')
+    except (urllib.error.URLError, OSError) as e:
+        # Заказ важнее: без хранилища генерация всё равно пойдёт по ссылке Telegram
+        print(f"[ERROR] Photo staging failed, falling back to Telegram file URL: {str(e)}")
+        return f'{TELEGRAM_API_URL}/file/bot{BOT_TOKEN}/{file_path}'
+    
+    if file_unique_id:
+        remember_staged_image(f'unique/{file_unique_id}', public_url)
+    return public_url
+
+def ingest_metrics() -> Dict[str, Any]:
+    with _file_cache_lock:
+        return dict(_ingest_stats, file_cache_size=len(_file_cache), staged_images=len(_staged_images))
 
 def handle_image_to_video_photo(conn, chat_id: int, user_id: int, photo: list):
-    file_id = photo[-1]['file_id']
-    image_url = get_telegram_file_url(file_id)
     cost = 300
     
     with conn.cursor() as cur:
-        cur.execute("SELECT balance FROM t_p62125649_ai_video_bot.users WHERE user_id = %s", (user_id,))
+        execute_statement(cur, 'user_balance', (user_id,))
         result = cur.fetchone()
         
         if not result or result[0] < cost:
@@ -851,12 +1415,16 @@ def handle_image_to_video_photo(conn, chat_id: int, user_id: int, photo: list):
             VALUES (%s, %s, 'video', 'Списание за image-to-video', %s)
         """, (user_id, -cost, order_id))
         
-        cur.execute("DELETE FROM t_p62125649_ai_video_bot.user_states WHERE user_id = %s", (user_id,))
+        execute_statement(cur, 'clear_user_state', (user_id,))
         conn.commit()
     
     send_telegram_message(chat_id, "⏳ Создаю видео из вашей картинки...")
     
     try:
+        # Фото скачивается и выкладывается только после списания: без кредитов хранилище не трогаем,
+        # а любой сбой приёма фото возвращает кредиты, как и сбой API генерации
+        image_url = ingest_photo(photo)
+        
         request_data = {
             'model': GEN_MODEL_IMAGE2VIDEO,
             'callbackUrl': GEN_CALLBACK_URL,
@@ -892,6 +1460,8 @@ def handle_image_to_video_photo(conn, chat_id: int, user_id: int, photo: list):
             else:
                 raise Exception("Invalid API response")
     except Exception as e:
+        print(f"[ERROR] Image-to-video order failed: {str(e)}")
+        
         with conn.cursor() as cur:
             cur.execute("""
                 UPDATE t_p62125649_ai_video_bot.orders 
@@ -899,6 +1469,11 @@ def handle_image_to_video_photo(conn, chat_id: int, user_id: int, photo: list):
                 WHERE task_id = %s
             """, (str(e), task_id))
             cur.execute("UPDATE t_p62125649_ai_video_bot.users SET balance = balance + %s WHERE user_id = %s", (cost, user_id))
+            cur.execute("""
+                INSERT INTO t_p62125649_ai_video_bot.transactions 
+                (user_id, amount, type, description, order_id)
+                VALUES (%s, %s, 'refund', 'Возврат за ошибку генерации', %s)
+            """, (user_id, cost, order_id))
             conn.commit()
         
         send_telegram_message(chat_id, "❌ Ошибка создания заказа. Кредиты возвращены.", main_menu_keyboard())
@@ -926,9 +1501,12 @@ def handle_storyboard_scene_input(conn, chat_id: int, user_id: int, text: str, s
             
             send_telegram_message(chat_id, f"Сцена {current_scene} сохранена!\n\nОпишите сцену {current_scene + 1}:")
         else:
+            if shed_generation(conn, chat_id, 'storyboard'):
+                return
+            
             cost = 500
             
-            cur.execute("SELECT balance FROM t_p62125649_ai_video_bot.users WHERE user_id = %s", (user_id,))
+            execute_statement(cur, 'user_balance', (user_id,))
             balance_result = cur.fetchone()
             
             if not balance_result or balance_result['balance'] < cost:
@@ -953,7 +1531,7 @@ def handle_storyboard_scene_input(conn, chat_id: int, user_id: int, text: str, s
                 VALUES (%s, %s, 'video', 'Списание за storyboard', %s)
             """, (user_id, -cost, order_id))
             
-            cur.execute("DELETE FROM t_p62125649_ai_video_bot.user_states WHERE user_id = %s", (user_id,))
+            execute_statement(cur, 'clear_user_state', (user_id,))
             conn.commit()
             
             send_telegram_message(chat_id, f"⏳ Создаю сториборд из {total_scenes} сцен...")
@@ -996,10 +1574,23 @@ def handle_storyboard_scene_input(conn, chat_id: int, user_id: int, text: str, s
                     WHERE task_id = %s
                 """, (str(e), task_id))
                 cur.execute("UPDATE t_p62125649_ai_video_bot.users SET balance = balance + %s WHERE user_id = %s", (cost, user_id))
+                cur.execute("""
+                    INSERT INTO t_p62125649_ai_video_bot.transactions 
+                    (user_id, amount, type, description, order_id)
+                    VALUES (%s, %s, 'refund', 'Возврат за ошибку создания заказа', %s)
+                """, (user_id, cost, order_id))
                 conn.commit()
                 
                 send_telegram_message(chat_id, "❌ Ошибка создания заказа. Кредиты возвращены.", main_menu_keyboard())
 
+def answer_callback_query(callback_id: str, text: Optional[str] = None):
+    url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/answerCallbackQuery'
+    req_data = {'callback_query_id': callback_id}
+    if text:
+        req_data['text'] = text
+    req = urllib.request.Request(url, data=json.dumps(req_data).encode('utf-8'), headers={'Content-Type': 'application/json'})
+    urllib.request.urlopen(req)
+
 def handle_callback_query(conn, callback_query: Dict):
     callback_id = callback_query['id']
     user_id = callback_query['from']['id']
@@ -1009,10 +1600,7 @@ def handle_callback_query(conn, callback_query: Dict):
     first_name = callback_query['from'].get('first_name', 'User')
     
     if not check_rate_limit(conn, user_id, 'callback'):
-        url = f'https://api.telegram.org/bot{BOT_TOKEN}/answerCallbackQuery'
-        req_data = {'callback_query_id': callback_id, 'text': '⚠️ Слишком много запросов'}
-        req = urllib.request.Request(url, data=json.dumps(req_data).encode('utf-8'), headers={'Content-Type': 'application/json'})
-        urllib.request.urlopen(req)
+        answer_callback_query(callback_id, '⚠️ Слишком много запросов')
         return
     
     user_info = get_or_create_user(conn, user_id, username, first_name)
@@ -1020,10 +1608,15 @@ def handle_callback_query(conn, callback_query: Dict):
         send_telegram_message(chat_id, "🚫 Ваш аккаунт заблокирован")
         return
     
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/answerCallbackQuery'
-    req = urllib.request.Request(url, data=json.dumps({'callback_query_id': callback_id}).encode('utf-8'), headers={'Content-Type': 'application/json'})
-    urllib.request.urlopen(req)
+    answer_callback_query(callback_id)
     
+    kind = generation_callback_kind(data)
+    if kind and shed_generation(conn, chat_id, kind):
+        return
+    
+    dispatch_callback(conn, chat_id, user_id, data)
+
+def dispatch_callback(conn, chat_id: int, user_id: int, data: str):
     if data == 'main_create':
         send_telegram_message(chat_id, "🎬 <b>Выберите тип контента:</b>", create_menu_keyboard())
     elif data == 'main_balance':
@@ -1034,7 +1627,7 @@ def handle_callback_query(conn, callback_query: Dict):
         handle_help(chat_id)
     elif data == 'back_to_main':
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM t_p62125649_ai_video_bot.user_states WHERE user_id = %s", (user_id,))
+            execute_statement(cur, 'clear_user_state', (user_id,))
             conn.commit()
         send_telegram_message(chat_id, "Главное меню:", main_menu_keyboard())
     elif data == 'create_preview':
@@ -1095,7 +1688,7 @@ def handle_message(conn, message: Dict):
         return
     
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("SELECT state, temp_data FROM t_p62125649_ai_video_bot.user_states WHERE user_id = %s", (user_id,))
+        execute_statement(cur, 'user_state', (user_id,))
         state = cur.fetchone()
     
     print(f"[DEBUG] User {user_id} state: {state}")
@@ -1108,11 +1701,15 @@ def handle_message(conn, message: Dict):
     print(f"[DEBUG] Processing state: {current_state}")
     
     if current_state == 'waiting_preview_prompt':
+        if shed_generation(conn, chat_id, 'preview'):
+            return
         print(f"[DEBUG] Calling handle_preview_prompt with text: {text}")
         handle_preview_prompt(conn, chat_id, user_id, text)
     elif current_state == 'waiting_textvideo_prompt':
         handle_textvideo_prompt(conn, chat_id, user_id, text)
     elif current_state == 'waiting_image_to_video' and photo:
+        if shed_generation(conn, chat_id, 'image2video'):
+            return
         handle_image_to_video_photo(conn, chat_id, user_id, photo)
     elif current_state.startswith('waiting_storyboard_scene_'):
         handle_storyboard_scene_input(conn, chat_id, user_id, text, state)
@@ -1120,9 +1717,142 @@ def handle_message(conn, message: Dict):
         print(f"[DEBUG] Unknown state: {current_state}")
         send_telegram_message(chat_id, "Используйте кнопки для выбора:", main_menu_keyboard())
 
+def process_update(body: Dict[str, Any]):
+    drain_user_invalidations()
+    started = time.monotonic()
+    conn = get_db_connection()
+    broken = True
+    try:
+        if 'message' in body:
+            print(f"[DEBUG] Processing message from user {body['message']['from']['id']}")
+            handle_message(conn, body['message'])
+        elif 'callback_query' in body:
+            print(f"[DEBUG] Processing callback_query: {body['callback_query'].get('data')}")
+            handle_callback_query(conn, body['callback_query'])
+        else:
+            print(f"[DEBUG] Unknown update type: {list(body.keys())}")
+        broken = False
+    finally:
+        record_update_latency((time.monotonic() - started) * 1000 - conn.generation_ms)
+        release_db_connection(conn, broken)
+
+async def sent_message_id(task) -> Optional[int]:
+    try:
+        sent = await task
+    except Exception as e:
+        print(f"[ERROR] Wait message failed: {str(e)}")
+        return None
+    return sent.get('result', {}).get('message_id') if sent else None
+
+async def handle_quality_selection_async(conn, chat_id: int, user_id: int, quality: str):
+    """
+    То же, что handle_quality_selection, но сообщение ожидания уходит одновременно с запуском генерации,
+    а отметка о готовности заказа пишется одновременно с правкой этого сообщения.
+    Видео отправляется только после записи статуса, чтобы сбой БД не оставил видео без списания.
+    """
+    order = await run_io(reserve_video_order, conn, user_id, quality)
+    if 'error' in order:
+        await run_io(send_telegram_message, chat_id, order['error'], main_menu_keyboard())
+        return
+    
+    duration = order['duration']
+    wait_task = asyncio.ensure_future(run_io(
+        send_telegram_message, chat_id, f"⏳ Генерирую видео {duration}с ({quality})... Это займёт 1-2 минуты."
+    ))
+    
+    try:
+        api_task_id = await run_io(start_generation, "text2video", {
+            "prompt": order['prompt'],
+            "duration": duration,
+            "quality": quality
+        })
+        
+        await run_io(set_order_external_task, conn, order['task_id'], api_task_id)
+        
+        with track_generation(conn):
+            result = await run_io(wait_for_result, api_task_id, max_attempts=60, delay=2.0)
+        
+        if result['status'] == 'success' and result.get('video_url'):
+            video_url = result['video_url']
+            wait_msg_id = await sent_message_id(wait_task)
+            
+            steps = [run_io(complete_video_order, conn, order['task_id'], video_url)]
+            if wait_msg_id:
+                steps.append(run_io(edit_telegram_message, chat_id, wait_msg_id, "✅ Видео готово!"))
+            await asyncio.gather(*steps)
+            
+            await run_io(send_telegram_video, chat_id, video_url, f"Ваше видео {duration}с", main_menu_keyboard())
+            print(f"[SUCCESS] Video sent to user {user_id}: {video_url}")
+        
+        elif result['status'] == 'failed':
+            raise Exception(f"Generation failed: {result.get('error', 'Unknown error')}")
+        else:
+            raise Exception("Timeout waiting for video generation")
+    
+    except Exception as e:
+        print(f"[ERROR] Video generation error: {str(e)}")
+        
+        await run_io(fail_video_order, conn, user_id, order, str(e))
+        
+        wait_msg_id = await sent_message_id(wait_task)
+        if wait_msg_id:
+            await run_io(edit_telegram_message, chat_id, wait_msg_id, "❌ Ошибка генерации. Кредиты возвращены.")
+        else:
+            await run_io(send_telegram_message, chat_id, "❌ Ошибка генерации. Кредиты возвращены.", main_menu_keyboard())
+
+async def handle_callback_query_async(conn, callback_query: Dict):
+    callback_id = callback_query['id']
+    user_id = callback_query['from']['id']
+    chat_id = callback_query['message']['chat']['id']
+    data = callback_query['data']
+    username = callback_query['from'].get('username', '')
+    first_name = callback_query['from'].get('first_name', 'User')
+    
+    if not await run_io(check_rate_limit, conn, user_id, 'callback'):
+        await run_io(answer_callback_query, callback_id, '⚠️ Слишком много запросов')
+        return
+    
+    # Ответ на нажатие не зависит от профиля: Telegram убирает «часики» с кнопки, пока читаем пользователя
+    user_info, _ = await asyncio.gather(
+        run_io(get_or_create_user, conn, user_id, username, first_name),
+        run_io(answer_callback_query, callback_id)
+    )
+    if user_info['user'].get('is_blocked'):
+        await run_io(send_telegram_message, chat_id, "🚫 Ваш аккаунт заблокирован")
+        return
+    
+    kind = generation_callback_kind(data)
+    if kind and await run_io(shed_generation, conn, chat_id, kind):
+        return
+    
+    if data.startswith('quality_'):
+        await handle_quality_selection_async(conn, chat_id, user_id, data.split('_')[1])
+    else:
+        await run_io(dispatch_callback, conn, chat_id, user_id, data)
+
+async def process_update_async(body: Dict[str, Any]):
+    """Асинхронный вариант process_update: тот же порядок записей в БД, но независимые вызовы Telegram и kie.ai перекрываются."""
+    await run_io(drain_user_invalidations)
+    started = time.monotonic()
+    conn = await run_io(get_db_connection)
+    broken = True
+    try:
+        if 'message' in body:
+            print(f"[DEBUG] Processing message from user {body['message']['from']['id']}")
+            await run_io(handle_message, conn, body['message'])
+        elif 'callback_query' in body:
+            print(f"[DEBUG] Processing callback_query: {body['callback_query'].get('data')}")
+            await handle_callback_query_async(conn, body['callback_query'])
+        else:
+            print(f"[DEBUG] Unknown update type: {list(body.keys())}")
+        broken = False
+    finally:
+        record_update_latency((time.monotonic() - started) * 1000 - conn.generation_ms)
+        await run_io(release_db_connection, conn, broken)
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method = event.get('httpMethod', 'POST')
-    params = event.get('queryStringParameters', {})
+    params = event.get('queryStringParameters') or {}
     
     if method == 'OPTIONS':
         return {
@@ -1140,9 +1870,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if method == 'GET':
         action = params.get('action')
         
+        if action == 'metrics':
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'user_cache': user_cache_metrics(), 'load': load_metrics(), 'ingest': ingest_metrics()})
+            }
+        
         if action == 'info':
             try:
-                url = f'https://api.telegram.org/bot{BOT_TOKEN}/getWebhookInfo'
+                url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/getWebhookInfo'
                 req = urllib.request.Request(url)
                 
                 with urllib.request.urlopen(req) as response:
@@ -1164,7 +1902,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         if action == 'setup':
             try:
-                url = f'https://api.telegram.org/bot{BOT_TOKEN}/setWebhook'
+                url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/setWebhook'
                 webhook_data = {
                     'url': 'https://functions.poehali.dev/bb7d0a58-b8cf-4320-9a8e-000f952266d9',
                     'allowed_updates': ['message', 'callback_query']
@@ -1197,18 +1935,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         body = json.loads(event.get('body', '{}'))
         print(f"[DEBUG] Received update: {json.dumps(body)}")
         
-        conn = get_db_connection()
-        
-        if 'message' in body:
-            print(f"[DEBUG] Processing message from user {body['message']['from']['id']}")
-            handle_message(conn, body['message'])
-        elif 'callback_query' in body:
-            print(f"[DEBUG] Processing callback_query: {body['callback_query'].get('data')}")
-            handle_callback_query(conn, body['callback_query'])
+        if HANDLER_MODE == 'async':
+            asyncio.run(process_update_async(body))
         else:
-            print(f"[DEBUG] Unknown update type: {list(body.keys())}")
-        
-        conn.close()
+            process_update(body)
         
         return {
             'statusCode': 200,
@@ -1226,4 +1956,123 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {'Content-Type': 'application/json'},
             'isBase64Encoded': False,
             'body': json.dumps({'ok': True, 'error': str(e)})
-        }
\ No newline at end of file
+        }
+
+def check_user_cache_cli(args):
+    '''
+    Проверка согласованности кэша профилей на живой БД:
+    python index.py check-user-cache --user-id 123456789
+    Дважды переключает is_blocked пользователя другим соединением и проверяет, что кэш видит каждое изменение.
+    '''
+    drain_user_invalidations()
+    conn = psycopg2.connect(DATABASE_URL)
+    writer = psycopg2.connect(DATABASE_URL)
+    failures = []
+    
+    try:
+        original = get_or_create_user(conn, args.user_id, '', 'User')['user']
+        if user_cache_get(args.user_id) is None:
+            failures.append('profile was not cached after the first read')
+        
+        expected = original.get('is_blocked')
+        for _ in range(2):
+            with writer.cursor() as cur:
+                cur.execute("""
+                    UPDATE t_p62125649_ai_video_bot.users SET is_blocked = NOT COALESCE(is_blocked, FALSE)
+                    WHERE user_id = %s
+                    RETURNING is_blocked
+                """, (args.user_id,))
+                expected = cur.fetchone()[0]
+                writer.commit()
+            
+            deadline = time.monotonic() + args.timeout
+            seen = None
+            while time.monotonic() < deadline:
+                drain_user_invalidations()
+                seen = get_or_create_user(conn, args.user_id, '', 'User')['user'].get('is_blocked')
+                if seen == expected:
+                    break
+                time.sleep(0.05)
+            if seen != expected:
+                failures.append(f'is_blocked={expected} not visible within {args.timeout}s (cache returned {seen})')
+    finally:
+        conn.close()
+        writer.close()
+    
+    print(f"[CACHE] metrics: {json.dumps(user_cache_metrics())}")
+    for failure in failures:
+        print(f"[CACHE] FAIL: {failure}")
+    print("[CACHE] OK" if not failures else "[CACHE] FAILED")
+    return 1 if failures else 0
+
+def bench_statements_cli(args):
+    '''
+    Сравнение обычных и подготовленных запросов горячего пути на живой БД:
+    python index.py bench-statements --user-id 123456789 --runs 500
+    Прогоняет запросы одного нажатия (профиль, rate limit, состояние, баланс, списание с заказом) в транзакции,
+    которая откатывается, и печатает медиану и p95 на прогон для каждого режима.
+    '''
+    global PREPARED_STATEMENTS_ENABLED
+    
+    def one_update(cur):
+        execute_statement(cur, 'user_by_id', (args.user_id,))
+        execute_statement(cur, 'touch_last_activity', (args.user_id, 0))
+        execute_statement(cur, 'rate_limit_get', (args.user_id, 'bench'))
+        execute_statement(cur, 'user_state', (args.user_id,))
+        execute_statement(cur, 'user_balance', (args.user_id,))
+        execute_statement(cur, 'debit_balance', (args.user_id, 0))
+        execute_statement(cur, 'video_order_insert', (args.user_id, 'bench', 5, 'standard', 0, 'bench'))
+        order_id = cur.fetchone()['order_id']
+        execute_statement(cur, 'order_ledger_insert', (args.user_id, 0, 'bench', order_id))
+    
+    results = {}
+    for mode in ('plain', 'prepared'):
+        PREPARED_STATEMENTS_ENABLED = mode == 'prepared'
+        conn = psycopg2.connect(DATABASE_URL, connection_factory=PreparedConnection)
+        timings = []
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                for run in range(args.warmup + args.runs):
+                    started = time.perf_counter()
+                    one_update(cur)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    conn.rollback()
+                    if run >= args.warmup:
+                        timings.append(elapsed)
+        finally:
+            conn.close()
+        
+        timings.sort()
+        results[mode] = {
+            'median_ms': round(timings[len(timings) // 2], 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3)
+        }
+        print(f"[BENCH] {mode}: median={results[mode]['median_ms']}ms p95={results[mode]['p95_ms']}ms "
+              "per update")
+    
+    saved = results['plain']['median_ms'] - results['prepared']['median_ms']
+    print(f"[BENCH] parse/plan saved per update: {round(saved, 3)}ms "
+          f"({round(saved / results['plain']['median_ms'] * 100, 1) if results['plain']['median_ms'] else 0}%)")
+    return 0
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    
+    parser = argparse.ArgumentParser(description='telegram-webhook maintenance commands')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    cache_parser = subparsers.add_parser('check-user-cache')
+    cache_parser.add_argument('--user-id', type=int, required=True)
+    cache_parser.add_argument('--timeout', type=float, default=2.0)
+    
+    bench_parser = subparsers.add_parser('bench-statements')
+    bench_parser.add_argument('--user-id', type=int, required=True)
+    bench_parser.add_argument('--runs', type=int, default=500)
+    bench_parser.add_argument('--warmup', type=int, default=20)
+    
+    cli_args = parser.parse_args()
+    if cli_args.command == 'check-user-cache':
+        sys.exit(check_user_cache_cli(cli_args))
+    elif cli_args.command == 'bench-statements':
+        sys.exit(bench_statements_cli(cli_args))
@@ -13,20 +13,22 @@ from psycopg2.extras import RealDictCursor
 import urllib.request
 
 BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+KIE_API_URL = os.environ.get('KIE_API_URL', 'https://api.kie.ai').rstrip('/')
 DATABASE_URL = os.environ.get('DATABASE_URL')
 GEN_API_KEY = os.environ.get('GEN_API_KEY', '57dabe651c81b31ea5ee1bb021817051')
-GEN_SORA_API_URL = os.environ.get('GEN_SORA_API_URL', 'https://api.kie.ai/api/v1/jobs/createTask')
-GEN_IMAGE_API_URL = os.environ.get('GEN_IMAGE_API_URL', 'https://api.kie.ai/api/v1/gpt4o-image/generate')
+GEN_SORA_API_URL = os.environ.get('GEN_SORA_API_URL', f'{KIE_API_URL}/api/v1/jobs/createTask')
+GEN_IMAGE_API_URL = os.environ.get('GEN_IMAGE_API_URL', f'{KIE_API_URL}/api/v1/gpt4o-image/generate')
 
 MAX_RETRIES = 40
 TIMEOUT_HOURS = 2
-JOB_STATUS_URL = 'https://api.kie.ai/api/v1/jobs/getJobStatus'
+JOB_STATUS_URL = f'{KIE_API_URL}/api/v1/jobs/getJobStatus'
 
 def get_db_connection():
     return psycopg2.connect(DATABASE_URL)
 
 def send_telegram_photo(chat_id: int, photo_url: str, caption: str):
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto'
+    url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendPhoto'
     data = {'chat_id': chat_id, 'photo': photo_url, 'caption': caption, 'parse_mode': 'HTML'}
     
     req = urllib.request.Request(url, data=json.dumps(data).encode('utf-8'), headers={'Content-Type': 'application/json'})
@@ -34,7 +36,7 @@ def send_telegram_photo(chat_id: int, photo_url: str, caption: str):
         return json.loads(response.read().decode('utf-8'))
 
 def send_telegram_video(chat_id: int, video_url: str, caption: str):
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendVideo'
+    url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendVideo'
     data = {'chat_id': chat_id, 'video': video_url, 'caption': caption, 'parse_mode': 'HTML'}
     
     req = urllib.request.Request(url, data=json.dumps(data).encode('utf-8'), headers={'Content-Type': 'application/json'})
@@ -42,7 +44,7 @@ def send_telegram_video(chat_id: int, video_url: str, caption: str):
         return json.loads(response.read().decode('utf-8'))
 
 def send_telegram_message(chat_id: int, text: str):
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendMessage'
+    url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendMessage'
     data = {'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML'}
     
     req = urllib.request.Request(url, data=json.dumps(data).encode('utf-8'), headers={'Content-Type': 'application/json'})
@@ -1,59 +1,226 @@
 '''
-Business: Обработка webhook-уведомлений от ЮКасса о статусе платежей, начисление кредитов на баланс пользователей
-Args: event с httpMethod (POST), body с данными от ЮКассы, context с request_id
+Business: Обработка webhook-уведомлений от ЮКасса о статусе платежей, начисление кредитов на баланс пользователей, сверка пропущенных платежей по расписанию
+Args: event с httpMethod (POST - webhook, GET - сверка по cron с заголовком X-Cron-Secret), body с данными от ЮКассы, context с request_id
 Returns: HTTP response 200 OK
 '''
 
+import base64
+import hmac
 import json
 import os
-from typing import Dict, Any
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
 import psycopg2
 from psycopg2.extras import RealDictCursor
+import urllib.parse
 import urllib.request
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+YOOKASSA_SHOP_ID = os.environ.get('YOOKASSA_SHOP_ID', '')
+YOOKASSA_SECRET_KEY = os.environ.get('YOOKASSA_SECRET_KEY', '')
+# Для тестов можно указать локальную заглушку API
+YOOKASSA_API_URL = os.environ.get('YOOKASSA_API_URL', 'https://api.yookassa.ru/v3').rstrip('/')
+# Сверку по GET запускает только cron: без секрета любой мог бы гонять постраничный обход API ЮКассы
+CRON_SECRET = os.environ.get('CRON_SECRET', '')
+
+RECONCILE_WATERMARK_METRIC = 'yookassa_reconcile_watermark'
+RECONCILE_PAGE_LIMIT = 100  # максимум, который отдаёт ЮКасса за страницу
+RECONCILE_MAX_PAGES = int(os.environ.get('RECONCILE_MAX_PAGES', '500'))
+RECONCILE_WINDOW_HOURS = float(os.environ.get('RECONCILE_WINDOW_HOURS', '24'))
+# Платёж могут оплатить позже создания, поэтому каждый запуск заново смотрит этот хвост до водяной отметки
+RECONCILE_LOOKBACK_HOURS = float(os.environ.get('RECONCILE_LOOKBACK_HOURS', '1'))
+# Свежие платежи оставляем webhook'у
+RECONCILE_SETTLE_MINUTES = float(os.environ.get('RECONCILE_SETTLE_MINUTES', '5'))
+RECONCILE_INITIAL_DAYS = int(os.environ.get('RECONCILE_INITIAL_DAYS', '7'))
+RECONCILE_RUN_SECONDS = float(os.environ.get('RECONCILE_RUN_SECONDS', '240'))
 
 def get_db_connection():
     return psycopg2.connect(DATABASE_URL)
 
 def send_telegram_message(chat_id: int, text: str):
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendMessage'
+    url = f'{TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendMessage'
     data = {'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML'}
     
     req = urllib.request.Request(url, data=json.dumps(data).encode('utf-8'), headers={'Content-Type': 'application/json'})
     with urllib.request.urlopen(req) as response:
         return json.loads(response.read().decode('utf-8'))
 
-def handle_payment_succeeded(conn, payment: Dict):
-    payment_id = payment['id']
-    metadata = payment.get('metadata', {})
-    user_id = int(metadata.get('user_id', 0))
-    credits = int(metadata.get('credits', 0))
+def payment_credit_row(payment: Dict) -> Optional[Tuple[str, int, int]]:
+    metadata = payment.get('metadata') or {}
+    try:
+        user_id = int(metadata.get('user_id', 0))
+        credits = int(metadata.get('credits', 0))
+    except (TypeError, ValueError):
+        return None
     
-    if not user_id or not credits:
-        return
+    if not payment.get('id') or not user_id or not credits:
+        return None
+    return (payment['id'], user_id, credits)
+
+def credit_payments(conn, rows: List[Tuple[str, int, int]]) -> List[Dict[str, Any]]:
+    """
+    Начислить пачку платежей одним запросом: анти-join с уже проведёнными платежами,
+    затем захват в payment_credits (ON CONFLICT DO NOTHING), баланс и проводки.
+    Возвращает только реально начисленные платежи, повторный вызов ничего не начислит.
+    """
+    if not rows:
+        return []
     
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
         cur.execute("""
-            SELECT transaction_id FROM t_p62125649_ai_video_bot.transactions 
-            WHERE external_payment_id = %s
-        """, (payment_id,))
+            WITH incoming AS (
+                SELECT * FROM unnest(%s::text[], %s::bigint[], %s::integer[]) AS i(payment_id, user_id, credits)
+            ),
+            missing AS (
+                SELECT DISTINCT ON (i.payment_id) i.payment_id, i.user_id, i.credits
+                FROM incoming i
+                JOIN t_p62125649_ai_video_bot.users u ON u.user_id = i.user_id
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM t_p62125649_ai_video_bot.transactions t
+                    WHERE t.external_payment_id = i.payment_id
+                )
+            ),
+            claim AS (
+                INSERT INTO t_p62125649_ai_video_bot.payment_credits 
+                (external_payment_id, user_id, payment_method, credits, currency)
+                SELECT payment_id, user_id, 'yookassa', credits, 'RUB' FROM missing
+                ON CONFLICT (external_payment_id) DO NOTHING
+                RETURNING external_payment_id, user_id, credits
+            ),
+            credited AS (
+                UPDATE t_p62125649_ai_video_bot.users u
+                SET balance = u.balance + c.total
+                FROM (SELECT user_id, SUM(credits) AS total FROM claim GROUP BY user_id) c
+                WHERE u.user_id = c.user_id
+            ),
+            ledger AS (
+                INSERT INTO t_p62125649_ai_video_bot.transactions 
+                (user_id, amount, type, description, external_payment_id, payment_method)
+                SELECT user_id, credits, 'purchase', 'Пополнение на ' || credits || ' кредитов',
+                       external_payment_id, 'yookassa'
+                FROM claim
+            )
+            SELECT external_payment_id AS payment_id, user_id, credits FROM claim
+        """, ([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]))
+        credited = cur.fetchall()
+        conn.commit()
+    
+    return credited
+
+def notify_credited(credited: List[Dict[str, Any]]):
+    for payment in credited:
+        try:
+            send_telegram_message(payment['user_id'],
+                                  f"✅ Оплата прошла!\n💰 Баланс пополнен на {payment['credits']} кредитов")
+        except Exception as e:
+            print(f"[ERROR] Failed to notify user {payment['user_id']}: {str(e)}")
+
+def handle_payment_succeeded(conn, payment: Dict):
+    row = payment_credit_row(payment)
+    if not row:
+        return
+    
+    notify_credited(credit_payments(conn, [row]))
+
+def yookassa_request(path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    url = f'{YOOKASSA_API_URL}{path}?{urllib.parse.urlencode(params)}'
+    credentials = base64.b64encode(f'{YOOKASSA_SHOP_ID}:{YOOKASSA_SECRET_KEY}'.encode('utf-8')).decode('ascii')
+    req = urllib.request.Request(url, headers={'Authorization': f'Basic {credentials}'})
+    with urllib.request.urlopen(req, timeout=30) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+def iter_succeeded_payments(window_start: datetime, window_end: datetime):
+    """Страницы успешных платежей ЮКассы за окно [window_start, window_end)."""
+    params = {
+        'status': 'succeeded',
+        'created_at.gte': window_start.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        'created_at.lt': window_end.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        'limit': RECONCILE_PAGE_LIMIT
+    }
+    while True:
+        page = yookassa_request('/payments', params)
+        yield page.get('items', [])
         
-        if cur.fetchone():
+        next_cursor = page.get('next_cursor')
+        if not next_cursor:
             return
+        params['cursor'] = next_cursor
+
+def get_watermark(conn) -> datetime:
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT metric_value FROM t_p62125649_ai_video_bot.stats_cache WHERE metric_name = %s
+        """, (RECONCILE_WATERMARK_METRIC,))
+        row = cur.fetchone()
+    
+    if row and row[0]:
+        return datetime.fromtimestamp(float(row[0]), tz=timezone.utc)
+    return datetime.fromtimestamp(time.time() - RECONCILE_INITIAL_DAYS * 86400, tz=timezone.utc)
+
+def set_watermark(conn, watermark: datetime):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO t_p62125649_ai_video_bot.stats_cache (metric_name, metric_value, updated_at)
+            VALUES (%s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (metric_name) DO UPDATE 
+            SET metric_value = EXCLUDED.metric_value, updated_at = CURRENT_TIMESTAMP
+        """, (RECONCILE_WATERMARK_METRIC, watermark.timestamp()))
+        conn.commit()
+
+def reconcile_payments(conn) -> Dict[str, Any]:
+    """
+    Сверка окнами по времени создания платежа, начиная от водяной отметки.
+    Окно засчитывается только целиком: отметка сдвигается после последней страницы окна,
+    а недосмотренное окно следующий запуск пройдёт заново (начисление идемпотентно).
+    """
+    deadline = time.monotonic() + RECONCILE_RUN_SECONDS
+    horizon = datetime.fromtimestamp(time.time() - RECONCILE_SETTLE_MINUTES * 60, tz=timezone.utc)
+    watermark = get_watermark(conn)
+    window_start = datetime.fromtimestamp(watermark.timestamp() - RECONCILE_LOOKBACK_HOURS * 3600, tz=timezone.utc)
+    
+    pages = 0
+    seen = 0
+    credited_total = 0
+    complete = True
+    
+    while window_start < horizon:
+        window_end = min(horizon, datetime.fromtimestamp(window_start.timestamp() + RECONCILE_WINDOW_HOURS * 3600,
+                                                         tz=timezone.utc))
+        window_done = True
         
-        cur.execute("UPDATE t_p62125649_ai_video_bot.users SET balance = balance + %s WHERE user_id = %s", (credits, user_id))
+        for items in iter_succeeded_payments(window_start, window_end):
+            pages += 1
+            seen += len(items)
+            rows = [row for row in (payment_credit_row(p) for p in items if p.get('status') == 'succeeded') if row]
+            credited = credit_payments(conn, rows)
+            if credited:
+                print(f"[INFO] Reconciliation credited {len(credited)} missed payments")
+                credited_total += len(credited)
+                notify_credited(credited)
+            
+            if pages >= RECONCILE_MAX_PAGES or time.monotonic() > deadline:
+                window_done = False
+                break
         
-        cur.execute("""
-            INSERT INTO t_p62125649_ai_video_bot.transactions 
-            (user_id, amount, type, description, external_payment_id)
-            VALUES (%s, %s, 'purchase', %s, %s)
-        """, (user_id, credits, f'Пополнение на {credits} кредитов', payment_id))
+        if not window_done:
+            complete = False
+            break
         
-        conn.commit()
+        if window_end > watermark:
+            watermark = window_end
+            set_watermark(conn, watermark)
+        window_start = window_end
     
-    send_telegram_message(user_id, f"✅ Оплата прошла!\n💰 Баланс пополнен на {credits} кредитов")
+    return {
+        'pages': pages,
+        'payments_seen': seen,
+        'payments_credited': credited_total,
+        'watermark': watermark.isoformat(),
+        'complete': complete
+    }
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method = event.get('httpMethod', 'POST')
@@ -63,14 +230,44 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Cron-Secret',
                 'Access-Control-Max-Age': '86400'
             },
             'isBase64Encoded': False,
             'body': ''
         }
     
+    if method == 'GET':
+        headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+        if not CRON_SECRET or not hmac.compare_digest(headers.get('x-cron-secret') or '', CRON_SECRET):
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Unauthorized'})
+            }
+        
+        try:
+            conn = get_db_connection()
+            result = reconcile_payments(conn)
+            conn.close()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json'},
+                'isBase64Encoded': False,
+                'body': json.dumps(result)
+            }
+        except Exception as e:
+            print(f"[ERROR] Reconciliation failed: {str(e)}")
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': str(e)})
+            }
+    
     try:
         body = json.loads(event.get('body', '{}'))
         event_type = body.get('event')
@@ -89,9 +286,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
         
     except Exception as e:
+        # Ошибка отдаётся ЮКассе, чтобы она повторила уведомление; пропущенное добьёт сверка
+        print(f"[ERROR] Webhook processing failed: {str(e)}")
         return {
-            'statusCode': 200,
+            'statusCode': 500,
             'headers': {'Content-Type': 'application/json'},
             'isBase64Encoded': False,
-            'body': json.dumps({'ok': True, 'error': str(e)})
+            'body': json.dumps({'ok': False, 'error': str(e)})
         }
@@ -0,0 +1,24 @@
+-- Составные индексы под keyset-пагинацию списков в админке: ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_users_created_at_user_id
+ON t_p62125649_ai_video_bot.users(created_at DESC, user_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_orders_created_at_order_id
+ON t_p62125649_ai_video_bot.orders(created_at DESC, order_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_orders_status_created_at_order_id
+ON t_p62125649_ai_video_bot.orders(status, created_at DESC, order_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_orders_type_created_at_order_id
+ON t_p62125649_ai_video_bot.orders(order_type, created_at DESC, order_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_orders_user_created_at_order_id
+ON t_p62125649_ai_video_bot.orders(user_id, created_at DESC, order_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at_transaction_id
+ON t_p62125649_ai_video_bot.transactions(created_at DESC, transaction_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created_at_transaction_id
+ON t_p62125649_ai_video_bot.transactions(user_id, created_at DESC, transaction_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_type_created_at_transaction_id
+ON t_p62125649_ai_video_bot.transactions(type, created_at DESC, transaction_id DESC);
@@ -0,0 +1,16 @@
+-- Поиск пользователей в админке по username / first_name
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Подстрочный поиск (LIKE '%...%') от 3 символов
+CREATE INDEX IF NOT EXISTS idx_users_username_trgm
+ON t_p62125649_ai_video_bot.users USING GIN (lower(username) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_users_first_name_trgm
+ON t_p62125649_ai_video_bot.users USING GIN (lower(first_name) gin_trgm_ops);
+
+-- Префиксный поиск (LIKE '...%') для коротких запросов
+CREATE INDEX IF NOT EXISTS idx_users_username_prefix
+ON t_p62125649_ai_video_bot.users (lower(username) text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_users_first_name_prefix
+ON t_p62125649_ai_video_bot.users (lower(first_name) text_pattern_ops);
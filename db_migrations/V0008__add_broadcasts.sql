@@ -0,0 +1,29 @@
+-- Рассылки по пользователям бота
+CREATE TABLE IF NOT EXISTS t_p62125649_ai_video_bot.broadcasts (
+    broadcast_id SERIAL PRIMARY KEY,
+    text TEXT NOT NULL,
+    segment JSONB, -- фильтр аудитории: active_days, min_balance, has_orders
+    status TEXT NOT NULL DEFAULT 'pending', -- 'pending', 'running', 'completed', 'cancelled'
+    last_user_id BIGINT NOT NULL DEFAULT 0, -- чекпоинт: все user_id <= last_user_id уже обработаны
+    delivered_count INTEGER NOT NULL DEFAULT 0,
+    blocked_count INTEGER NOT NULL DEFAULT 0,
+    failed_count INTEGER NOT NULL DEFAULT 0,
+    lease_until TIMESTAMP, -- пока не истекла, рассылку обрабатывает другой запуск
+    created_by VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON t_p62125649_ai_video_bot.broadcasts(status);
+
+-- Пользователь заблокировал бота (Telegram ответил 403), рассылки его пропускают
+ALTER TABLE t_p62125649_ai_video_bot.users
+ADD COLUMN IF NOT EXISTS bot_blocked_at TIMESTAMP;
+
+COMMENT ON COLUMN t_p62125649_ai_video_bot.users.bot_blocked_at
+IS 'Когда Telegram вернул 403 при отправке; сбрасывается, когда пользователь снова пишет боту';
+
+CREATE INDEX IF NOT EXISTS idx_users_broadcast_audience
+ON t_p62125649_ai_video_bot.users(user_id)
+WHERE is_blocked = FALSE AND bot_blocked_at IS NULL;
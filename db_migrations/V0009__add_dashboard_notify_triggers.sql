@@ -0,0 +1,70 @@
+-- Живые обновления админки: изменения заказов, проводок и новых пользователей
+-- публикуются в канал dashboard_events и уходят подписчикам после COMMIT
+CREATE OR REPLACE FUNCTION t_p62125649_ai_video_bot.notify_order_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('dashboard_events', json_build_object(
+        'type', 'order',
+        'order_id', NEW.order_id,
+        'user_id', NEW.user_id,
+        'username', (SELECT username FROM t_p62125649_ai_video_bot.users WHERE user_id = NEW.user_id),
+        'order_type', NEW.order_type,
+        'status', NEW.status,
+        'old_status', CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END,
+        'cost', NEW.cost,
+        'created_at', NEW.created_at,
+        'completed_at', NEW.completed_at
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p62125649_ai_video_bot.notify_transaction_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('dashboard_events', json_build_object(
+        'type', 'transaction',
+        'transaction_id', NEW.transaction_id,
+        'user_id', NEW.user_id,
+        'transaction_type', NEW.type,
+        'amount', NEW.amount,
+        'created_at', NEW.created_at
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p62125649_ai_video_bot.notify_user_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('dashboard_events', json_build_object(
+        'type', 'user',
+        'user_id', NEW.user_id,
+        'username', NEW.username,
+        'first_name', NEW.first_name,
+        'balance', NEW.balance,
+        'created_at', NEW.created_at,
+        'last_activity', NEW.last_activity,
+        'is_blocked', NEW.is_blocked
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_orders_notify_insert ON t_p62125649_ai_video_bot.orders;
+CREATE TRIGGER trg_orders_notify_insert
+AFTER INSERT ON t_p62125649_ai_video_bot.orders
+FOR EACH ROW EXECUTE FUNCTION t_p62125649_ai_video_bot.notify_order_event();
+
+DROP TRIGGER IF EXISTS trg_orders_notify_status ON t_p62125649_ai_video_bot.orders;
+CREATE TRIGGER trg_orders_notify_status
+AFTER UPDATE OF status ON t_p62125649_ai_video_bot.orders
+FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+EXECUTE FUNCTION t_p62125649_ai_video_bot.notify_order_event();
+
+DROP TRIGGER IF EXISTS trg_transactions_notify_insert ON t_p62125649_ai_video_bot.transactions;
+CREATE TRIGGER trg_transactions_notify_insert
+AFTER INSERT ON t_p62125649_ai_video_bot.transactions
+FOR EACH ROW EXECUTE FUNCTION t_p62125649_ai_video_bot.notify_transaction_event();
+
+DROP TRIGGER IF EXISTS trg_users_notify_insert ON t_p62125649_ai_video_bot.users;
+CREATE TRIGGER trg_users_notify_insert
+AFTER INSERT ON t_p62125649_ai_video_bot.users
+FOR EACH ROW EXECUTE FUNCTION t_p62125649_ai_video_bot.notify_user_event();
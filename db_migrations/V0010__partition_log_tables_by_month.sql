@@ -0,0 +1,120 @@
+-- Помесячное секционирование error_logs, payment_logs и transactions по created_at.
+-- Старые секции логов удаляются/отсоединяются целиком (db-maintenance) вместо массовых DELETE.
+
+-- Создать месячные секции от from_month до текущего месяца + months_ahead.
+-- Если в DEFAULT-секцию уже попали строки нужного месяца, они переносятся в новую секцию.
+CREATE OR REPLACE FUNCTION t_p62125649_ai_video_bot.ensure_monthly_partitions(parent TEXT, from_month DATE, months_ahead INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    month_end DATE;
+    partition_name TEXT;
+    default_name TEXT := parent || '_default';
+    has_default_rows BOOLEAN;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        partition_name := parent || '_' || to_char(month_start, 'YYYY_MM');
+        
+        IF to_regclass('t_p62125649_ai_video_bot.' || partition_name) IS NULL THEN
+            EXECUTE format(
+                'SELECT EXISTS (SELECT 1 FROM t_p62125649_ai_video_bot.%I WHERE created_at >= %L AND created_at < %L)',
+                default_name, month_start, month_end
+            ) INTO has_default_rows;
+            
+            IF has_default_rows THEN
+                EXECUTE format('ALTER TABLE t_p62125649_ai_video_bot.%I DETACH PARTITION t_p62125649_ai_video_bot.%I',
+                               parent, default_name);
+                EXECUTE format('CREATE TABLE t_p62125649_ai_video_bot.%I PARTITION OF t_p62125649_ai_video_bot.%I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent, month_start, month_end);
+                EXECUTE format('WITH moved AS (DELETE FROM t_p62125649_ai_video_bot.%I WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                               'INSERT INTO t_p62125649_ai_video_bot.%I SELECT * FROM moved',
+                               default_name, month_start, month_end, partition_name);
+                EXECUTE format('ALTER TABLE t_p62125649_ai_video_bot.%I ATTACH PARTITION t_p62125649_ai_video_bot.%I DEFAULT',
+                               parent, default_name);
+            ELSE
+                EXECUTE format('CREATE TABLE t_p62125649_ai_video_bot.%I PARTITION OF t_p62125649_ai_video_bot.%I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent, month_start, month_end);
+            END IF;
+            
+            created := created + 1;
+        END IF;
+        
+        month_start := month_end;
+    END LOOP;
+    
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Одноразовый перенос существующей таблицы в секционированную с тем же именем и той же последовательностью id
+CREATE OR REPLACE FUNCTION t_p62125649_ai_video_bot.convert_to_monthly_partitions(table_name TEXT, id_column TEXT)
+RETURNS VOID AS $$
+DECLARE
+    old_name TEXT := table_name || '_unpartitioned';
+    first_month DATE;
+BEGIN
+    EXECUTE format('ALTER TABLE t_p62125649_ai_video_bot.%I RENAME TO %I', table_name, old_name);
+    EXECUTE format('ALTER INDEX t_p62125649_ai_video_bot.%I RENAME TO %I', table_name || '_pkey', old_name || '_pkey');
+    EXECUTE format('UPDATE t_p62125649_ai_video_bot.%I SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL', old_name);
+    
+    EXECUTE format(
+        'CREATE TABLE t_p62125649_ai_video_bot.%I (LIKE t_p62125649_ai_video_bot.%I INCLUDING DEFAULTS INCLUDING COMMENTS, '
+        'PRIMARY KEY (%I, created_at)) PARTITION BY RANGE (created_at)',
+        table_name, old_name, id_column
+    );
+    EXECUTE format('CREATE TABLE t_p62125649_ai_video_bot.%I PARTITION OF t_p62125649_ai_video_bot.%I DEFAULT',
+                   table_name || '_default', table_name);
+    
+    EXECUTE format('SELECT date_trunc(''month'', MIN(created_at))::date FROM t_p62125649_ai_video_bot.%I', old_name)
+    INTO first_month;
+    PERFORM t_p62125649_ai_video_bot.ensure_monthly_partitions(table_name, COALESCE(first_month, CURRENT_DATE), 3);
+    
+    EXECUTE format('INSERT INTO t_p62125649_ai_video_bot.%I SELECT * FROM t_p62125649_ai_video_bot.%I', table_name, old_name);
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY t_p62125649_ai_video_bot.%I.%I',
+                   pg_get_serial_sequence('t_p62125649_ai_video_bot.' || old_name, id_column), table_name, id_column);
+    EXECUTE format('DROP TABLE t_p62125649_ai_video_bot.%I', old_name);
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT t_p62125649_ai_video_bot.convert_to_monthly_partitions('error_logs', 'log_id');
+SELECT t_p62125649_ai_video_bot.convert_to_monthly_partitions('payment_logs', 'log_id');
+SELECT t_p62125649_ai_video_bot.convert_to_monthly_partitions('transactions', 'transaction_id');
+
+DROP FUNCTION t_p62125649_ai_video_bot.convert_to_monthly_partitions(TEXT, TEXT);
+
+-- Внешние ключи и индексы (индекс по created_at не нужен: его заменяет отсечение секций)
+ALTER TABLE t_p62125649_ai_video_bot.error_logs
+ADD FOREIGN KEY (order_id) REFERENCES t_p62125649_ai_video_bot.orders(order_id);
+
+CREATE INDEX IF NOT EXISTS idx_error_logs_user_id ON t_p62125649_ai_video_bot.error_logs(user_id);
+CREATE INDEX IF NOT EXISTS idx_error_logs_workflow_name ON t_p62125649_ai_video_bot.error_logs(workflow_name);
+
+ALTER TABLE t_p62125649_ai_video_bot.payment_logs
+ADD FOREIGN KEY (user_id) REFERENCES t_p62125649_ai_video_bot.users(user_id);
+
+CREATE INDEX IF NOT EXISTS idx_payment_logs_user_id ON t_p62125649_ai_video_bot.payment_logs(user_id);
+CREATE INDEX IF NOT EXISTS idx_payment_logs_status ON t_p62125649_ai_video_bot.payment_logs(payment_status);
+
+ALTER TABLE t_p62125649_ai_video_bot.transactions
+ADD FOREIGN KEY (user_id) REFERENCES t_p62125649_ai_video_bot.users(user_id);
+
+ALTER TABLE t_p62125649_ai_video_bot.transactions
+ADD FOREIGN KEY (order_id) REFERENCES t_p62125649_ai_video_bot.orders(order_id);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user_id ON t_p62125649_ai_video_bot.transactions(user_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_type ON t_p62125649_ai_video_bot.transactions(type);
+CREATE INDEX IF NOT EXISTS idx_transactions_external_payment_id ON t_p62125649_ai_video_bot.transactions(external_payment_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at_transaction_id
+ON t_p62125649_ai_video_bot.transactions(created_at DESC, transaction_id DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created_at_transaction_id
+ON t_p62125649_ai_video_bot.transactions(user_id, created_at DESC, transaction_id DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_type_created_at_transaction_id
+ON t_p62125649_ai_video_bot.transactions(type, created_at DESC, transaction_id DESC);
+
+-- Триггер живых обновлений из V0009 удалился вместе со старой таблицей
+CREATE TRIGGER trg_transactions_notify_insert
+AFTER INSERT ON t_p62125649_ai_video_bot.transactions
+FOR EACH ROW EXECUTE FUNCTION t_p62125649_ai_video_bot.notify_transaction_event();
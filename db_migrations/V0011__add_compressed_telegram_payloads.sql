@@ -0,0 +1,26 @@
+-- Компактное хранение Telegram update в логах:
+-- telegram_update содержит только нужные для запросов поля, полный update лежит сжатым (zlib) в telegram_update_zlib
+ALTER TABLE t_p62125649_ai_video_bot.payment_logs
+ADD COLUMN IF NOT EXISTS telegram_update_zlib BYTEA;
+
+ALTER TABLE t_p62125649_ai_video_bot.error_logs
+ADD COLUMN IF NOT EXISTS telegram_update_zlib BYTEA;
+
+-- Данные уже сжаты, повторно сжимать их в TOAST незачем
+ALTER TABLE t_p62125649_ai_video_bot.payment_logs ALTER COLUMN telegram_update_zlib SET STORAGE EXTERNAL;
+ALTER TABLE t_p62125649_ai_video_bot.error_logs ALTER COLUMN telegram_update_zlib SET STORAGE EXTERNAL;
+
+COMMENT ON COLUMN t_p62125649_ai_video_bot.payment_logs.telegram_update_zlib
+IS 'Полный Telegram update, JSON сжатый zlib; telegram_update хранит только выбранные поля';
+
+COMMENT ON COLUMN t_p62125649_ai_video_bot.error_logs.telegram_update_zlib
+IS 'Полный Telegram update, JSON сжатый zlib; telegram_update хранит только выбранные поля';
+
+-- Очередь для дозаполнения старых строк (GET по расписанию в telegram-payments, compact_logs), после него индекс остаётся почти пустым
+CREATE INDEX IF NOT EXISTS idx_payment_logs_uncompacted
+ON t_p62125649_ai_video_bot.payment_logs(log_id)
+WHERE telegram_update_zlib IS NULL AND telegram_update IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_error_logs_uncompacted
+ON t_p62125649_ai_video_bot.error_logs(log_id)
+WHERE telegram_update_zlib IS NULL AND telegram_update IS NOT NULL;
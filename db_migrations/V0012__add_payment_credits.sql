@@ -0,0 +1,22 @@
+-- Учёт зачисленных платежей: один внешний платёж начисляется ровно один раз.
+-- На секционированной transactions уникальный индекс обязан включать created_at,
+-- поэтому уникальность external_payment_id держит отдельная таблица.
+CREATE TABLE IF NOT EXISTS t_p62125649_ai_video_bot.payment_credits (
+    external_payment_id TEXT PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES t_p62125649_ai_video_bot.users(user_id),
+    payment_method TEXT NOT NULL,
+    credits INTEGER NOT NULL,
+    currency TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_payment_credits_user_id ON t_p62125649_ai_video_bot.payment_credits(user_id);
+
+-- Уже проведённые покупки считаются зачисленными
+INSERT INTO t_p62125649_ai_video_bot.payment_credits (external_payment_id, user_id, payment_method, credits, created_at)
+SELECT DISTINCT ON (external_payment_id)
+    external_payment_id, user_id, COALESCE(payment_method, 'yookassa'), amount, created_at
+FROM t_p62125649_ai_video_bot.transactions
+WHERE type = 'purchase' AND external_payment_id IS NOT NULL
+ORDER BY external_payment_id, created_at
+ON CONFLICT (external_payment_id) DO NOTHING;
@@ -0,0 +1,26 @@
+-- Сверка балансов с журналом transactions.
+-- ledger_audit_sums накапливает суммы проводок по пользователю инкрементально (контрольная точка в stats_cache),
+-- ledger_drift хранит пользователей, чей баланс расходится с журналом.
+CREATE TABLE IF NOT EXISTS t_p62125649_ai_video_bot.ledger_audit_sums (
+    user_id BIGINT PRIMARY KEY REFERENCES t_p62125649_ai_video_bot.users(user_id),
+    ledger_sum BIGINT NOT NULL DEFAULT 0,
+    transactions_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS t_p62125649_ai_video_bot.ledger_drift (
+    user_id BIGINT PRIMARY KEY REFERENCES t_p62125649_ai_video_bot.users(user_id),
+    balance INTEGER NOT NULL,
+    expected_balance BIGINT NOT NULL,
+    drift BIGINT NOT NULL,
+    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ledger_drift_abs_drift ON t_p62125649_ai_video_bot.ledger_drift((abs(drift)) DESC);
+
+INSERT INTO t_p62125649_ai_video_bot.stats_cache (metric_name, metric_value)
+VALUES 
+    ('ledger_audit_checkpoint', 0),
+    ('ledger_audit_user_cursor', 0)
+ON CONFLICT (metric_name) DO NOTHING;
@@ -0,0 +1,26 @@
+-- Сброс кэша профилей в тёплых инстансах telegram-webhook:
+-- изменение баланса, блокировки или имени публикует user_id в канал user_profile.
+-- Обновление одного last_activity не публикуется.
+CREATE OR REPLACE FUNCTION t_p62125649_ai_video_bot.notify_user_profile() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('user_profile', COALESCE(NEW.user_id, OLD.user_id)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_profile_update ON t_p62125649_ai_video_bot.users;
+CREATE TRIGGER trg_users_profile_update
+AFTER UPDATE ON t_p62125649_ai_video_bot.users
+FOR EACH ROW WHEN (
+    OLD.balance IS DISTINCT FROM NEW.balance
+    OR OLD.is_blocked IS DISTINCT FROM NEW.is_blocked
+    OR OLD.bot_blocked_at IS DISTINCT FROM NEW.bot_blocked_at
+    OR OLD.username IS DISTINCT FROM NEW.username
+    OR OLD.first_name IS DISTINCT FROM NEW.first_name
+)
+EXECUTE FUNCTION t_p62125649_ai_video_bot.notify_user_profile();
+
+DROP TRIGGER IF EXISTS trg_users_profile_delete ON t_p62125649_ai_video_bot.users;
+CREATE TRIGGER trg_users_profile_delete
+AFTER DELETE ON t_p62125649_ai_video_bot.users
+FOR EACH ROW EXECUTE FUNCTION t_p62125649_ai_video_bot.notify_user_profile();
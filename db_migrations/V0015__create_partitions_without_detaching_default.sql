@@ -0,0 +1,50 @@
+-- Создание месячных секций без отсоединения DEFAULT-секции.
+-- Прежняя версия на время переноса строк делала DETACH/ATTACH DEFAULT, и вставки за месяцы без своей секции
+-- в это окно падали с "no partition of relation found". Теперь обычный путь DEFAULT не трогает;
+-- если в DEFAULT есть строки нужного месяца, она блокируется до конца транзакции (вставки ждут, а не падают),
+-- строки переносятся через временную таблицу, и секция создаётся уже над очищенной DEFAULT.
+CREATE OR REPLACE FUNCTION t_p62125649_ai_video_bot.ensure_monthly_partitions(parent TEXT, from_month DATE, months_ahead INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    month_end DATE;
+    partition_name TEXT;
+    default_name TEXT := parent || '_default';
+    has_default_rows BOOLEAN;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        partition_name := parent || '_' || to_char(month_start, 'YYYY_MM');
+
+        IF to_regclass('t_p62125649_ai_video_bot.' || partition_name) IS NULL THEN
+            EXECUTE format(
+                'SELECT EXISTS (SELECT 1 FROM t_p62125649_ai_video_bot.%I WHERE created_at >= %L AND created_at < %L)',
+                default_name, month_start, month_end
+            ) INTO has_default_rows;
+
+            IF has_default_rows THEN
+                EXECUTE format('LOCK TABLE t_p62125649_ai_video_bot.%I IN ACCESS EXCLUSIVE MODE', default_name);
+                EXECUTE format('CREATE TEMP TABLE partition_stray_rows (LIKE t_p62125649_ai_video_bot.%I)', parent);
+                EXECUTE format('WITH moved AS (DELETE FROM t_p62125649_ai_video_bot.%I WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                               'INSERT INTO partition_stray_rows SELECT * FROM moved',
+                               default_name, month_start, month_end);
+                EXECUTE format('CREATE TABLE t_p62125649_ai_video_bot.%I PARTITION OF t_p62125649_ai_video_bot.%I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent, month_start, month_end);
+                EXECUTE format('INSERT INTO t_p62125649_ai_video_bot.%I SELECT * FROM partition_stray_rows', partition_name);
+                DROP TABLE partition_stray_rows;
+            ELSE
+                EXECUTE format('CREATE TABLE t_p62125649_ai_video_bot.%I PARTITION OF t_p62125649_ai_video_bot.%I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent, month_start, month_end);
+            END IF;
+
+            created := created + 1;
+        END IF;
+
+        month_start := month_end;
+    END LOOP;
+
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,9 @@
+-- Индексы по created_at для секционированных логов.
+-- V0010 их удалила в расчёте на отсечение секций, но отсечение сужает поиск только до месяца:
+-- «последние N записей» и выборки по диапазону дат всё равно читали секцию целиком.
+-- Индекс на родительской таблице создаётся и во всех секциях, включая будущие.
+CREATE INDEX IF NOT EXISTS idx_error_logs_created_at
+ON t_p62125649_ai_video_bot.error_logs(created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_payment_logs_created_at
+ON t_p62125649_ai_video_bot.payment_logs(created_at DESC);
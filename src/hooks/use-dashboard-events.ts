@@ -0,0 +1,106 @@
+import { useEffect, useRef } from 'react';
+
+export interface OrderEvent {
+  type: 'order';
+  order_id: number;
+  user_id: number;
+  username: string | null;
+  order_type: string;
+  status: string;
+  old_status: string | null;
+  cost: number;
+  created_at: string;
+  completed_at: string | null;
+}
+
+export interface TransactionEvent {
+  type: 'transaction';
+  transaction_id: number;
+  user_id: number;
+  transaction_type: string;
+  amount: number;
+  created_at: string;
+}
+
+export interface UserEvent {
+  type: 'user';
+  user_id: number;
+  username: string;
+  first_name: string;
+  balance: number;
+  created_at: string;
+  last_activity: string;
+  is_blocked: boolean;
+}
+
+export type DashboardEvent = OrderEvent | TransactionEvent | UserEvent;
+
+const EVENT_TYPES: DashboardEvent['type'][] = ['order', 'transaction', 'user'];
+
+const TOKEN_RETRY_MS = 5000;
+
+// Поток открывается по короткоживущему токену; когда токен истекает, сервер отвечает 401,
+// EventSource закрывается, и хук берёт новый URL через createUrl.
+// Между ответами сервера события не хранятся, поэтому после каждого переподключения вызывается
+// onReconnect — по нему дашборд перечитывается целиком, и пропущенные события не копятся в счётчиках
+export function useDashboardEvents(
+  createUrl: (() => Promise<string>) | null,
+  onEvent: (event: DashboardEvent) => void,
+  onReconnect?: () => void
+) {
+  const onEventRef = useRef(onEvent);
+  onEventRef.current = onEvent;
+  const onReconnectRef = useRef(onReconnect);
+  onReconnectRef.current = onReconnect;
+  const createUrlRef = useRef(createUrl);
+  createUrlRef.current = createUrl;
+  const enabled = createUrl !== null;
+
+  useEffect(() => {
+    if (!enabled) return;
+
+    let source: EventSource | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+    let stopped = false;
+    let opened = false;
+
+    const handleMessage = (message: MessageEvent) => {
+      try {
+        onEventRef.current(JSON.parse(message.data));
+      } catch (err) {
+        console.error('Invalid dashboard event:', err);
+      }
+    };
+
+    const connect = async () => {
+      const factory = createUrlRef.current;
+      if (stopped || !factory) return;
+      try {
+        const url = await factory();
+        if (stopped) return;
+        source = new EventSource(url);
+        EVENT_TYPES.forEach(type => source?.addEventListener(type, handleMessage as EventListener));
+        source.onopen = () => {
+          if (opened) onReconnectRef.current?.();
+          opened = true;
+        };
+        source.onerror = () => {
+          if (source?.readyState === EventSource.CLOSED) {
+            source = null;
+            retryTimer = setTimeout(connect, TOKEN_RETRY_MS);
+          }
+        };
+      } catch (err) {
+        console.error('Failed to open dashboard events:', err);
+        retryTimer = setTimeout(connect, TOKEN_RETRY_MS);
+      }
+    };
+
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      source?.close();
+    };
+  }, [enabled]);
+}
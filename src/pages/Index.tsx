@@ -12,6 +12,7 @@ import RecentOrders from '@/components/dashboard/RecentOrders';
 import OrderStats from '@/components/dashboard/OrderStats';
 import DailyRevenue from '@/components/dashboard/DailyRevenue';
 import ModelStats from '@/components/dashboard/ModelStats';
+import { useDashboardEvents, DashboardEvent } from '@/hooks/use-dashboard-events';
 
 const API_BASE = 'https://functions.poehali.dev/3163a024-78e4-404e-a9ae-b215ace0c6b2';
 const ADMIN_KEY = import.meta.env.VITE_ADMIN_SECRET_KEY || '';
@@ -64,6 +65,70 @@ interface DashboardData {
   }>;
 }
 
+const RECENT_USERS_LIMIT = 10;
+const RECENT_ORDERS_LIMIT = 20;
+
+function applyDashboardEvent(current: DashboardData, event: DashboardEvent): DashboardData {
+  const stats = { ...current.stats };
+
+  if (event.type === 'order') {
+    const isNew = event.old_status === null;
+    if (isNew) stats.total_orders += 1;
+    if (event.status === 'processing') stats.processing_orders += 1;
+    if (event.old_status === 'processing') stats.processing_orders = Math.max(0, stats.processing_orders - 1);
+
+    const known = current.recent_orders.some(o => o.order_id === event.order_id);
+    const recent_orders = known
+      ? current.recent_orders.map(o => (o.order_id === event.order_id ? { ...o, status: event.status } : o))
+      : [
+          {
+            order_id: event.order_id,
+            user_id: event.user_id,
+            order_type: event.order_type,
+            status: event.status,
+            cost: event.cost,
+            created_at: event.created_at,
+            username: event.username || '',
+            first_name: ''
+          },
+          ...current.recent_orders
+        ].slice(0, RECENT_ORDERS_LIMIT);
+
+    return { ...current, stats, recent_orders };
+  }
+
+  if (event.type === 'transaction') {
+    if (event.transaction_type === 'purchase') {
+      stats.total_revenue += event.amount;
+      const date = event.created_at.slice(0, 10);
+      const known = current.daily_revenue.some(d => d.date === date);
+      const daily_revenue = known
+        ? current.daily_revenue.map(d =>
+            d.date === date ? { ...d, revenue: Number(d.revenue) + event.amount, transaction_count: d.transaction_count + 1 } : d
+          )
+        : [{ date, revenue: event.amount, transaction_count: 1 }, ...current.daily_revenue];
+      return { ...current, stats, daily_revenue };
+    }
+    if (event.transaction_type === 'preview' || event.transaction_type === 'video') {
+      stats.credits_spent -= event.amount;
+    }
+    return { ...current, stats };
+  }
+
+  stats.total_users += 1;
+  stats.active_users_24h += 1;
+  const user = {
+    user_id: event.user_id,
+    username: event.username,
+    first_name: event.first_name,
+    balance: event.balance,
+    created_at: event.created_at,
+    last_activity: event.last_activity,
+    is_blocked: event.is_blocked
+  };
+  return { ...current, stats, recent_users: [user, ...current.recent_users].slice(0, RECENT_USERS_LIMIT) };
+}
+
 export default function Index() {
   const [data, setData] = useState<DashboardData | null>(null);
   const [loading, setLoading] = useState(true);
@@ -105,6 +170,42 @@ export default function Index() {
     loadDashboard();
   }, []);
 
+  // Перечитать дашборд без индикатора загрузки, чтобы сбросить накопленные инкрементами счётчики
+  const resyncDashboard = () => {
+    fetch(`${API_BASE}?endpoint=dashboard`, {
+      headers: { 'X-Admin-Key': ADMIN_KEY }
+    })
+      .then(res => {
+        if (!res.ok) {
+          throw new Error(`HTTP ${res.status}`);
+        }
+        return res.json();
+      })
+      .then(fresh => {
+        if (fresh && fresh.stats) {
+          setData(fresh);
+        }
+      })
+      .catch(err => console.error('Failed to resync dashboard:', err));
+  };
+
+  const createEventsUrl = async () => {
+    const res = await fetch(`${API_BASE}?endpoint=events_token`, {
+      headers: { 'X-Admin-Key': ADMIN_KEY }
+    });
+    if (!res.ok) {
+      throw new Error(`HTTP ${res.status}`);
+    }
+    const { token } = await res.json();
+    return `${API_BASE}?endpoint=events&token=${encodeURIComponent(token)}`;
+  };
+
+  useDashboardEvents(
+    data ? createEventsUrl : null,
+    event => setData(current => (current ? applyDashboardEvent(current, event) : current)),
+    resyncDashboard
+  );
+
   const handleUpdateBalance = async () => {
     if (!selectedUser || !balanceAmount) return;
 